@@ -0,0 +1,35 @@
+"""
+SQLite backend tuned for several scan stations writing at once.
+
+Two more OPTIONS are understood besides the ones of sqlite3.connect:
+
+* ``pragmas`` -- a dict of PRAGMAs run on every new connection,
+  e.g. ``{'journal_mode': 'WAL', 'synchronous': 'NORMAL'}``;
+* ``transaction_mode`` -- ``'DEFERRED'`` (the default of SQLite),
+  ``'IMMEDIATE'`` or ``'EXCLUSIVE'``. With ``'IMMEDIATE'`` a transaction
+  takes the write lock at BEGIN, so concurrent writers wait for each other
+  within ``timeout`` seconds instead of failing with "database is locked"
+  when a reading transaction tries to start writing.
+"""
+
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = params.pop('pragmas', {})
+        self.transaction_mode = params.pop('transaction_mode', None)
+        return params
+    
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+    
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
+        else:
+            super()._start_transaction_under_autocommit()
@@ -0,0 +1,201 @@
+"""
+Per-request timing for finding the slow pages in production.
+
+``RequestStatsMiddleware`` measures every request: the wall time,
+the number of database queries, the time spent in the database, and
+the queries repeated within the request (the N+1 pattern: one query per
+row of a list). It uses ``connection.execute_wrapper``, so DEBUG is not
+needed and the cost is a couple of counters per query.
+
+Each request is written as one JSON line to the ``autoLib.requests``
+logger (a rotating file, see LOGGING in settings). The recent requests of
+each view are kept in memory, and ``stats`` returns their percentiles to
+the staff, along with the hits and misses of the catalogue cache.
+The numbers are per server process. A streamed response, e.g. an export,
+is measured until its content is sent, as its queries run while streaming.
+
+The middleware is off unless settings.AUTOLIB_INSTRUMENTATION is set.
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import JsonResponse
+
+from booksRecord import catalogue
+
+
+logger = logging.getLogger('autoLib.requests')
+
+# the view name → the recent (wall ms, queries, db ms) of its requests
+_samples = {}
+# the view name → [requests, requests with repeated queries]
+_totals = {}
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    '''
+    the query with its literals and IN lists folded,
+    so that the queries differing in the parameters only match
+    '''
+    
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+\b', '?', sql)
+    return re.sub(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)', '(...)', sql)
+
+
+class _QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.fingerprints = Counter()
+    
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+
+@contextmanager
+def _measuring(queries):
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(queries))
+        yield
+
+
+class RequestStatsMiddleware:
+    def __init__(self, get_response):
+        if not settings.AUTOLIB_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        queries = _QueryStats()
+        start = time.perf_counter()
+        with _measuring(queries):
+            response = self.get_response(request)
+        
+        if response.streaming:
+            # e.g. the exports run their queries while streaming,
+            # so the request is recorded when the content is sent
+            response.streaming_content = self._stream(
+                response.streaming_content, request, response, queries, start)
+        else:
+            self._finish(request, response, queries, start)
+        return response
+    
+    def _stream(self, content, request, response, queries, start):
+        try:
+            with _measuring(queries):
+                yield from content
+        finally:
+            self._finish(request, response, queries, start)
+    
+    def _finish(self, request, response, queries, start):
+        wall = time.perf_counter() - start
+        
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        duplicates = [
+            {'sql': sql[:200], 'count': count}
+            for sql, count in queries.fingerprints.most_common()
+            if count >= settings.AUTOLIB_INSTRUMENTATION_DUPLICATES
+        ]
+        record(view, wall * 1000, queries.count, queries.time * 1000,
+               bool(duplicates))
+        
+        logger.info(json.dumps({
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'streaming': response.streaming,
+            'ms': round(wall * 1000, 2),
+            'queries': queries.count,
+            'db_ms': round(queries.time * 1000, 2),
+            'duplicates': duplicates,
+        }, ensure_ascii=False))
+
+
+def record(view, wall_ms, queries, db_ms, has_duplicates=False):
+    with _lock:
+        samples = _samples.get(view)
+        if samples is None:
+            samples = _samples[view] = deque(
+                maxlen=settings.AUTOLIB_INSTRUMENTATION_SAMPLES)
+            _totals[view] = [0, 0]
+        samples.append((wall_ms, queries, db_ms))
+        _totals[view][0] += 1
+        _totals[view][1] += has_duplicates
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _totals.clear()
+
+
+def _percentiles(values):
+    values = sorted(values)
+    return {
+        f'p{p}': round(values[min(len(values) * p // 100, len(values) - 1)], 2)
+        for p in (50, 90, 99)
+    }
+
+
+def summary():
+    '''
+    the percentiles of the recent requests of every view,
+    the slowest views (by the median time) first
+    '''
+    
+    with _lock:
+        views = {view: list(samples) for view, samples in _samples.items()}
+        totals = {view: list(numbers) for view, numbers in _totals.items()}
+    
+    result = []
+    for view, samples in views.items():
+        walls, queries, db_times = zip(*samples)
+        result.append({
+            'view': view,
+            'requests': totals[view][0],
+            'with_duplicates': totals[view][1],
+            'ms': _percentiles(walls),
+            'queries': _percentiles(queries),
+            'db_ms': _percentiles(db_times),
+        })
+    result.sort(key=lambda row: row['ms']['p50'], reverse=True)
+    return result
+
+
+@staff_member_required
+def stats(request):
+    '''
+    Время ответа, число запросов к базе и время в базе по каждому
+    представлению: 50-й, 90-й и 99-й перцентили последних запросов
+    этого процесса сервера. Попадания и промахи кэша каталога
+    отдаются и без включённого замера запросов.
+    '''
+    
+    return JsonResponse({
+        'enabled': settings.AUTOLIB_INSTRUMENTATION,
+        'views': summary(),
+        'catalogue_cache': catalogue.metrics(),
+    })
@@ -45,6 +45,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, to measure the whole request; off by default,
+    # see AUTOLIB_INSTRUMENTATION below
+    'autoLib.instrumentation.RequestStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,12 +80,83 @@ WSGI_APPLICATION = 'autoLib.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
+# The backend is chosen by the AUTOLIB_DB environment variable:
+#
+# sqlite (the default) -- the file autoLib.sqlite3 in the WAL mode,
+#   so readers don't block the writer; writing transactions take
+#   the lock at BEGIN and wait up to AUTOLIB_DB_TIMEOUT seconds for it
+#   (see autoLib/backends/sqlite3/base.py).
+#
+# postgresql -- requires psycopg2; the connection is set by
+#   AUTOLIB_DB_NAME, AUTOLIB_DB_USER, AUTOLIB_DB_PASSWORD,
+#   AUTOLIB_DB_HOST and AUTOLIB_DB_PORT. Connections are kept open
+#   for AUTOLIB_DB_CONN_MAX_AGE seconds; Django 2.2 has no connection pool
+#   of its own, so to share a pool between the server processes point
+#   AUTOLIB_DB_HOST/PORT to PgBouncer in the transaction pooling mode.
+
+AUTOLIB_DB = os.environ.get('AUTOLIB_DB', 'sqlite')
+
+if AUTOLIB_DB == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('AUTOLIB_DB_NAME', 'autolib'),
+            'USER': os.environ.get('AUTOLIB_DB_USER', 'autolib'),
+            'PASSWORD': os.environ.get('AUTOLIB_DB_PASSWORD', ''),
+            'HOST': os.environ.get('AUTOLIB_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('AUTOLIB_DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('AUTOLIB_DB_CONN_MAX_AGE', 600)),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'autoLib.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'autoLib.sqlite3'),
+            'OPTIONS': {
+                'timeout': float(os.environ.get('AUTOLIB_DB_TIMEOUT', 20)),
+                'transaction_mode': 'IMMEDIATE',
+                'pragmas': {
+                    'journal_mode': 'WAL',
+                    # safe in the WAL mode, only the last transactions
+                    # may be lost on a power failure
+                    'synchronous': 'NORMAL',
+                },
+            },
+        }
+    }
 
-DATABASES = {
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# The local memory of each server process by default. Set AUTOLIB_CACHE_BACKEND
+# to another backend and AUTOLIB_CACHE_LOCATION to its location to share
+# the cache between the processes, e.g. to
+# django.core.cache.backends.filebased.FileBasedCache and a directory,
+# or to a Redis-compatible backend such as django_redis.cache.RedisCache
+# (it has to be installed) and redis://localhost:6379/1.
+# The catalogue cache (see booksRecord/catalogue.py) takes the same backend,
+# unless AUTOLIB_CATALOGUE_CACHE_BACKEND and AUTOLIB_CATALOGUE_CACHE_LOCATION
+# are set. Its keys hold the versions of the tables from the database,
+# so any backend is correct; a shared one just lets the server processes
+# reuse each other's entries.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'autoLib.sqlite3'),
-    }
+        'BACKEND': os.environ.get(
+            'AUTOLIB_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('AUTOLIB_CACHE_LOCATION', 'autolib'),
+    },
+    'catalogue': {
+        'BACKEND': os.environ.get(
+            'AUTOLIB_CATALOGUE_CACHE_BACKEND',
+            os.environ.get('AUTOLIB_CACHE_BACKEND',
+                           'django.core.cache.backends.locmem.LocMemCache')),
+        'LOCATION': os.environ.get(
+            'AUTOLIB_CATALOGUE_CACHE_LOCATION',
+            os.environ.get('AUTOLIB_CACHE_LOCATION', 'autolib-catalogue')),
+    },
 }
 
 
@@ -125,9 +199,82 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 
+# booksRecord
+# How long the catalogue cache keeps an entry, see booksRecord/catalogue.py.
+# Measured in seconds.
+
+BOOKSRECORD_CATALOGUE_TIMEOUT = 60 * 60  # seconds
+
+
 # readersRecord
 # The default period after taking of a book, 
 # when reader has to return a book.
 # Measured in days.
 
-READERSRECORD_DEFAULT_TAKING_PERIOD = 20  # days
\ No newline at end of file
+READERSRECORD_DEFAULT_TAKING_PERIOD = 20  # days
+
+
+# booksOperations
+# The tokens of the barcode scan stations,
+# which are allowed to use the scan endpoint
+# (see booksOperations.views.scan).
+# Each station sends "Authorization: Token <token>".
+
+BOOKSOPERATIONS_SCAN_TOKENS = []
+
+# The age of returned takings, after which `manage.py archive_takings`
+# moves them to the archive. Measured in days.
+
+BOOKSOPERATIONS_ARCHIVE_AFTER = 365  # days
+
+# The tokens of the external readers of the API
+# (see booksOperations.api), e.g. the school portal.
+# Each reader sends "Authorization: Token <token>";
+# the staff may use the API being logged in.
+
+BOOKSOPERATIONS_API_TOKENS = []
+
+
+# Request instrumentation
+# The wall time, the number of queries, the database time and the repeated
+# queries (N+1) of every request, see autoLib/instrumentation.py.
+# Off unless AUTOLIB_INSTRUMENTATION=1. Each request is logged as a JSON
+# line to AUTOLIB_INSTRUMENTATION_LOG, rotated at 10 MB; the percentiles
+# per view are at /stats/ for the staff.
+
+AUTOLIB_INSTRUMENTATION = os.environ.get('AUTOLIB_INSTRUMENTATION') == '1'
+
+# a query run this many times in one request is reported as repeated
+AUTOLIB_INSTRUMENTATION_DUPLICATES = 5
+
+# how many recent requests of each view the percentiles are computed over
+AUTOLIB_INSTRUMENTATION_SAMPLES = 1000
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(asctime)s %(message)s'},
+    },
+    'handlers': {
+        'requests': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.environ.get(
+                'AUTOLIB_INSTRUMENTATION_LOG',
+                os.path.join(BASE_DIR, 'requests.log')),
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'encoding': 'utf-8',
+            # the file is not created until something is logged
+            'delay': True,
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'autoLib.requests': {
+            'handlers': ['requests'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
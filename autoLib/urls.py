@@ -16,9 +16,16 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from . import instrumentation
+
 urlpatterns = [
     path('admin/doc/', include('django.contrib.admindocs.urls')),
     path('admin/', admin.site.urls),
+    path('books/', include('booksRecord.urls')),
+    path('operations/', include('booksOperations.urls')),
+    path('readers/', include('readersRecord.urls')),
+    path('api/', include('booksOperations.api')),
+    path('stats/', instrumentation.stats, name='request_stats'),
 ]
 
 admin.site.site_header = 'Библиотека МАОУ «‎МЛ № 1» города Магнитогорска‎'
\ No newline at end of file
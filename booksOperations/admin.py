@@ -1,18 +1,163 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import widgets
+from django.core.exceptions import ValidationError
+from django.forms.models import BaseInlineFormSet
+from django.http import HttpResponseRedirect
+from django.urls import NoReverseMatch, reverse
 from django.utils.safestring import mark_safe
+from django.utils.text import Truncator
 
 from . import models
 
 
+# The columns rendered for a taking, its instance and student;
+# BookInstance.status and book are needed by BookInstance.from_db.
+_TAKING_COLUMNS = (
+    'is_returned', 'when_taken', 'when_returned',
+    'book_instance__id', 'book_instance__status',
+    'book_instance__book__isbn', 'book_instance__book__name',
+    'student__id', 'student__second_name',
+    'student__first_name', 'student__middle_name',
+)
+
+
+def _with_related(queryset):
+    return queryset \
+        .select_related('book_instance__book', 'student') \
+        .only(*_TAKING_COLUMNS)
+
+
+class _LoadedRawIdWidget(widgets.ForeignKeyRawIdWidget):
+    '''
+    a raw id widget which labels the value with the related object
+    already loaded by the form's queryset instead of querying it again
+    '''
+    
+    related_object = None
+    
+    def label_and_url_for_value(self, value):
+        obj = self.related_object
+        if obj is None or str(obj.pk) != str(value):
+            return super().label_and_url_for_value(value)
+        
+        try:
+            url = reverse(
+                f'{self.admin_site.name}:{obj._meta.app_label}_'
+                f'{obj._meta.model_name}_change',
+                args=(obj.pk,)
+            )
+        except NoReverseMatch:
+            url = ''
+        return Truncator(obj).words(14), url
+
+
+class TakingConflictsMixin:
+    '''
+    answers models.AlreadyTaken, raised by BookTaking.save when someone
+    has issued the same instance after the form was checked, with
+    a message instead of a server error; the whole change is rolled back
+    '''
+    
+    def changeform_view(self, request, *args, **kwargs):
+        # both save_model and save_formset save takings,
+        # changeform_view runs them in one transaction
+        try:
+            return super().changeform_view(request, *args, **kwargs)
+        except models.AlreadyTaken as error:
+            self.message_user(request, ' '.join(error.messages),
+                              messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
+
+
+class _BookTakingForm(forms.ModelForm):
+    '''
+    refuses to put an instance on hands twice,
+    before BookTaking.save would do it with an exception
+    '''
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        book_instance = cleaned_data.get('book_instance')
+        if book_instance is None or cleaned_data.get('is_returned'):
+            return cleaned_data
+        
+        # a new taking takes an instance from the storage only
+        taken = (self.instance.pk is None and book_instance.status
+                 != book_instance.IN_STORAGE)
+        if taken or models.BookTaking.objects \
+                .filter(book_instance=book_instance, is_returned=False) \
+                .exclude(pk=self.instance.pk).exists():
+            self.add_error('book_instance', ValidationError(
+                'экземпляр %(id)s уже выдан',
+                params={'id': book_instance.id}))
+        return cleaned_data
+
+
+class _BookTakingFormSet(BaseInlineFormSet):
+    def clean(self):
+        super().clean()
+        
+        active = [
+            form.cleaned_data['book_instance'].id
+            for form in self.forms
+            if form.cleaned_data.get('book_instance') is not None
+            and not form.cleaned_data.get('is_returned')
+            and not form.cleaned_data.get('DELETE')
+        ]
+        doubled = sorted({instance_id for instance_id in active
+                          if active.count(instance_id) > 1})
+        if doubled:
+            raise ValidationError(
+                'экземпляры %(ids)s выдаются больше одного раза',
+                params={'ids': doubled})
+
+
+class _BookTakingInlineForm(_BookTakingForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        
+        if self.instance.pk is None:
+            return
+        for name, field in self.fields.items():
+            if isinstance(field.widget, _LoadedRawIdWidget):
+                field.widget.related_object = getattr(self.instance, name)
+
+
 class BookTakingInline(admin.TabularInline):
     model = models.BookTaking
+    form = _BookTakingInlineForm
+    formset = _BookTakingFormSet
     readonly_fields = ('when_taken',)
-    raw_id_fields = ('book_instance',)
+    raw_id_fields = ('book_instance', 'student')
     extra = 0
     can_delete = False
+    
+    def get_queryset(self, request):
+        return _with_related(super().get_queryset(request))
+    
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.raw_id_fields:
+            kwargs['widget'] = _LoadedRawIdWidget(
+                db_field.remote_field, self.admin_site,
+                using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class ActiveBookTakingInline(BookTakingInline):
+    '''
+    shows only the books which are on hands now;
+    the whole history is on the takings changelist
+    '''
+    
+    verbose_name_plural = 'книги на руках'
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).filter(is_returned=False)
 
 @admin.register(models.BookTaking)
-class BookTakingAdmin(admin.ModelAdmin):
+class BookTakingAdmin(TakingConflictsMixin, admin.ModelAdmin):
+    form = _BookTakingForm
     
     def book_instance_id_plus_name(self):
         '''
@@ -34,3 +179,27 @@ class BookTakingAdmin(admin.ModelAdmin):
       (None, {'fields': ('is_returned', 'book_instance', 'student')}),
       (None, {'fields': ('when_taken', 'when_returned')}),
     )
+    
+    def get_queryset(self, request):
+        return _with_related(super().get_queryset(request))
+
+
+@admin.register(models.BookTakingArchive)
+class BookTakingArchiveAdmin(admin.ModelAdmin):
+    '''
+    the archive is filled by `manage.py archive_takings` only
+    '''
+    
+    list_display = ('book_instance', 'student',
+      'when_taken', 'when_returned', 'archived_at',)
+    list_select_related = ('book_instance__book', 'student')
+    date_hierarchy = 'when_taken'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
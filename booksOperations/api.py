@@ -0,0 +1,234 @@
+'''
+JSON API только для чтения: каталог, экземпляры, ученики и акты взятия
+книг для школьного портала и таблиц учителей.\n
+GET /api/<ресурс>/ отдаёт страницу строк по возрастанию ключа;
+следующая страница — ?after=<последний ключ>, поэтому каждая страница —
+это поиск по индексу первичного ключа, а не OFFSET.
+?fields=a,b выбирает поля, ?limit=N — размер страницы (до 1000),
+остальные параметры — фильтры ресурса.\n
+ETag ответа строится по счётчикам изменений таблиц
+(см. :model:`booksOperations.TableVersion`), так что повторный запрос
+с If-None-Match получает 304, не читая сами строки.
+Страницы книг и экземпляров к тому же хранятся в кэше каталога
+(см. :mod:`booksRecord.catalogue`).
+Ответ сжимается gzip, если клиент это поддерживает.\n
+Доступ — сотрудникам или по заголовку "Authorization: Token <токен>"
+из BOOKSOPERATIONS_API_TOKENS.
+'''
+
+import hashlib
+
+from django.conf import settings
+from django.db import models
+from django.http import HttpResponseNotModified, JsonResponse
+from django.urls import path, reverse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_GET
+
+from booksRecord import catalogue
+from booksRecord.models import Book, BookInstance
+from readersRecord.models import Student
+from .models import BookTaking, TableVersion
+from .views import _has_token
+
+
+# the default and the largest number of rows on a page
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# the integers the database takes, the larger ones overflow
+_INTEGERS = range(-2 ** 63, 2 ** 63)
+
+
+class Resource:
+    '''
+    a model exposed by the API: its key (the primary key),
+    the fields which can be selected, the filters
+    (a parameter → the lookups its integer value is given to;
+    the value of a boolean field's filter is 0 or 1)
+    and the tables the rows depend on, whose versions make the ETag;
+    the pages of the catalogue tables are cached
+    '''
+    
+    def __init__(self, model, fields, filters=None, tables=None):
+        self.model = model
+        self.key = model._meta.pk.attname
+        self.fields = fields
+        self.filters = filters or {}
+        self.flags = {
+            parameter for parameter, lookups in self.filters.items()
+            if isinstance(model._meta.get_field(lookups[0].split('__')[0]),
+                          models.BooleanField)
+        }
+        self.tables = tables or (model,)
+        self.cached = all(table._meta.label in catalogue.MODELS
+                          for table in self.tables)
+
+
+RESOURCES = {
+    'books': Resource(
+        Book,
+        ('isbn', 'name', 'authors', 'subject', 'grade', 'grade_from',
+         'grade_to', 'year_of_publication', 'publisher', 'edition',
+         'publication_city', 'inventory_number', 'in_storage_count',
+         'on_hands_count', 'expired_count', 'written_off_count'),
+        # the books meant for a grade, as BookQuerySet.for_grade
+        filters={'grade': ('grade_from__lte', 'grade_to__gte')},
+        # the counters change with the instances
+        tables=(Book, BookInstance),
+    ),
+    'instances': Resource(
+        BookInstance,
+        ('id', 'book_id', 'status'),
+        filters={'book': ('book_id',), 'status': ('status',)},
+    ),
+    'students': Resource(
+        Student,
+        ('id', 'second_name', 'first_name', 'middle_name', 'grade',
+         'first_lang', 'second_lang'),
+        filters={'grade': ('grade',)},
+    ),
+    'takings': Resource(
+        BookTaking,
+        ('id', 'book_instance_id', 'student_id', 'is_returned',
+         'when_taken', 'when_returned'),
+        filters={'student': ('student_id',),
+                 'book_instance': ('book_instance_id',),
+                 'is_returned': ('is_returned',)},
+    ),
+}
+
+# the parameters which are not filters
+_OPTIONS = ('after', 'limit', 'fields')
+
+
+def _integer(value, flag=False):
+    number = int(value)
+    if number not in (range(2) if flag else _INTEGERS):
+        raise ValueError(value)
+    return number
+
+
+def _error(message, status=400):
+    return JsonResponse({'errors': [message]}, status=status)
+
+
+def _authorized(request):
+    return (request.user.is_active and request.user.is_staff
+            or _has_token(request, settings.BOOKSOPERATIONS_API_TOKENS))
+
+
+def _etag_matches(request, etag):
+    # the ETag becomes weak when the response is gzipped
+    given = request.META.get('HTTP_IF_NONE_MATCH', '')
+    return etag in (tag.strip().replace('W/', '', 1)
+                    for tag in given.split(','))
+
+
+@gzip_page
+@require_GET
+def resource_list(request, name):
+    '''
+    Страница строк ресурса, см. описание модуля.
+    '''
+    
+    if not _authorized(request):
+        return _error('нужна авторизация', status=403)
+    
+    resource = RESOURCES.get(name)
+    if resource is None:
+        return _error(f'нет ресурса "{name}"', status=404)
+    
+    try:
+        after = request.GET.get('after')
+        after = _integer(after) if after is not None else None
+        limit = min(max(int(request.GET.get('limit', PAGE_SIZE)), 1),
+                    MAX_PAGE_SIZE)
+        filters = {
+            lookup: _integer(value, parameter in resource.flags)
+            for parameter, value in request.GET.items()
+            if parameter not in _OPTIONS
+            for lookup in resource.filters[parameter]
+        }
+    except ValueError:
+        return _error('after, limit и фильтры должны быть целыми числами, '
+                      'флаги вроде is_returned — 0 или 1')
+    except KeyError as error:
+        return _error(f'нет фильтра {error}')
+    
+    if 'fields' in request.GET:
+        # the key is always given, it is the cursor
+        fields = [resource.key]
+        for field in request.GET['fields'].split(','):
+            if field not in resource.fields:
+                return _error(f'нет поля "{field}"')
+            if field not in fields:
+                fields.append(field)
+    else:
+        fields = list(resource.fields)
+    
+    versions = TableVersion.get(*resource.tables)
+    etag = '"{}"'.format(hashlib.md5(
+        f'{versions}|{request.get_full_path()}'.encode()).hexdigest())
+    if _etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        def page():
+            rows = resource.model.objects.order_by(resource.key) \
+                .filter(**filters)
+            if after is not None:
+                rows = rows.filter(**{f'{resource.key}__gt': after})
+            return list(rows.values(*fields)[:limit + 1])
+        
+        if resource.cached:
+            # the same versions as in the ETag
+            rows = catalogue.cached(
+                'api', (name, fields, sorted(filters.items()), after, limit),
+                page, versions)
+        else:
+            rows = page()
+        
+        next_url = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            parameters = request.GET.copy()
+            parameters['after'] = rows[-1][resource.key]
+            next_url = request.build_absolute_uri(
+                f'{request.path}?{parameters.urlencode()}')
+        response = JsonResponse({'results': rows, 'next': next_url})
+    
+    response['ETag'] = etag
+    # the client may keep the page but has to revalidate it
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ('Authorization', 'Cookie'))
+    return response
+
+
+@require_GET
+def resource_index(request):
+    '''
+    Список ресурсов с их полями и фильтрами.
+    '''
+    
+    if not _authorized(request):
+        return _error('нужна авторизация', status=403)
+    
+    return JsonResponse({'resources': {
+        name: {
+            'url': request.build_absolute_uri(
+                reverse('api:resource_list', args=(name,))),
+            'key': resource.key,
+            'fields': resource.fields,
+            'filters': list(resource.filters),
+        }
+        for name, resource in RESOURCES.items()
+    }})
+
+
+app_name = 'api'
+
+urlpatterns = [
+    path('', resource_index, name='resource_index'),
+    path('<slug:name>/', resource_list, name='resource_list'),
+]
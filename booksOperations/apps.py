@@ -3,4 +3,8 @@ from django.apps import AppConfig
 
 class BooksoperationsConfig(AppConfig):
     name = 'booksOperations'
-    verbose_name = 'Операции с книгами'
\ No newline at end of file
+    verbose_name = 'Операции с книгами'
+    
+    def ready(self):
+        # connects the signals resetting the cached loan summaries
+        from . import loans
@@ -0,0 +1,74 @@
+'''
+Перенос давно возвращённых книг из актов взятия книг в архив
+(:model:`booksOperations.BookTakingArchive`), см. `manage.py archive_takings`.\n
+Сводки по классам и по ученикам учитывают архив,
+поэтому перенос их не меняет, и сигналы удаления здесь не нужны.
+'''
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BookTaking, BookTakingArchive, TableVersion
+
+
+ARCHIVED_FIELDS = ('id', 'book_instance_id', 'student_id',
+                   'when_taken', 'when_returned')
+
+
+def archivable(days=None, now=None):
+    '''
+    returns the takings returned more than `days` days ago,
+    settings.BOOKSOPERATIONS_ARCHIVE_AFTER by default
+    '''
+    
+    if days is None:
+        days = settings.BOOKSOPERATIONS_ARCHIVE_AFTER
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    
+    return BookTaking.objects.filter(is_returned=True).filter(
+        Q(when_returned__lt=cutoff)
+        | Q(when_returned=None, when_taken__lt=cutoff))
+
+
+def archive_takings(days=None, batch_size=1000, now=None):
+    '''
+    moves the old returned takings to the archive,
+    one transaction per batch; returns the number of moved takings
+    '''
+    
+    # the DELETE below takes an SQL parameter per id,
+    # older SQLite builds take at most 999
+    batch_size = min(batch_size, connection.ops.bulk_batch_size(
+        ['id'], range(batch_size)))
+    takings = archivable(days, now).order_by('id')
+    table = connection.ops.quote_name(BookTaking._meta.db_table)
+    moved = 0
+    last_id = 0
+    
+    while True:
+        with transaction.atomic():
+            rows = list(takings.filter(id__gt=last_id)
+                        .values_list(*ARCHIVED_FIELDS)[:batch_size])
+            if not rows:
+                return moved
+            
+            BookTakingArchive.objects.bulk_create(
+                BookTakingArchive(**dict(zip(ARCHIVED_FIELDS, row)))
+                for row in rows)
+            
+            # a plain DELETE: QuerySet.delete would send the signals
+            # which take the takings away from the summaries
+            ids = [row[0] for row in rows]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {table} WHERE id IN '
+                    f'({", ".join(["%s"] * len(ids))})',
+                    ids)
+            TableVersion.bump(BookTaking)
+        
+        moved += len(rows)
+        last_id = ids[-1]
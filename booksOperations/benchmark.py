@@ -0,0 +1,327 @@
+'''
+Замеры основных сценариев работы библиотеки на синтетических данных
+размером со школу, см. `manage.py benchmark`.\n
+generate заполняет пустую базу учениками всех классов, каталогом,
+экземплярами и историей взятия книг за несколько лет;
+run_cases замеряет время и число запросов каждого сценария,
+а результаты записываются в JSON, чтобы сравнивать их между коммитами.\n
+create_synthetic_rows создаёт одну книгу с экземплярами и учеников
+для `manage.py benchmark_checkout`, работающей с тестовой копией базы,
+и `manage.py benchmark_archive`, которая работает поверх настоящих
+данных и откатывает свои изменения.
+'''
+
+import random
+import statistics
+import time
+from datetime import timedelta
+from io import StringIO
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import F
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+import core
+from booksRecord import search
+from booksRecord.models import Book, BookInstance
+from booksRecord.validators import ean8_range
+from readersRecord.models import Student
+from . import export, services
+from .management.commands.sweep_overdue import sweep_overdue
+from .models import BookTaking, GradeSummary
+
+
+# the sizes of a large school, multiplied by the scale
+STUDENTS = 2000
+BOOKS = 5000
+INSTANCES = 100000
+
+SECOND_NAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев',
+                'Петров', 'Соколов', 'Михайлов', 'Новиков', 'Фёдоров',
+                'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семёнов')
+FIRST_NAMES = ('Александр', 'Максим', 'Иван', 'Артём', 'Дмитрий',
+               'Мария', 'Анна', 'Алиса', 'Елизавета', 'Полина')
+SUBJECTS = ('Алгебра', 'Геометрия', 'Физика', 'Химия', 'Биология',
+            'История России', 'Литература', 'Русский язык', 'География',
+            'Английский язык', 'Информатика', 'Обществознание')
+AUTHORS = ('Макарычев', 'Атанасян', 'Перышкин', 'Габриелян', 'Пасечник',
+           'Арсентьев', 'Коровина', 'Ладыженская', 'Алексеев', 'Босова')
+
+# SQLite takes at most 500 rows by one INSERT
+BATCH_SIZE = 500
+
+# how many books are issued and returned by one run of the cases
+SET_SIZE = 30
+
+# The rows of create_synthetic_rows are made far from the real ids.
+SYNTHETIC_ISBN = 9999999999994
+FIRST_INSTANCE_ID = 99000000
+FIRST_STUDENT_ID = 999000000
+
+
+def generate(scale=1.0, years=3, takings_per_year=10, on_hands=5, seed=0):
+    '''
+    fills an empty database with synthetic data:
+    students of all the grades, books, their instances
+    and `years` years of returned takings plus the books on hands now,
+    a fifth of them overdue; returns the numbers of the created rows
+    '''
+    
+    rng = random.Random(seed)
+    now = timezone.now()
+    grades = list(core.GRADE_LABELS)
+    
+    students = []
+    for n in range(1, max(int(STUDENTS * scale), len(grades)) + 1):
+        student = Student(
+            id=n,
+            second_name=rng.choice(SECOND_NAMES),
+            first_name=rng.choice(FIRST_NAMES),
+            grade=grades[n % len(grades)],
+        )
+        student.fill_search_fields()
+        students.append(student)
+    Student.objects.bulk_create(students, batch_size=BATCH_SIZE)
+    
+    books = []
+    for n in range(1, max(int(BOOKS * scale), 1) + 1):
+        subject = rng.choice(SUBJECTS)
+        year = rng.randint(1, 11)
+        book = Book(
+            isbn=9780000000000 + n,
+            name=f'{subject}. {year} класс',
+            authors=rng.choice(AUTHORS),
+            year_of_publication=rng.randint(2000, 2020),
+            publisher='Просвещение',
+            edition=1,
+            publication_city='Москва',
+            subject=subject[:20],
+            grade=str(year),
+            inventory_number=n,
+        )
+        book.fill_grade_range()
+        books.append(book)
+    Book.objects.bulk_create(books, batch_size=BATCH_SIZE)
+    
+    # the instances are labelled by consecutive EAN-8 codes
+    instance_ids = list(islice(ean8_range(10000000, 99999999),
+                               max(int(INSTANCES * scale), len(books))))
+    BookInstance.objects.bulk_create(
+        (BookInstance(id=instance_id, book_id=books[n % len(books)].isbn)
+         for n, instance_id in enumerate(instance_ids)),
+        batch_size=BATCH_SIZE)
+    
+    # the history: every taking is returned
+    history = []
+    for year in range(years):
+        for student in students:
+            for instance_id in rng.sample(instance_ids, takings_per_year):
+                taken = now - timedelta(days=365 * (years - year)
+                                        + rng.randint(0, 300))
+                history.append(BookTaking(
+                    book_instance_id=instance_id, student_id=student.id,
+                    is_returned=True,
+                    when_returned=taken + timedelta(days=rng.randint(7, 60))))
+    BookTaking.objects.bulk_create(history, batch_size=BATCH_SIZE)
+    
+    # the books on hands now, each instance at one student only
+    taken_ids = rng.sample(instance_ids,
+                           min(len(students) * on_hands, len(instance_ids) // 2))
+    active = [
+        BookTaking(
+            book_instance_id=instance_id,
+            student_id=students[n % len(students)].id,
+            when_returned=now + timedelta(
+                days=rng.randint(-30, -1) if n % 5 == 0
+                else rng.randint(1, 90)))
+        for n, instance_id in enumerate(taken_ids)
+    ]
+    BookTaking.objects.bulk_create(active, batch_size=BATCH_SIZE)
+    
+    # bulk_create sets when_taken to now
+    BookTaking.objects.update(when_taken=F('when_returned') - timedelta(days=30))
+    
+    # bulk operations bypass the counters, the index and the summary;
+    # the overdue ones are left for the sweep to find
+    BookInstance.objects.filter(id__in=taken_ids) \
+        .update(status=BookInstance.ON_HANDS)
+    call_command('rebuild_book_counters', stdout=StringIO())
+    search.get_backend().rebuild()
+    GradeSummary.rebuild()
+    
+    return {
+        'grades': len(set(student.grade for student in students)),
+        'students': len(students),
+        'books': len(books),
+        'instances': len(instance_ids),
+        'takings': len(history) + len(active),
+        'active_takings': len(active),
+    }
+
+
+def free_inventory_number():
+    '''
+    the largest inventory number not given to a real book
+    '''
+    
+    taken = set(Book.objects.values_list('inventory_number', flat=True))
+    number = next((number for number in range(32767, 0, -1)
+                   if number not in taken), None)
+    if number is None:
+        raise CommandError('every inventory number is taken')
+    return number
+
+
+def create_synthetic_rows(instances, students):
+    '''
+    creates a book with `instances` instances in storage and `students`
+    students, possibly next to the real data, their ids counted
+    from FIRST_INSTANCE_ID and FIRST_STUDENT_ID; returns the book
+    '''
+    
+    if Book.objects.filter(isbn=SYNTHETIC_ISBN).exists():
+        raise CommandError(f'ISBN {SYNTHETIC_ISBN} is taken, '
+                           f'remove the leftovers of a failed run')
+    
+    book = Book.objects.create(
+        isbn=SYNTHETIC_ISBN, name='Тестовая книга', authors='-',
+        year_of_publication=2000, publisher='-', edition=1,
+        publication_city='-', inventory_number=free_inventory_number())
+    BookInstance.objects.bulk_create(
+        (BookInstance(id=FIRST_INSTANCE_ID + n, book=book)
+         for n in range(instances)),
+        batch_size=BATCH_SIZE)
+    Book.shift_counters(SYNTHETIC_ISBN, None, BookInstance.IN_STORAGE,
+                        instances)
+    synthetic = []
+    for n in range(students):
+        student = Student(id=FIRST_STUDENT_ID + n, second_name='Тестов',
+                          first_name='Тест', grade=1)
+        student.fill_search_fields()
+        synthetic.append(student)
+    Student.objects.bulk_create(synthetic, batch_size=BATCH_SIZE)
+    return book
+
+
+def _measure(function, repeat):
+    times = []
+    queries = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            function()
+            times.append((time.perf_counter() - start) * 1000)
+        queries.append(len(captured))
+    
+    return {
+        'runs': repeat,
+        'median_ms': round(statistics.median(times), 3),
+        'min_ms': round(min(times), 3),
+        'max_ms': round(max(times), 3),
+        'queries': max(queries),
+    }
+
+
+def _get(client, url, **params):
+    def request():
+        response = client.get(url, params)
+        if response.status_code != 200:
+            raise AssertionError(f'{url}: {response.status_code}')
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+    return request
+
+
+class _Run:
+    '''
+    the state of one run_cases shared by the cases
+    '''
+    
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.client = Client()
+        self.client.force_login(User.objects.create_superuser(
+            'benchmark', 'benchmark@example.com', None))
+        self.backend = search.get_backend()
+        
+        self.student_id = Student.objects.order_by('id') \
+            .values_list('id', flat=True)[0]
+        in_storage = list(
+            BookInstance.objects.filter(status=BookInstance.IN_STORAGE)
+            .order_by('id').values_list('id', flat=True)[:SET_SIZE * repeat])
+        self.sets = [in_storage[n:n + SET_SIZE]
+                     for n in range(0, len(in_storage), SET_SIZE)][:repeat]
+        self.issued = []
+    
+    def get(self, name, *args, **params):
+        return _get(self.client, reverse(name, args=args), **params)
+    
+    def checkout(self):
+        book_set = self.sets.pop()
+        services.issue_books(book_set, [self.student_id])
+        self.issued.append(book_set)
+    
+    def checkin(self):
+        services.return_books(self.issued.pop())
+
+
+# the case → a function making (the function to time,
+# how many times it is run) from the _Run, in the order of the report
+CASES = {
+    'admin_books': lambda run: (
+        run.get('admin:booksRecord_book_changelist'), run.repeat),
+    'admin_books_search': lambda run: (
+        run.get('admin:booksRecord_book_changelist', q='физика 7'),
+        run.repeat),
+    'admin_students': lambda run: (
+        run.get('admin:readersRecord_student_changelist'), run.repeat),
+    'admin_student': lambda run: (
+        run.get('admin:readersRecord_student_change', run.student_id),
+        run.repeat),
+    'admin_takings': lambda run: (
+        run.get('admin:booksOperations_booktaking_changelist'), run.repeat),
+    'search': lambda run: (
+        lambda: list(run.backend.filter(Book.objects.all(), 'алгебр 7')
+                     .values_list('isbn')[:50]),
+        run.repeat),
+    'student_autocomplete': lambda run: (
+        run.get('readersRecord:autocomplete', q='ива'), run.repeat),
+    'grade_dashboard': lambda run: (
+        run.get('booksOperations:grade_dashboard'), run.repeat),
+    'checkout': lambda run: (run.checkout, len(run.sets)),
+    'return': lambda run: (run.checkin, len(run.sets)),
+    'sweep_overdue': lambda run: (lambda: sweep_overdue(full=True), 3),
+    'export_books': lambda run: (
+        lambda: sum(map(len, export.csv_chunks('books'))), 1),
+    'export_takings': lambda run: (
+        lambda: sum(map(len, export.csv_chunks('takings'))), 1),
+}
+
+
+def run_cases(repeat=10, only=None):
+    '''
+    times the key paths on the data made by generate;
+    the pages are requested by the test client, so it needs
+    django.test.utils.setup_test_environment;
+    returns {case: {runs, median_ms, min_ms, max_ms, queries}}
+    '''
+    
+    if only and 'return' in only:
+        # returns the sets issued by checkout
+        only = set(only) | {'checkout'}
+    
+    run = _Run(repeat)
+    cases = {name: make(run) for name, make in CASES.items()
+             if not only or name in only}
+    return {
+        name: _measure(function, case_repeat)
+        for name, (function, case_repeat) in cases.items()
+    }
@@ -0,0 +1,239 @@
+'''
+Выгрузка актов взятия книг, учеников и каталога в CSV и XLSX.\n
+Строки читаются из базы порциями (QuerySet.iterator) сразу в виде
+кортежей (values_list) и пишутся в файл по мере чтения,
+поэтому выгрузка любого размера занимает постоянную память,
+а ответ начинает отправляться сразу, см. views.export
+и `manage.py export`.
+'''
+
+import csv
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.db.models import BooleanField, Value
+from django.utils import timezone
+
+import core
+from booksRecord.models import Book
+from readersRecord.models import Student
+from .models import BookTaking, BookTakingArchive
+
+
+# how many rows are fetched from the database at once
+CHUNK_SIZE = 2000
+
+# how many bytes are collected before they are sent
+BUFFER_SIZE = 64 * 1024
+
+
+def _datetime(value):
+    if value is None:
+        return ''
+    return timezone.localtime(value).strftime('%Y-%m-%d %H:%M')
+
+
+def _yes_no(value):
+    return 'да' if value else 'нет'
+
+
+def _grade(value):
+    return core.GRADE_LABELS.get(value, value)
+
+
+def _takings(queryset, is_returned='is_returned'):
+    rows = queryset.order_by('id').values_list(
+        'id', 'book_instance_id', 'book_instance__book__isbn',
+        'book_instance__book__name', 'student_id', 'student__second_name',
+        'student__first_name', 'student__grade', 'when_taken',
+        'when_returned', is_returned,
+    ).iterator(chunk_size=CHUNK_SIZE)
+    
+    for (id, instance_id, isbn, name, student_id, second_name,
+         first_name, grade, when_taken, when_returned, is_returned) in rows:
+        yield (id, instance_id, isbn, name, student_id,
+               f'{second_name} {first_name}', _grade(grade),
+               _datetime(when_taken), _datetime(when_returned),
+               _yes_no(is_returned))
+
+
+def _students():
+    rows = Student.objects.order_by('id').values_list(
+        'id', 'second_name', 'first_name', 'middle_name', 'grade',
+        'first_lang', 'second_lang',
+    ).iterator(chunk_size=CHUNK_SIZE)
+    
+    for (id, second_name, first_name, middle_name, grade,
+         first_lang, second_lang) in rows:
+        yield (id, second_name, first_name, middle_name, _grade(grade),
+               core.LANGUAGE_LABELS.get(first_lang, first_lang),
+               core.LANGUAGE_LABELS.get(second_lang, second_lang))
+
+
+def _books():
+    # the instance counts are kept by Book itself, so no join is needed
+    return Book.objects.order_by('isbn').values_list(
+        'isbn', 'name', 'authors', 'subject', 'grade',
+        'year_of_publication', 'publisher', 'inventory_number',
+        'in_storage_count', 'on_hands_count', 'expired_count',
+        'written_off_count',
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+_TAKING_HEADER = (
+    'ID', 'экземпляр', 'ISBN', 'книга', 'ID ученика', 'ученик', 'класс',
+    'взята', 'возвращена', 'возвращена?',
+)
+
+# the name of a dataset → (its header, a function yielding its rows)
+DATASETS = {
+    'takings': (
+        _TAKING_HEADER,
+        lambda: _takings(BookTaking.objects.all()),
+    ),
+    'archive': (
+        _TAKING_HEADER,
+        # the archived takings are returned ones
+        lambda: _takings(BookTakingArchive.objects.all(),
+                         Value(True, output_field=BooleanField())),
+    ),
+    'students': (
+        ('ID', 'фамилия', 'имя', 'отчество', 'класс',
+         'первый язык', 'второй язык'),
+        _students,
+    ),
+    'books': (
+        ('ISBN', 'название', 'автор(-ы)', 'предмет', 'класс', 'год издания',
+         'издательство', 'инвентарный номер', 'в хранилище', 'на руках',
+         'просрочено', 'снято с учёта'),
+        _books,
+    ),
+}
+
+
+class _Buffer:
+    '''
+    a write-only file collecting what is written to it
+    until it is taken by the generator sending the data
+    '''
+    
+    def __init__(self, empty):
+        # '' for text, b'' for bytes
+        self.empty = empty
+        self.parts = []
+        self.size = 0
+    
+    def write(self, data):
+        self.parts.append(data)
+        self.size += len(data)
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def take(self):
+        data = self.empty.join(self.parts)
+        self.parts = []
+        self.size = 0
+        return data
+
+
+def csv_chunks(dataset):
+    '''
+    yields the dataset as UTF-8 CSV, with BOM for Excel
+    '''
+    
+    header, rows = DATASETS[dataset]
+    buffer = _Buffer('')
+    writer = csv.writer(buffer)
+    
+    yield '\ufeff'.encode()
+    writer.writerow(header)
+    for row in rows():
+        writer.writerow(row)
+        if buffer.size >= BUFFER_SIZE:
+            yield buffer.take().encode()
+    yield buffer.take().encode()
+
+
+# The smallest workbook Excel and LibreOffice open:
+# one sheet with inline strings, so no shared strings table
+# has to be built before the rows are written.
+
+_XLSX_PARTS = {
+    '[Content_Types].xml':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>',
+    '_rels/.rels':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>',
+    'xl/workbook.xml':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>',
+    'xl/_rels/workbook.xml.rels':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>',
+}
+
+
+def _xlsx_row(number, row):
+    cells = []
+    for value in row:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f'<c t="n"><v>{value}</v></c>')
+        elif value is None or value == '':
+            cells.append('<c/>')
+        else:
+            cells.append(
+                f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>')
+    return f'<row r="{number}">{"".join(cells)}</row>'
+
+
+def xlsx_chunks(dataset):
+    '''
+    yields the dataset as an XLSX workbook of one sheet;
+    the ZIP is written as a stream, without seeking back
+    '''
+    
+    header, rows = DATASETS[dataset]
+    buffer = _Buffer(b'')
+    
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content.replace('{name}', dataset))
+        yield buffer.take()
+        
+        with archive.open('xl/worksheets/sheet1.xml', 'w',
+                          force_zip64=True) as sheet:
+            sheet.write(
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/'
+                'spreadsheetml/2006/main"><sheetData>'.encode())
+            sheet.write(_xlsx_row(1, header).encode())
+            for number, row in enumerate(rows(), 2):
+                sheet.write(_xlsx_row(number, row).encode())
+                if buffer.size >= BUFFER_SIZE:
+                    yield buffer.take()
+            sheet.write(b'</sheetData></worksheet>')
+    
+    yield buffer.take()
+
+
+# the format → (the function yielding the file, its content type)
+FORMATS = {
+    'csv': (csv_chunks, 'text/csv; charset=utf-8'),
+    'xlsx': (xlsx_chunks, 'application/vnd.openxmlformats-officedocument'
+                          '.spreadsheetml.sheet'),
+}
@@ -0,0 +1,75 @@
+'''
+Сводка по книгам ученика: сколько у него на руках, сколько из них
+просрочено и сколько он брал за всё время, включая архив.\n
+Сводка хранится в кэше Django (settings.CACHES) и сбрасывается сигналами
+post_save и post_delete модели BookTaking; массовые операции
+(см. services) сбрасывают её сами, вызывая forget.
+Запись в кэше истекает, как только очередная книга становится
+просроченной, поэтому число просроченных книг не устаревает.
+'''
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import BookTaking, BookTakingArchive
+
+
+# the longest time a summary is kept, in seconds
+TIMEOUT = 24 * 60 * 60
+
+
+def _key(student_id):
+    return f'booksOperations:loans:{student_id}'
+
+
+def summary(student_id):
+    '''
+    returns {'active': ..., 'overdue': ..., 'total': ...}
+    for the student, from the cache if possible
+    '''
+    
+    result = cache.get(_key(student_id))
+    if result is not None:
+        return result
+    
+    now = timezone.now()
+    active = Q(is_returned=False)
+    overdue = active & Q(when_returned__lt=now)
+    
+    numbers = BookTaking.objects.filter(student_id=student_id).aggregate(
+        total=Count('id'),
+        active=Count('id', filter=active),
+        overdue=Count('id', filter=overdue),
+        next_due=Min('when_returned', filter=active & ~overdue),
+    )
+    next_due = numbers.pop('next_due')
+    numbers['total'] += BookTakingArchive.objects \
+        .filter(student_id=student_id).count()
+    
+    timeout = TIMEOUT
+    if next_due is not None:
+        timeout = min(timeout, (next_due - now).total_seconds() + 1)
+    cache.set(_key(student_id), numbers, timeout)
+    return numbers
+
+
+def forget(student_ids):
+    '''
+    drops the cached summaries of the students now and once again
+    after the commit, so a summary computed by a concurrent request
+    from the data before the commit doesn't stay in the cache
+    '''
+    
+    keys = [_key(student_id) for student_id in student_ids]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(post_save, sender=BookTaking)
+@receiver(post_delete, sender=BookTaking)
+def _forget_student(sender, instance, **kwargs):
+    forget([instance.student_id])
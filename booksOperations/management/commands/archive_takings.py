@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from booksOperations.archive import archivable, archive_takings
+
+
+class Command(BaseCommand):
+    help = '''Moves the takings returned long ago to the archive'''
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.BOOKSOPERATIONS_ARCHIVE_AFTER,
+            help='archive the takings returned more than DAYS days ago '
+                 '(default: settings.BOOKSOPERATIONS_ARCHIVE_AFTER)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='how many takings are moved by one transaction',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="only count the takings to archive, don't move them",
+        )
+    
+    def handle(self, *args, days, batch_size, dry_run=False, **options):
+        if dry_run:
+            self.stdout.write(
+                f'{archivable(days).count()} taking(s) would be archived')
+            return
+        
+        moved = archive_takings(days, batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'{moved} taking(s) moved to the archive'))
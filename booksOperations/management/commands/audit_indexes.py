@@ -0,0 +1,111 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from booksRecord.models import Book, BookInstance
+from readersRecord.models import Student
+from booksOperations import archive
+from booksOperations.models import BookTaking, GradeSummary
+
+
+def query_shapes():
+    '''
+    the queries the application runs often, by name;
+    the parameters are arbitrary, only the shape of the query matters
+    '''
+    
+    now = timezone.now()
+    return {
+        'instances of a book (bookinstance_set)':
+            BookInstance.objects.filter(book_id=9780000000001),
+        'instances of a book by status':
+            BookInstance.objects.filter(
+                book_id=9780000000001, status=BookInstance.IN_STORAGE),
+        'instances in storage (BookTaking.book_instance choices)':
+            BookInstance.objects.filter(status=BookInstance.IN_STORAGE),
+        'takings of a student (loans.summary)':
+            BookTaking.objects.filter(student_id=1),
+        'active takings of a student (the student page)':
+            BookTaking.objects.filter(student_id=1, is_returned=False),
+        'active taking of an instance (return)':
+            BookTaking.objects.filter(
+                book_instance_id=12345670, is_returned=False),
+        'overdue takings (sweep_overdue)':
+            BookTaking.objects.filter(
+                is_returned=False, when_returned__lt=now,
+                when_returned__gte=now - timedelta(days=1)),
+        'returned takings to archive (archive_takings)':
+            archive.archivable(now=now),
+        'students by name (name_startswith)':
+            Student.objects.name_startswith('ива'),
+        'students of a year (in_years)':
+            Student.objects.in_years(9),
+        'books for a grade (for_grade)':
+            Book.objects.for_grade(7),
+        'books by inventory number':
+            Book.objects.filter(inventory_number=1),
+        'grade summary of a grade (grade_dashboard)':
+            GradeSummary.objects.filter(grade=58),
+    }
+
+
+def scanned_tables(plan):
+    '''
+    the tables read in full according to the plan of EXPLAIN
+    '''
+    
+    tables = []
+    for line in plan.splitlines():
+        words = line.replace('-', ' ').split()
+        if connection.vendor == 'sqlite':
+            # SEARCH is a lookup by an index, SCAN reads everything,
+            # even "SCAN table USING INDEX" which only reads it in order
+            if 'SCAN' in words:
+                table = words[words.index('SCAN') + 1]
+                if table not in ('CONSTANT', 'SUBQUERY'):
+                    tables.append(table)
+        elif 'Seq' in words and 'Scan' in words and 'on' in words:
+            tables.append(words[words.index('on') + 1])
+    return tables
+
+
+class Command(BaseCommand):
+    help = '''Runs EXPLAIN over the query shapes the application uses \
+and reports the ones reading whole tables instead of using an index'''
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help='print the whole plan of every query',
+        )
+        parser.add_argument(
+            '--fail',
+            action='store_true',
+            help='exit with an error if any scan is found, e.g. on CI',
+        )
+    
+    def handle(self, *args, verbose_plans=False, fail=False, **options):
+        if connection.vendor == 'postgresql':
+            self.stdout.write(
+                'PostgreSQL reads small tables in full whatever the indexes '
+                'are; run this on a database of the real size')
+        
+        flagged = []
+        for name, queryset in query_shapes().items():
+            plan = queryset.explain()
+            tables = scanned_tables(plan)
+            if tables:
+                flagged.append(name)
+                self.stdout.write(self.style.WARNING(
+                    f'SCAN {", ".join(tables)}: {name}'))
+            else:
+                self.stdout.write(f'ok: {name}')
+            if verbose_plans or tables:
+                for line in plan.splitlines():
+                    self.stdout.write(f'    {line}')
+        
+        if flagged and fail:
+            raise CommandError(f'{len(flagged)} query shape(s) scan tables')
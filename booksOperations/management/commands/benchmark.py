@@ -0,0 +1,114 @@
+import json
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import (
+    setup_test_environment, teardown_test_environment,
+)
+
+from booksRecord.models import Book
+from readersRecord.models import Student
+from booksOperations import benchmark
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = '''Generates a school-sized synthetic database and times \
+the admin pages, search, checkout, return, the overdue sweep \
+and the exports; the results are written as JSON and may be compared \
+with an earlier run. Runs on an empty database, everything is rolled back'''
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            type=float,
+            default=1.0,
+            help='the fraction of a school of 2000 students, 5000 books '
+                 'and 100000 instances to generate',
+        )
+        parser.add_argument(
+            '--years',
+            type=int,
+            default=3,
+            help='how many years of taking history to generate',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=10,
+            help='how many times each fast case is run',
+        )
+        parser.add_argument(
+            '--cases',
+            nargs='+',
+            choices=benchmark.CASES,
+            help='the cases to run (default: all)',
+        )
+        parser.add_argument(
+            '-o', '--output',
+            help='the JSON file to write the results to',
+        )
+        parser.add_argument(
+            '--compare',
+            help='the JSON file of an earlier run to compare with',
+        )
+    
+    def handle(self, *args, scale, years, repeat, cases=None, output=None,
+               compare=None, **options):
+        if Book.objects.exists() or Student.objects.exists():
+            raise CommandError(
+                'the database is not empty; run the benchmark against '
+                'an empty one, e.g. a fresh copy made by `manage.py migrate`')
+        
+        baseline = None
+        if compare:
+            with open(compare) as file:
+                baseline = json.load(file)
+        
+        # lets the test client in, see benchmark.run_cases
+        setup_test_environment()
+        try:
+            with transaction.atomic():
+                sizes = benchmark.generate(scale, years)
+                results = benchmark.run_cases(repeat, cases)
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            teardown_test_environment()
+        
+        report = {
+            'commit': _commit(),
+            'vendor': connection.vendor,
+            'scale': scale,
+            'sizes': sizes,
+            'results': results,
+        }
+        if output:
+            with open(output, 'w') as file:
+                json.dump(report, file, indent=2, ensure_ascii=False)
+        
+        self.stdout.write(', '.join(f'{number} {name}'
+                                    for name, number in sizes.items()))
+        self.stdout.write(f'{"case":22} {"median, ms":>11} {"queries":>8}'
+                          + (f' {"was, ms":>9} {"was":>5}' if baseline else ''))
+        for name, result in results.items():
+            line = (f'{name:22} {result["median_ms"]:11.2f} '
+                    f'{result["queries"]:8}')
+            old = baseline and baseline['results'].get(name)
+            if old:
+                line += f' {old["median_ms"]:9.2f} {old["queries"]:5}'
+            self.stdout.write(line)
@@ -0,0 +1,106 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from booksOperations import benchmark
+from booksOperations.archive import archive_takings
+from booksOperations.benchmark import FIRST_INSTANCE_ID, FIRST_STUDENT_ID
+from booksOperations.models import BookTaking
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = '''Generates several years of synthetic taking history \
+and times the active loans queries before and after archiving it; \
+all the changes are rolled back'''
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--years',
+            type=int,
+            default=5,
+            help='how many years of history to generate',
+        )
+        parser.add_argument(
+            '--students',
+            type=int,
+            default=1000,
+        )
+        parser.add_argument(
+            '--takings-per-year',
+            type=int,
+            default=20,
+            help='how many books a student takes per year',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=200,
+            help='how many times each query is run',
+        )
+    
+    def handle(self, *args, years, students, takings_per_year, repeat,
+               **options):
+        try:
+            with transaction.atomic():
+                self.generate(years, students, takings_per_year)
+                self.stdout.write(
+                    f'{BookTaking.objects.count()} takings generated')
+                
+                self.stdout.write(f'{"":>10} {"active, ms":>10} '
+                                  f'{"student, ms":>11}')
+                self.report('before', students, repeat)
+                
+                start = time.perf_counter()
+                moved = archive_takings()
+                self.stdout.write(
+                    f'{moved} takings archived '
+                    f'in {time.perf_counter() - start:.1f} s')
+                self.report('after', students, repeat)
+                
+                raise _Rollback
+        except _Rollback:
+            pass
+    
+    def generate(self, years, students, takings_per_year):
+        # each student has one book on hands and the returned rest
+        number = students * takings_per_year * years
+        book = benchmark.create_synthetic_rows(number, students)
+        
+        now = timezone.now()
+        BookTaking.objects.bulk_create(
+            (BookTaking(
+                book_instance_id=FIRST_INSTANCE_ID + n,
+                student_id=FIRST_STUDENT_ID + n % students,
+                is_returned=n >= students,
+                when_returned=now - timedelta(
+                    days=random.uniform(0, 365 * years)))
+             for n in range(number)),
+            batch_size=benchmark.BATCH_SIZE)
+        BookTaking.objects.filter(book_instance__book=book).update(
+            when_taken=F('when_returned') - timedelta(days=14))
+    
+    def report(self, label, students, repeat):
+        active = BookTaking.objects.filter(is_returned=False)
+        
+        start = time.perf_counter()
+        for _ in range(repeat):
+            list(active.order_by('-when_taken')[:100])
+        active_time = (time.perf_counter() - start) / repeat
+        
+        start = time.perf_counter()
+        for n in range(repeat):
+            list(BookTaking.objects.filter(
+                student_id=FIRST_STUDENT_ID + n % students))
+        student_time = (time.perf_counter() - start) / repeat
+        
+        self.stdout.write(f'{label:>10} {active_time * 1000:10.2f} '
+                          f'{student_time * 1000:11.2f}')
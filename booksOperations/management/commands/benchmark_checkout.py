@@ -0,0 +1,115 @@
+import statistics
+import threading
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections
+
+from booksOperations import benchmark, services
+from booksOperations.benchmark import FIRST_INSTANCE_ID, FIRST_STUDENT_ID
+
+
+class Command(BaseCommand):
+    help = '''Simulates several scan stations issuing and returning books \
+at the same time against a test copy of the configured database \
+and reports the throughput and the time spent waiting for locks'''
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stations',
+            type=int,
+            nargs='+',
+            default=[1, 2, 4, 8],
+            help='the numbers of concurrent stations to measure',
+        )
+        parser.add_argument(
+            '--scans',
+            type=int,
+            default=50,
+            help='how many books each station issues and takes back',
+        )
+    
+    def handle(self, *args, stations, scans, **options):
+        # The stations need committed rows, so a rolled back transaction
+        # won't do: the synthetic rows go to a fresh test database made
+        # with the same settings and dropped afterwards.
+        test = connection.settings_dict['TEST']
+        if connection.vendor == 'sqlite' and not test.get('NAME'):
+            # a file like the real one, not the shared in-memory database
+            test['NAME'] = connection.settings_dict['NAME'] + '.benchmark'
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.measure(stations, scans)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+    
+    def measure(self, stations, scans):
+        most = max(stations)
+        benchmark.create_synthetic_rows(most * scans, most)
+        
+        self.stdout.write(
+            f'{connection.vendor}, {scans} issues and returns per station')
+        self.stdout.write(
+            f'{"stations":>8} {"ops/s":>8} {"p50, ms":>8} '
+            f'{"p99, ms":>8} {"lock wait, s":>12} {"errors":>6}')
+        
+        baseline = None
+        for number in sorted(stations):
+            latencies, errors, total = self.run(number, scans)
+            latencies.sort()
+            median = statistics.median(latencies)
+            if baseline is None:
+                baseline = median
+            # the time above the latency of an uncontended operation
+            lock_wait = sum(max(0, latency - baseline)
+                            for latency in latencies)
+            
+            self.stdout.write(
+                f'{number:8} {len(latencies) / total:8.1f} '
+                f'{median * 1000:8.1f} '
+                f'{latencies[int(len(latencies) * 0.99) - 1] * 1000:8.1f} '
+                f'{lock_wait:12.2f} {errors:6}')
+    
+    def run(self, stations, scans):
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        
+        def station(number):
+            student_id = FIRST_STUDENT_ID + number
+            own = []
+            failed = 0
+            try:
+                for n in range(scans):
+                    instance_id = FIRST_INSTANCE_ID + number * scans + n
+                    for operation, args in (
+                            (services.issue_books, ([instance_id], [student_id])),
+                            (services.return_books, ([instance_id],))):
+                        start = time.perf_counter()
+                        try:
+                            operation(*args)
+                        except (DatabaseError, ValidationError):
+                            failed += 1
+                            continue
+                        own.append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+            with lock:
+                latencies.extend(own)
+                errors.append(failed)
+        
+        threads = [threading.Thread(target=station, args=(number,))
+                   for number in range(stations)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        total = time.perf_counter() - start
+        
+        if not latencies:
+            raise CommandError('every operation failed')
+        return latencies, sum(errors), total
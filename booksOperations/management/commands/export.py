@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from booksOperations.export import DATASETS, FORMATS
+
+
+class Command(BaseCommand):
+    help = '''Exports the takings, their archive, the students \
+or the catalogue to a CSV or XLSX file, reading the database in chunks'''
+    
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS))
+        parser.add_argument(
+            '--format',
+            choices=sorted(FORMATS),
+            default='csv',
+        )
+        parser.add_argument(
+            '-o', '--output',
+            help='the file to write (default: the standard output)',
+        )
+    
+    def handle(self, *args, dataset, format, output=None, **options):
+        chunks, _ = FORMATS[format]
+        
+        if output is None:
+            for chunk in chunks(dataset):
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+        
+        with open(output, 'wb') as file:
+            for chunk in chunks(dataset):
+                file.write(chunk)
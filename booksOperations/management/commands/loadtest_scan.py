@@ -0,0 +1,110 @@
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booksRecord.models import BookInstance
+from readersRecord.models import Student
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = max(0, min(len(values) - 1,
+                       round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = '''Measures the latency of the scan endpoint \
+of a running server under several concurrent scan stations'''
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'url',
+            help='the full URL of the endpoint, '
+                 'e.g. http://localhost:8000/operations/scan/',
+        )
+        parser.add_argument('token', help='a token of a scan station')
+        parser.add_argument(
+            '--stations',
+            type=int,
+            default=4,
+            help='how many stations scan at the same time',
+        )
+        parser.add_argument(
+            '--scans',
+            type=int,
+            default=50,
+            help='how many books each station issues and takes back',
+        )
+    
+    def handle(self, *args, url, token, stations=4, scans=50, **options):
+        # every station works with its own instances,
+        # each of them is issued and then returned
+        instance_ids = list(
+            BookInstance.objects
+            .filter(status=BookInstance.IN_STORAGE)
+            .values_list('id', flat=True)[:stations * scans]
+        )
+        student_id = Student.objects.values_list('id', flat=True).first()
+        if len(instance_ids) < stations * scans or student_id is None:
+            raise CommandError(
+                'not enough instances in storage or no students to test with')
+        
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        
+        def post(payload):
+            request = urllib.request.Request(
+                url,
+                data=json.dumps(payload).encode(),
+                headers={
+                    'Content-Type': 'application/json',
+                    'Authorization': f'Token {token}',
+                },
+            )
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+            except urllib.error.URLError as error:
+                with lock:
+                    errors.append(error)
+                return
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+        
+        def station(ids):
+            for instance_id in ids:
+                post({'book_instance': instance_id, 'student': student_id})
+                post({'book_instance': instance_id})
+        
+        threads = [
+            threading.Thread(
+                target=station,
+                args=(instance_ids[n * scans:(n + 1) * scans],))
+            for n in range(stations)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        total = time.perf_counter() - start
+        
+        if not latencies:
+            raise CommandError(f'all requests failed, e.g.: {errors[0]}')
+        
+        self.stdout.write(
+            f'{len(latencies)} requests by {stations} station(s) '
+            f'in {total:.2f} s, {len(errors)} error(s)\n'
+            f'throughput: {len(latencies) / total:.1f} requests/s\n'
+            f'p50: {statistics.median(latencies) * 1000:.1f} ms\n'
+            f'p99: {percentile(latencies, 99) * 1000:.1f} ms'
+        )
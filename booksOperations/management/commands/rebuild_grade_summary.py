@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from booksOperations.models import GradeSummary
+
+
+class Command(BaseCommand):
+    help = '''Recomputes the summary of the books on hands \
+of every grade from the whole history of takings'''
+    
+    def handle(self, *args, **options):
+        GradeSummary.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'The summary has {GradeSummary.objects.count()} row(s)'))
@@ -0,0 +1,111 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from booksRecord.models import BookInstance
+from booksOperations.models import (
+    BookTaking, GradeSummary, OverdueSweep, TableVersion)
+
+
+def sweep_overdue(chunk_size=500, full=False, now=None):
+    '''
+    marks the instances of overdue, unreturned takings as EXPIRED;
+    only the takings which became overdue since the previous sweep
+    are looked at, unless `full` is given;
+    returns the number of instances changed
+    '''
+    
+    now = now or timezone.now()
+    since = None if full else OverdueSweep.get_mark()
+    
+    overdue = BookTaking.objects.filter(
+        is_returned=False,
+        when_returned__lt=now,
+    )
+    if since is not None:
+        overdue = overdue.filter(when_returned__gte=since)
+    
+    instance_ids = overdue.order_by().values_list('book_instance_id', flat=True)
+    
+    expired = 0
+    chunk = []
+    for instance_id in instance_ids.iterator(chunk_size=chunk_size):
+        chunk.append(instance_id)
+        if len(chunk) >= chunk_size:
+            expired += _expire(chunk)
+            chunk = []
+    if chunk:
+        expired += _expire(chunk)
+    
+    OverdueSweep.set_mark(now)
+    return expired
+
+
+def _expire(instance_ids):
+    # the takings stay outstanding and become overdue in the grade summary
+    rows = list(BookTaking.objects.filter(
+        book_instance_id__in=instance_ids,
+        book_instance__status=BookInstance.ON_HANDS,
+        is_returned=False,
+    ).values_list('student__grade', 'book_instance__book_id'))
+    GradeSummary.recount(
+        [(grade, book_id, False, BookInstance.ON_HANDS)
+         for grade, book_id in rows],
+        [(grade, book_id, False, BookInstance.EXPIRED)
+         for grade, book_id in rows])
+    
+    expired = BookInstance.objects.filter(
+        id__in=instance_ids,
+        status=BookInstance.ON_HANDS,
+    ).set_status(BookInstance.EXPIRED)
+    if expired:
+        TableVersion.bump(BookInstance)
+    return expired
+
+
+class Command(BaseCommand):
+    help = '''Marks the books which should have been returned \
+by now as expired'''
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--daemon',
+            action='store_true',
+            help='keep running and sweep every --interval seconds',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=600,
+            help='seconds between sweeps in the daemon mode',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='how many instances are updated by one query',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='ignore the mark of the previous sweep and look at all takings',
+        )
+    
+    def handle(self, *args, daemon=False, interval=600, chunk_size=500,
+               full=False, **options):
+        try:
+            while True:
+                with transaction.atomic():
+                    expired = sweep_overdue(chunk_size=chunk_size, full=full)
+                self.stdout.write(
+                    f'{timezone.now():%Y-%m-%d %H:%M:%S}: '
+                    f'{expired} instance(s) marked as expired')
+                
+                if not daemon:
+                    break
+                full = False
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
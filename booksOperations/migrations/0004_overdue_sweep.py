@@ -0,0 +1,34 @@
+# Generated by Django 2.2.1 on 2026-10-18 12:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booksOperations', '0003_auto_20200821_1057'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverdueSweep',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('swept_until', models.DateTimeField(verbose_name='обработано до')),
+            ],
+            options={
+                'verbose_name': 'проход по просроченным книгам',
+                'verbose_name_plural': 'проходы по просроченным книгам',
+            },
+        ),
+        migrations.AlterField(
+            model_name='booktaking',
+            name='book_instance',
+            field=models.ForeignKey(limit_choices_to={'status': 0}, on_delete=django.db.models.deletion.CASCADE, to='booksRecord.BookInstance', verbose_name='экземпляр книги'),
+        ),
+        migrations.AddIndex(
+            model_name='booktaking',
+            index=models.Index(fields=['is_returned', 'when_returned'], name='booksOperat_is_retu_15d643_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 2.2.1 on 2026-10-18 12:41
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+import django.db.models.deletion
+
+
+def fill_grade_summary(apps, schema_editor):
+    BookTaking = apps.get_model('booksOperations', 'BookTaking')
+    GradeSummary = apps.get_model('booksOperations', 'GradeSummary')
+    
+    active = Q(is_returned=False)
+    rows = (
+        BookTaking.objects.order_by()
+        .values_list('student__grade', 'book_instance__book_id')
+        .annotate(
+            outstanding=Count('id', filter=active),
+            overdue=Count('id', filter=active & Q(book_instance__status=2)),
+            returned=Count('id', filter=~active),
+        )
+    )
+    GradeSummary.objects.bulk_create(
+        [GradeSummary(grade=grade, book_id=book_id, outstanding=outstanding,
+                      overdue=overdue, returned=returned)
+         for grade, book_id, outstanding, overdue, returned in rows],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booksRecord', '0016_book_fts'),
+        ('booksOperations', '0004_overdue_sweep'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradeSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grade', models.PositiveSmallIntegerField(choices=[('1 классы', ((1, '1 «А»'), (2, '1 «Б»'), (3, '1 «В»'), (4, '1 «Г»'), (5, '1 «Д»'), (6, '1 «Е»'), (7, '1 «Ж»'))), ('2 классы', ((8, '2 «А»'), (9, '2 «Б»'), (10, '2 «В»'), (11, '2 «Г»'), (12, '2 «Д»'), (13, '2 «Е»'), (14, '2 «Ж»'))), ('3 классы', ((15, '3 «А»'), (16, '3 «Б»'), (17, '3 «В»'), (18, '3 «Г»'), (19, '3 «Д»'), (20, '3 «Е»'), (21, '3 «Ж»'))), ('4 классы', ((22, '4 «А»'), (23, '4 «Б»'), (24, '4 «В»'), (25, '4 «Г»'), (26, '4 «Д»'), (27, '4 «Е»'), (28, '4 «Ж»'))), ('5 классы', ((29, '5 «А»'), (30, '5 «Б»'), (31, '5 «В»'), (32, '5 «Г»'), (33, '5 «Д»'), (34, '5 «Е»'), (35, '5 «Ж»'))), ('6 классы', ((36, '6 «А»'), (37, '6 «Б»'), (38, '6 «В»'), (39, '6 «Г»'), (40, '6 «Д»'), (41, '6 «Е»'), (42, '6 «Ж»'))), ('7 классы', ((43, '7 «А»'), (44, '7 «Б»'), (45, '7 «В»'), (46, '7 «Г»'), (47, '7 «Д»'), (48, '7 «Е»'), (49, '7 «Ж»'))), ('8 классы', ((50, '8 «А»'), (51, '8 «Б»'), (52, '8 «В»'), (53, '8 «Г»'), (54, '8 «Д»'), (55, '8 «Е»'), (56, '8 «Ж»'))), ('9 классы', ((57, '9 «А»'), (58, '9 «Б»'), (59, '9 «В»'), (60, '9 «Г»'), (61, '9 «Д»'), (62, '9 «Е»'), (63, '9 «Ж»'))), ('10 классы', ((64, '10 «А»'), (65, '10 «Б»'), (66, '10 «В»'), (67, '10 «Г»'), (68, '10 «Д»'), (69, '10 «Е»'), (70, '10 «Ж»'))), ('11 классы', ((71, '11 «А»'), (72, '11 «Б»'), (73, '11 «В»'), (74, '11 «Г»'), (75, '11 «Д»'), (76, '11 «Е»'), (77, '11 «Ж»')))], verbose_name='класс')),
+                ('outstanding', models.PositiveIntegerField(default=0, verbose_name='на руках')),
+                ('overdue', models.PositiveIntegerField(default=0, verbose_name='просрочено')),
+                ('returned', models.PositiveIntegerField(default=0, verbose_name='возвращено')),
+                ('book', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='booksRecord.Book', verbose_name='книга')),
+            ],
+            options={
+                'verbose_name': 'сводка по классу',
+                'verbose_name_plural': 'сводки по классам',
+                'ordering': ['grade', 'book'],
+                'unique_together': {('grade', 'book')},
+            },
+        ),
+        migrations.RunPython(fill_grade_summary, migrations.RunPython.noop),
+    ]
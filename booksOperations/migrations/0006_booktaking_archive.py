@@ -0,0 +1,32 @@
+# Generated by Django 2.2.1 on 2026-10-18 12:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readersRecord', '0005_student_name_search'),
+        ('booksRecord', '0016_book_fts'),
+        ('booksOperations', '0005_grade_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookTakingArchive',
+            fields=[
+                ('id', models.PositiveIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('when_taken', models.DateTimeField(verbose_name='Дата и время взятия')),
+                ('when_returned', models.DateTimeField(null=True, verbose_name='Дата и время возврата')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='перенесён в архив')),
+                ('book_instance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='booksRecord.BookInstance', verbose_name='экземпляр книги')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='readersRecord.Student', verbose_name='ученик')),
+            ],
+            options={
+                'verbose_name': 'архивный акт взятия книги',
+                'verbose_name_plural': 'архив актов взятия книг',
+                'ordering': ['-when_taken'],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.1 on 2026-10-18 12:46
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_active_takings(apps, schema_editor):
+    BookTaking = apps.get_model('booksOperations', 'BookTaking')
+    
+    doubled = list(
+        BookTaking.objects.filter(is_returned=False).order_by()
+        .values_list('book_instance_id', flat=True)
+        .annotate(number=Count('id')).filter(number__gt=1)
+    )
+    if doubled:
+        raise RuntimeError(
+            f'book instances {doubled} have several active takings, '
+            f'close the wrong ones before migrating')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booksOperations', '0006_booktaking_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_active_takings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='booktaking',
+            constraint=models.UniqueConstraint(condition=models.Q(is_returned=False), fields=('book_instance',), name='booktaking_one_active_per_instance'),
+        ),
+    ]
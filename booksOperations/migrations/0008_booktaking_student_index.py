@@ -0,0 +1,29 @@
+# Generated by Django 2.2.1 on 2026-10-18 12:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booksOperations', '0007_booktaking_one_active'),
+    ]
+
+    operations = [
+        # the new index first, so that the takings of a student
+        # are never left without one
+        migrations.AddIndex(
+            model_name='booktaking',
+            index=models.Index(fields=['student', 'is_returned'], name='booksOperat_student_18613b_idx'),
+        ),
+        migrations.AlterField(
+            model_name='booktaking',
+            name='student',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='readersRecord.Student', verbose_name='ученик'),
+        ),
+        migrations.RemoveIndex(
+            model_name='booktaking',
+            name='booksOperat_is_retu_ad2996_idx',
+        ),
+    ]
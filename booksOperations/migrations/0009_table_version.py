@@ -0,0 +1,24 @@
+# Generated by Django 2.2.1 on 2026-10-18 12:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booksOperations', '0008_booktaking_student_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableVersion',
+            fields=[
+                ('table', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='таблица')),
+                ('version', models.PositiveIntegerField(default=0, verbose_name='версия')),
+            ],
+            options={
+                'verbose_name': 'версия таблицы',
+                'verbose_name_plural': 'версии таблиц',
+            },
+        ),
+    ]
@@ -1,10 +1,55 @@
-from django.db import models
+import logging
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, IntegrityError, models, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save,
+)
+from django.dispatch import receiver
 from datetime import timedelta
 from django.utils import timezone
 
 from django.conf import settings
 
 import booksRecord, readersRecord
+from booksRecord import catalogue
+import core
+
+
+logger = logging.getLogger(__name__)
+
+# The values describing how a taking is counted in GradeSummary,
+# see summary_changes.
+SUMMARY_ROW = ('student__grade', 'book_instance__book_id',
+               'is_returned', 'book_instance__status')
+
+
+def summary_changes(rows, sign=1, changes=None):
+    '''
+    turns SUMMARY_ROW tuples of takings into the changes of GradeSummary:
+    {(grade, book_id): [outstanding, overdue, returned]};
+    sign=-1 gives the changes for taking them away
+    '''
+    
+    changes = {} if changes is None else changes
+    for grade, book_id, is_returned, status in rows:
+        change = changes.setdefault((grade, book_id), [0, 0, 0])
+        if is_returned:
+            change[2] += sign
+        else:
+            change[0] += sign
+            if status == booksRecord.models.BookInstance.EXPIRED:
+                change[1] += sign
+    return changes
+
+
+class AlreadyTaken(ValidationError):
+    '''
+    the book instance is already on hands:
+    someone else has taken it first
+    '''
 
 
 class BookTaking(models.Model):
@@ -27,9 +72,11 @@ class BookTaking(models.Model):
         verbose_name="экземпляр книги",
     )
     
+    # indexed together with is_returned, see Meta
     student = models.ForeignKey(
         readersRecord.models.Student,
         on_delete=models.CASCADE,
+        db_index=False,
         verbose_name="ученик"
     )
     
@@ -50,22 +97,477 @@ class BookTaking(models.Model):
     )
     
     
+    @property
+    def is_overdue(self):
+        return (not self.is_returned
+                and self.when_returned is not None
+                and self.when_returned < timezone.now())
+    
     def save(self, *args, **kwargs):
-        if not self.is_returned:
-            self.book_instance.status = booksRecord.models.BookInstance.ON_HANDS
-        else:
-            self.book_instance.status = booksRecord.models.BookInstance.IN_STORAGE
+        BookInstance = booksRecord.models.BookInstance
         
-        self.book_instance.save()           
-        super().save(*args, **kwargs)
+        # the instance's status and the book's counters
+        # must change together with the taking
+        with transaction.atomic():
+            old = None
+            if self.pk is not None:
+                old = BookTaking.objects.filter(pk=self.pk) \
+                    .values_list(*SUMMARY_ROW).first()
+            
+            if old is None:
+                # a new taking may only take an instance from the storage
+                expected = BookInstance.IN_STORAGE
+            else:
+                expected = None
+                if self.is_returned and not old[2]:
+                    # the book is being returned right now
+                    self.when_returned = timezone.now()
+            
+            if self.is_overdue:
+                status = BookInstance.EXPIRED
+            elif not self.is_returned:
+                status = BookInstance.ON_HANDS
+            else:
+                status = BookInstance.IN_STORAGE
+            
+            if not self.book_instance.change_status(status, expected):
+                raise AlreadyTaken(
+                    'экземпляр %(id)s уже выдан или изменён, '
+                    'обновите страницу',
+                    params={'id': self.book_instance_id})
+            
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+            except IntegrityError:
+                # the status was stale, but the constraint
+                # has noticed the other active taking
+                if self.is_returned or not BookTaking.active_ids(
+                        [self.book_instance_id], exclude=self.pk):
+                    raise
+                raise AlreadyTaken(
+                    'экземпляр %(id)s уже выдан',
+                    params={'id': self.book_instance_id})
+            
+            GradeSummary.recount(
+                [old] if old else [],
+                [(self.student.grade, self.book_instance.book_id,
+                  self.is_returned, status)])
     
     
+    @classmethod
+    def active_ids(cls, book_instance_ids, exclude=None):
+        '''
+        returns those of the instances which are on hands,
+        not counting the taking with the pk `exclude`
+        '''
+        
+        takings = cls.objects.filter(book_instance_id__in=book_instance_ids,
+                                     is_returned=False)
+        if exclude is not None:
+            takings = takings.exclude(pk=exclude)
+        return sorted(takings.values_list('book_instance_id', flat=True))
+    
     def __str__(self):
         return str(self.book_instance)
     
     class Meta:
-        indexes = (models.Index(fields=('is_returned',)),)
+        # see `manage.py audit_indexes` for the queries they serve
+        indexes = (
+            # the takings of a student, all or the active ones
+            models.Index(fields=('student', 'is_returned')),
+            # the overdue sweep and the archiving, also serves
+            # the filters by is_returned alone
+            models.Index(fields=('is_returned', 'when_returned')),
+        )
+        constraints = (
+            # one instance can't be on hands of two students at once,
+            # whatever the scan stations think its status is
+            models.UniqueConstraint(
+                fields=('book_instance',),
+                condition=Q(is_returned=False),
+                name='booktaking_one_active_per_instance',
+            ),
+        )
         get_latest_by = "when_taken"
         ordering = ['is_returned', "when_taken"]
         verbose_name_plural = 'акты взятия книг'
         verbose_name = 'акт взятия книги'
+
+
+class OverdueSweep(models.Model):
+    '''
+    Отметка о последнем проходе `manage.py sweep_overdue`:
+    все акты взятия книг со сроком возврата раньше swept_until
+    уже обработаны, следующий проход начнётся с неё.
+    '''
+    
+    swept_until = models.DateTimeField(
+        verbose_name='обработано до',
+    )
+    
+    @classmethod
+    def get_mark(cls):
+        sweep = cls.objects.order_by('-swept_until').first()
+        return sweep.swept_until if sweep else None
+    
+    @classmethod
+    def set_mark(cls, swept_until):
+        updated = cls.objects.update(swept_until=swept_until)
+        if not updated:
+            cls.objects.create(swept_until=swept_until)
+    
+    def __str__(self):
+        return str(self.swept_until)
+    
+    class Meta:
+        verbose_name = 'проход по просроченным книгам'
+        verbose_name_plural = 'проходы по просроченным книгам'
+
+
+class BookTakingArchive(models.Model):
+    '''
+    Давно возвращённые книги, перенесённые из актов взятия книг
+    командой `manage.py archive_takings`, чтобы таблица
+    :model:`booksOperations.BookTaking` оставалась небольшой.
+    Идентификатор совпадает с идентификатором исходного акта.
+    '''
+    
+    id = models.PositiveIntegerField(
+        primary_key=True,
+        verbose_name='ID',
+    )
+    
+    book_instance = models.ForeignKey(
+        booksRecord.models.BookInstance,
+        on_delete=models.CASCADE,
+        verbose_name="экземпляр книги",
+    )
+    
+    student = models.ForeignKey(
+        readersRecord.models.Student,
+        on_delete=models.CASCADE,
+        verbose_name="ученик"
+    )
+    
+    when_taken = models.DateTimeField(
+        verbose_name="Дата и время взятия"
+    )
+    
+    when_returned = models.DateTimeField(
+        null=True,
+        verbose_name="Дата и время возврата"
+    )
+    
+    archived_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='перенесён в архив',
+    )
+    
+    def __str__(self):
+        return str(self.book_instance)
+    
+    class Meta:
+        ordering = ['-when_taken']
+        verbose_name = 'архивный акт взятия книги'
+        verbose_name_plural = 'архив актов взятия книг'
+
+
+class GradeSummary(models.Model):
+    '''
+    Сводка по классам: сколько экземпляров каждой книги ученики класса
+    держат на руках, сколько из них просрочено и сколько уже вернули.\n
+    Обновляется вместе с актами взятия книг и массовыми операциями,
+    пересчитывается командой `manage.py rebuild_grade_summary`.
+    Учитывается текущий класс ученика; возвращённые книги
+    считаются вместе с архивом.
+    '''
+    
+    grade = models.PositiveSmallIntegerField(
+        choices=core.GRADES,
+        verbose_name='класс',
+    )
+    
+    book = models.ForeignKey(
+        booksRecord.models.Book,
+        on_delete=models.CASCADE,
+        db_index=False,
+        verbose_name='книга',
+    )
+    
+    outstanding = models.PositiveIntegerField(
+        default=0,
+        verbose_name='на руках',
+    )
+    
+    overdue = models.PositiveIntegerField(
+        default=0,
+        verbose_name='просрочено',
+    )
+    
+    returned = models.PositiveIntegerField(
+        default=0,
+        verbose_name='возвращено',
+    )
+    
+    # the numbers in the order of summary_changes
+    NUMBERS = ('outstanding', 'overdue', 'returned')
+    
+    @classmethod
+    def recount(cls, old_rows=(), new_rows=()):
+        '''
+        the way to keep the summary up to date: takes away the takings
+        as they were counted (old_rows) and counts them as they are now
+        (new_rows); both are SUMMARY_ROW tuples, a new taking has
+        no old row and a deleted one has no new row
+        '''
+        
+        changes = summary_changes(old_rows, sign=-1)
+        summary_changes(new_rows, changes=changes)
+        cls.shift_many(changes)
+    
+    @classmethod
+    def move_students(cls, grades):
+        '''
+        recounts the takings of the students, {student id: new grade},
+        in their new grades; call it before the grades are saved
+        '''
+        
+        rows = list(BookTaking.objects.filter(student_id__in=list(grades))
+                    .values_list('student_id', *SUMMARY_ROW))
+        rows += [
+            (student_id, grade, book_id, True, status)
+            for student_id, grade, book_id, status
+            in BookTakingArchive.objects.filter(student_id__in=list(grades))
+            .values_list('student_id', 'student__grade',
+                         'book_instance__book_id', 'book_instance__status')
+        ]
+        cls.recount(
+            [row[1:] for row in rows],
+            [(grades[student_id], book_id, is_returned, status)
+             for student_id, _, book_id, is_returned, status in rows])
+    
+    @classmethod
+    def shift_many(cls, changes):
+        '''
+        applies the changes made by summary_changes with F() expressions;
+        the numbers don't go below zero, a summary which has drifted
+        is fixed by `manage.py rebuild_grade_summary`
+        '''
+        
+        for (grade, book_id), numbers in changes.items():
+            if not any(numbers):
+                continue
+            
+            rows = cls.objects.filter(grade=grade, book_id=book_id)
+            shifted = {
+                name: Greatest(F(name) + number, 0)
+                for name, number in zip(cls.NUMBERS, numbers)
+            }
+            if rows.update(**shifted):
+                continue
+            
+            if min(numbers) < 0:
+                logger.warning(
+                    'the grade summary of grade %s, book %s has drifted, '
+                    'run `manage.py rebuild_grade_summary`', grade, book_id)
+            try:
+                with transaction.atomic():
+                    cls.objects.create(
+                        grade=grade, book_id=book_id,
+                        **{name: max(number, 0)
+                           for name, number in zip(cls.NUMBERS, numbers)})
+            except IntegrityError:
+                if not rows.exists():
+                    raise
+                # created by a concurrent transaction in the meantime
+                rows.update(**shifted)
+    
+    @classmethod
+    def rebuild(cls):
+        '''
+        recomputes the whole summary by one grouped query
+        '''
+        
+        active = Q(is_returned=False)
+        rows = (
+            BookTaking.objects.order_by()
+            .values_list('student__grade', 'book_instance__book_id')
+            .annotate(
+                outstanding=Count('id', filter=active),
+                overdue=Count('id', filter=active & Q(
+                    book_instance__status=booksRecord.models.BookInstance.EXPIRED)),
+                returned=Count('id', filter=~active),
+            )
+        )
+        
+        summary = {
+            (grade, book_id): cls(
+                grade=grade, book_id=book_id, outstanding=outstanding,
+                overdue=overdue, returned=returned)
+            for grade, book_id, outstanding, overdue, returned in rows
+        }
+        archived = (
+            BookTakingArchive.objects.order_by()
+            .values_list('student__grade', 'book_instance__book_id')
+            .annotate(returned=Count('id'))
+        )
+        for grade, book_id, returned in archived:
+            row = summary.setdefault(
+                (grade, book_id), cls(grade=grade, book_id=book_id))
+            row.returned += returned
+        
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(summary.values(), batch_size=500)
+    
+    def __str__(self):
+        return f'{core.GRADE_LABELS.get(self.grade, self.grade)}: {self.book}'
+    
+    class Meta:
+        unique_together = (('grade', 'book'),)
+        ordering = ['grade', 'book']
+        verbose_name = 'сводка по классу'
+        verbose_name_plural = 'сводки по классам'
+
+
+class _PendingBump:
+    # the tables changed by the current transaction,
+    # their versions are bumped once, after the commit
+    
+    def __init__(self, labels):
+        self.labels = labels
+    
+    def __call__(self):
+        try:
+            TableVersion.bump_labels(sorted(self.labels))
+        except DatabaseError:
+            # the changes are committed already, the caller must not
+            # take them for failed ones
+            logger.exception('the versions of %s are not bumped, the cached '
+                             'pages are stale until their next change',
+                             ', '.join(sorted(self.labels)))
+
+
+class TableVersion(models.Model):
+    '''
+    Счётчик изменений таблицы: растёт при каждом изменении её строк.
+    По нему API строит ETag, см. :mod:`booksOperations.api`.\n
+    Сохранение и удаление отдельных объектов увеличивают счётчик
+    сигналами, массовые операции вызывают bump сами.
+    По версиям книг и экземпляров строятся и ключи кэша каталога,
+    см. :mod:`booksRecord.catalogue`.\n
+    Счётчик увеличивается один раз после фиксации транзакции,
+    а не при каждом сохранении внутри неё: иначе блокировка его строки
+    держалась бы до конца транзакции, и на PostgreSQL все выдачи
+    и возвраты книг шли бы по очереди. Цена этого — короткое окно
+    между фиксацией и увеличением, когда кэш и ETag ещё отдают
+    старые данные, а если процесс упадёт в это окно, то до следующего
+    изменения таблицы.
+    '''
+    
+    # the label of the model, e.g. "booksRecord.Book"
+    table = models.CharField(
+        max_length=64,
+        primary_key=True,
+        verbose_name='таблица',
+    )
+    
+    version = models.PositiveIntegerField(
+        default=0,
+        verbose_name='версия',
+    )
+    
+    @classmethod
+    def bump(cls, *model_classes):
+        '''
+        bumps the versions of the tables of the models
+        when the current transaction is committed, at once outside one
+        '''
+        
+        # the cached catalogue is keyed by the versions of its tables
+        if any(model._meta.label in catalogue.MODELS
+               for model in model_classes):
+            catalogue.changed()
+        
+        labels = {model._meta.label for model in model_classes}
+        connection = transaction.get_connection()
+        pending = next((function for _, function in connection.run_on_commit
+                        if isinstance(function, _PendingBump)), None)
+        if pending is not None:
+            pending.labels |= labels
+            return
+        
+        pending = _PendingBump(labels)
+        # runs at once outside a transaction
+        transaction.on_commit(pending)
+    
+    @classmethod
+    def bump_labels(cls, labels):
+        for label in labels:
+            rows = cls.objects.filter(table=label)
+            if rows.update(version=F('version') + 1):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(table=label, version=1)
+            except IntegrityError:
+                # created by a concurrent transaction in the meantime
+                rows.update(version=F('version') + 1)
+    
+    @classmethod
+    def get(cls, *model_classes):
+        '''
+        returns the versions of the tables of the models, in their order
+        '''
+        
+        versions = dict(cls.objects.filter(
+            table__in=[model._meta.label for model in model_classes]
+        ).values_list('table', 'version'))
+        return tuple(versions.get(model._meta.label, 0)
+                     for model in model_classes)
+    
+    def __str__(self):
+        return f'{self.table}: {self.version}'
+    
+    class Meta:
+        verbose_name = 'версия таблицы'
+        verbose_name_plural = 'версии таблиц'
+
+
+@receiver(post_save, sender=booksRecord.models.Book)
+@receiver(post_delete, sender=booksRecord.models.Book)
+@receiver(post_save, sender=booksRecord.models.BookInstance)
+@receiver(post_delete, sender=booksRecord.models.BookInstance)
+@receiver(post_save, sender=readersRecord.models.Student)
+@receiver(post_delete, sender=readersRecord.models.Student)
+def _bump_table_version(sender, raw=False, **kwargs):
+    if not raw:
+        TableVersion.bump(sender)
+
+
+@receiver(post_save, sender=BookTaking)
+@receiver(post_delete, sender=BookTaking)
+def _bump_taking_versions(sender, raw=False, **kwargs):
+    # BookTaking.save changes the instance's status with an UPDATE
+    if not raw:
+        TableVersion.bump(BookTaking, booksRecord.models.BookInstance)
+
+
+@receiver(pre_delete, sender=BookTaking)
+def _discount_deleted_taking(sender, instance, **kwargs):
+    GradeSummary.recount(
+        BookTaking.objects.filter(pk=instance.pk).values_list(*SUMMARY_ROW))
+
+
+@receiver(pre_save, sender=readersRecord.models.Student)
+def _move_student_summary(sender, instance, raw=False, **kwargs):
+    # the summary counts the current grade of the student
+    if raw or instance.pk is None:
+        return
+    old_grade = readersRecord.models.Student.objects \
+        .filter(pk=instance.pk).values_list('grade', flat=True).first()
+    if old_grade is None or old_grade == instance.grade:
+        return
+    
+    GradeSummary.move_students({instance.pk: instance.grade})
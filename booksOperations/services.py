@@ -0,0 +1,152 @@
+'''
+Операции выдачи и возврата сразу многих экземпляров книг,
+например комплекта учебников на целый класс.
+Каждая операция выполняется в одной транзакции
+и за постоянное число запросов, независимо от размера комплекта.
+'''
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from booksRecord.models import BookInstance
+from readersRecord.models import Student
+from . import loans, models
+
+
+def _unique(ids, name):
+    ids = list(ids)
+    if not ids:
+        raise ValidationError(f'список {name} пуст')
+    if len(set(ids)) != len(ids):
+        raise ValidationError(f'в списке {name} есть повторы')
+    return ids
+
+
+def issue_books(book_instance_ids, student_ids):
+    '''
+    Выдаёт экземпляры книг ученикам.\n
+    Если передан один ученик, ему выдаются все экземпляры,
+    иначе экземпляры выдаются ученикам попарно:
+    первый — первому, второй — второму и т. д.\n
+    Возвращает список созданных актов взятия книг.\n
+    Если хоть один экземпляр уже выдан, выдача отменяется целиком
+    с ошибкой models.AlreadyTaken.
+    '''
+    
+    book_instance_ids = _unique(book_instance_ids, 'экземпляров')
+    student_ids = list(student_ids)
+    if len(student_ids) == 1:
+        student_ids *= len(book_instance_ids)
+    elif len(student_ids) != len(book_instance_ids):
+        raise ValidationError(
+            'число учеников должно быть равно 1 или числу экземпляров')
+    
+    with transaction.atomic():
+        instances = BookInstance.objects \
+            .select_for_update() \
+            .filter(id__in=book_instance_ids) \
+            .values_list('id', 'status', 'book_id')
+        statuses = {}
+        books = {}
+        for instance_id, status, book_id in instances:
+            statuses[instance_id] = status
+            books[instance_id] = book_id
+        
+        missing = [i for i in book_instance_ids if i not in statuses]
+        if missing:
+            raise ValidationError(
+                'экземпляры %(ids)s не найдены',
+                params={'ids': missing})
+        
+        busy = [i for i in book_instance_ids
+                if statuses[i] != BookInstance.IN_STORAGE]
+        if busy:
+            raise models.AlreadyTaken(
+                'экземпляры %(ids)s не находятся в хранилище',
+                params={'ids': busy})
+        
+        grades = dict(
+            Student.objects
+            .filter(id__in=set(student_ids))
+            .values_list('id', 'grade')
+        )
+        unknown = sorted(set(student_ids) - set(grades))
+        if unknown:
+            raise ValidationError(
+                'ученики %(ids)s не найдены',
+                params={'ids': unknown})
+        
+        try:
+            with transaction.atomic():
+                takings = models.BookTaking.objects.bulk_create(
+                    models.BookTaking(book_instance_id=instance_id,
+                                      student_id=student_id)
+                    for instance_id, student_id
+                    in zip(book_instance_ids, student_ids)
+                )
+        except IntegrityError:
+            # another station may have issued some of the instances
+            # after they were read above, see
+            # BookTaking.Meta.constraints
+            taken = models.BookTaking.active_ids(book_instance_ids)
+            if not taken:
+                raise
+            raise models.AlreadyTaken(
+                'экземпляры %(ids)s уже выданы',
+                params={'ids': taken})
+        BookInstance.objects.filter(id__in=book_instance_ids) \
+            .set_status(BookInstance.ON_HANDS)
+        models.TableVersion.bump(models.BookTaking, BookInstance)
+        
+        # bulk_create bypasses BookTaking.save
+        models.GradeSummary.recount(new_rows=(
+            (grades[student_id], books[instance_id],
+             False, BookInstance.ON_HANDS)
+            for instance_id, student_id in zip(book_instance_ids, student_ids)
+        ))
+    
+    # bulk_create sends no signals
+    loans.forget(set(student_ids))
+    return takings
+
+
+def return_books(book_instance_ids):
+    '''
+    Принимает обратно экземпляры книг.\n
+    Возвращает число закрытых актов взятия книг.
+    '''
+    
+    book_instance_ids = _unique(book_instance_ids, 'экземпляров')
+    
+    with transaction.atomic():
+        active = models.BookTaking.objects.select_for_update().filter(
+            book_instance_id__in=book_instance_ids,
+            is_returned=False,
+        )
+        rows = list(active.values_list(
+            'book_instance_id', 'student_id', *models.SUMMARY_ROW))
+        taken = {row[0]: row[1] for row in rows}
+        
+        not_taken = [i for i in book_instance_ids if i not in taken]
+        if not_taken:
+            raise ValidationError(
+                'экземпляры %(ids)s не числятся выданными',
+                params={'ids': not_taken})
+        
+        returned = active.update(is_returned=True,
+                                 when_returned=timezone.now())
+        BookInstance.objects.filter(id__in=book_instance_ids) \
+            .set_status(BookInstance.IN_STORAGE)
+        models.TableVersion.bump(models.BookTaking, BookInstance)
+        
+        # update bypasses BookTaking.save
+        rows = [row[2:] for row in rows]
+        models.GradeSummary.recount(
+            rows,
+            [(grade, book_id, True, status)
+             for grade, book_id, _, status in rows])
+    
+    # update sends no signals
+    loans.forget(set(taken.values()))
+    return returned
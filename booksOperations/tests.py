@@ -1,3 +1,1065 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed, ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import (
+    IntegrityError, OperationalError, connection, connections, transaction,
+)
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (
+    RequestFactory, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from autoLib import instrumentation
+from booksRecord import search
+from booksRecord.models import Book, BookInstance
+from booksRecord.tests import make_book
+from readersRecord.models import Student
+import core
+from . import benchmark, loans, models, services
+from .archive import archive_takings
+from .management.commands import audit_indexes
+from .management.commands.sweep_overdue import sweep_overdue
+
+
+def make_student(n, **kwargs):
+    fields = dict(
+        id=n,
+        second_name=f'Ученик{n}',
+        first_name='Иван',
+        grade=43,
+    )
+    fields.update(kwargs)
+    return Student.objects.create(**fields)
+
+
+class BulkOperationsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = make_book(1)
+        BookInstance.objects.bulk_create(
+            BookInstance(id=n, book=cls.book) for n in range(1, 101))
+        Book.objects.filter(pk=cls.book.pk).update(in_storage_count=100)
+        Student.objects.bulk_create(
+            Student(id=n, second_name=f'Ученик{n}', first_name='Иван',
+                    grade=43)
+            for n in range(1, 101))
+    
+    def test_issue_and_return(self):
+        takings = services.issue_books([1, 2, 3], [1, 2, 3])
+        self.assertEqual(len(takings), 3)
+        self.assertEqual(
+            models.BookTaking.objects.filter(is_returned=False).count(), 3)
+        self.assertEqual(
+            BookInstance.objects.filter(status=BookInstance.ON_HANDS).count(), 3)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.on_hands_count, 3)
+        
+        self.assertEqual(services.return_books([1, 2]), 2)
+        self.assertEqual(
+            list(BookInstance.objects.filter(status=BookInstance.ON_HANDS)
+                 .values_list('id', flat=True)), [3])
+    
+    def test_issue_to_one_student(self):
+        services.issue_books([1, 2], [5])
+        self.assertEqual(
+            models.BookTaking.objects.filter(student_id=5).count(), 2)
+    
+    def test_issue_is_all_or_nothing(self):
+        services.issue_books([1], [1])
+        with self.assertRaises(ValidationError):
+            services.issue_books([2, 1], [2, 3])
+        with self.assertRaises(ValidationError):
+            services.issue_books([2, 500], [2, 3])
+        with self.assertRaises(ValidationError):
+            services.issue_books([2, 3], [2, 500])
+        self.assertEqual(models.BookTaking.objects.count(), 1)
+    
+    def test_return_requires_active_taking(self):
+        with self.assertRaises(ValidationError):
+            services.return_books([1])
+    
+    def test_query_count_does_not_grow_with_batch_size(self):
+        # creates the grade summary row, later batches only update it
+        services.issue_books([100], [100])
+        services.return_books([100])
+        
+        counts = []
+        for size in (1, 10, 30):
+            ids = list(range(1, size + 1))
+            with CaptureQueriesContext(connection) as queries:
+                services.issue_books(ids, ids)
+            counts.append(len(queries))
+            services.return_books(ids)
+        
+        self.assertEqual(len(set(counts)), 1, counts)
+
+
+class BulkViewsTest(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+        book = make_book(1)
+        BookInstance.objects.create(id=1, book=book)
+        make_student(1)
+    
+    def post(self, name, data):
+        return self.client.post(
+            reverse(f'booksOperations:{name}'),
+            json.dumps(data), content_type='application/json')
+    
+    def test_issue_and_return(self):
+        response = self.post('bulk_issue',
+                             {'book_instances': [1], 'students': [1]})
+        self.assertEqual(response.json(), {'issued': 1})
+        
+        response = self.post('bulk_issue',
+                             {'book_instances': [1], 'students': [1]})
+        self.assertEqual(response.status_code, 409)
+        
+        response = self.post('bulk_return', {'book_instances': [1]})
+        self.assertEqual(response.json(), {'returned': 1})
+    
+    def test_bad_request(self):
+        response = self.post('bulk_issue', {'book_instances': 'all'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SweepOverdueTest(TestCase):
+    def setUp(self):
+        self.book = make_book(1)
+        for n in range(1, 4):
+            BookInstance.objects.create(id=n, book=self.book)
+        make_student(1)
+        services.issue_books([1, 2, 3], [1])
+    
+    def set_due(self, instance_id, days):
+        models.BookTaking.objects.filter(book_instance_id=instance_id) \
+            .update(when_returned=timezone.now() + timedelta(days=days))
+    
+    def expired_ids(self):
+        return set(
+            BookInstance.objects.filter(status=BookInstance.EXPIRED)
+            .values_list('id', flat=True))
+    
+    def test_sweep(self):
+        self.set_due(1, -2)
+        self.set_due(2, -1)
+        self.assertEqual(sweep_overdue(chunk_size=1), 2)
+        self.assertEqual(self.expired_ids(), {1, 2})
+        self.book.refresh_from_db()
+        self.assertEqual(
+            (self.book.on_hands_count, self.book.expired_count), (1, 2))
+    
+    def test_sweep_is_incremental(self):
+        self.set_due(1, -1)
+        sweep_overdue()
+        
+        # became overdue before the mark, so only a full sweep sees it
+        self.set_due(2, -2)
+        self.assertEqual(sweep_overdue(), 0)
+        self.assertEqual(sweep_overdue(full=True), 1)
+        
+        self.assertEqual(
+            sweep_overdue(now=timezone.now() + timedelta(days=30)), 1)
+        self.assertEqual(self.expired_ids(), {1, 2, 3})
+    
+    def test_returned_books_are_not_expired(self):
+        self.set_due(1, -1)
+        services.return_books([1])
+        self.assertEqual(sweep_overdue(), 0)
+    
+    def test_save_keeps_overdue_books_expired(self):
+        self.set_due(1, -1)
+        taking = models.BookTaking.objects.get(book_instance_id=1)
+        taking.save()
+        self.assertEqual(self.expired_ids(), {1})
+    
+    def test_command(self):
+        self.set_due(1, -1)
+        out = StringIO()
+        call_command('sweep_overdue', stdout=out)
+        self.assertIn('1 instance(s)', out.getvalue())
+
+
+@override_settings(BOOKSOPERATIONS_SCAN_TOKENS=['station-1'])
+class ScanViewTest(TestCase):
+    def setUp(self):
+        book = make_book(1)
+        BookInstance.objects.create(id=12345670, book=book)
+        make_student(1)
+    
+    def scan(self, data, token='station-1'):
+        return self.client.post(
+            reverse('booksOperations:scan'),
+            json.dumps(data), content_type='application/json',
+            HTTP_AUTHORIZATION=f'Token {token}')
+    
+    def test_issue_and_return(self):
+        response = self.scan({'book_instance': 12345670, 'student': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            BookInstance.objects.get(id=12345670).status,
+            BookInstance.ON_HANDS)
+        
+        response = self.scan({'book_instance': 12345670})
+        self.assertEqual(response.json(), {'returned': 12345670})
+    
+    def test_bad_checksum(self):
+        response = self.scan({'book_instance': 12345678, 'student': 1})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_unknown_station(self):
+        response = self.scan({'book_instance': 12345670}, token='nope')
+        self.assertEqual(response.status_code, 403)
+    
+    def test_does_not_touch_the_session(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.scan({'book_instance': 12345670, 'student': 1})
+        self.assertFalse(any(
+            'django_session' in query['sql'] or 'auth_user' in query['sql']
+            for query in queries))
+
+
+class BookTakingAdminQueriesTest(TestCase):
+    '''
+    The pages listing takings must not issue a query per taking.
+    '''
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        cls.student = make_student(1)
+        cls.other_student = make_student(2)
+        for n in range(1, 21):
+            BookInstance.objects.create(id=n, book=make_book(n))
+    
+    def setUp(self):
+        self.client.force_login(self.user)
+    
+    def count_queries(self, url):
+        # warm up the content types cache first
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+    
+    def assertConstantQueries(self, url, issue):
+        issue([1, 2])
+        few = self.count_queries(url)
+        issue(list(range(3, 21)))
+        self.assertEqual(self.count_queries(url), few)
+    
+    def test_changelist(self):
+        self.assertConstantQueries(
+            reverse('admin:booksOperations_booktaking_changelist'),
+            lambda ids: services.issue_books(ids, [1]))
+    
+    def test_student_inline(self):
+        self.assertConstantQueries(
+            reverse('admin:readersRecord_student_change', args=(1,)),
+            lambda ids: services.issue_books(ids, [1]))
+    
+    def test_book_instance_inline(self):
+        url = reverse('admin:booksRecord_bookinstance_change', args=(1,))
+        services.issue_books([1], [1])
+        services.return_books([1])
+        few = self.count_queries(url)
+        for _ in range(5):
+            services.issue_books([1], [2])
+            services.return_books([1])
+        self.assertEqual(self.count_queries(url), few)
+
+
+class DatabaseSettingsTest(TestCase):
+    def test_sqlite_pragmas(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            # 1 is NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertGreater(cursor.fetchone()[0], 0)
+
+
+@override_settings(AUTOLIB_INSTRUMENTATION=True)
+class RequestStatsTest(TestCase):
+    def setUp(self):
+        instrumentation.reset()
+        self.client.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+    
+    def test_fingerprint(self):
+        self.assertEqual(
+            instrumentation.fingerprint(
+                "SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?')
+    
+    def test_records_requests(self):
+        with self.assertLogs('autoLib.requests') as logs:
+            self.client.get(reverse('booksOperations:grade_dashboard'))
+        
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['view'], 'booksOperations:grade_dashboard')
+        self.assertEqual(line['status'], 200)
+        self.assertGreater(line['queries'], 0)
+        self.assertEqual(line['duplicates'], [])
+        
+        with self.assertLogs('autoLib.requests'):
+            response = self.client.get(reverse('request_stats'))
+        views = {row['view']: row for row in response.json()['views']}
+        dashboard = views['booksOperations:grade_dashboard']
+        self.assertEqual(dashboard['requests'], 1)
+        self.assertEqual(dashboard['queries']['p50'], line['queries'])
+    
+    def test_reports_repeated_queries(self):
+        def n_plus_one(request):
+            for n in range(6):
+                Book.objects.filter(isbn=n).exists()
+            return HttpResponse()
+        
+        middleware = instrumentation.RequestStatsMiddleware(n_plus_one)
+        with self.assertLogs('autoLib.requests') as logs:
+            middleware(RequestFactory().get('/'))
+        
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['view'], 'unresolved')
+        self.assertEqual(len(line['duplicates']), 1)
+        self.assertEqual(line['duplicates'][0]['count'], 6)
+        self.assertEqual(instrumentation.summary()[0]['with_duplicates'], 1)
+    
+    def test_measures_streamed_content(self):
+        def streamed(request):
+            def rows():
+                for n in range(3):
+                    yield str(Book.objects.filter(isbn=n).count())
+            return StreamingHttpResponse(rows())
+        
+        middleware = instrumentation.RequestStatsMiddleware(streamed)
+        with self.assertLogs('autoLib.requests') as logs:
+            response = middleware(RequestFactory().get('/'))
+            self.assertEqual(logs.records, [])
+            self.assertEqual(b''.join(response.streaming_content), b'000')
+        
+        line = json.loads(logs.records[0].getMessage())
+        self.assertTrue(line['streaming'])
+        self.assertEqual(line['queries'], 3)
+    
+    @override_settings(AUTOLIB_INSTRUMENTATION=False)
+    def test_off_by_default(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            instrumentation.RequestStatsMiddleware(lambda request: None)
+        self.client.get(reverse('booksOperations:grade_dashboard'))
+        self.assertEqual(instrumentation.summary(), [])
+
+
+class AuditIndexesTest(TestCase):
+    def test_circulation_queries_use_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('the plans of small tables differ elsewhere')
+        
+        out = StringIO()
+        call_command('audit_indexes', stdout=out)
+        scans = [line for line in out.getvalue().splitlines()
+                 if line.startswith('SCAN')]
+        for name in ('bookinstance_set', 'by status', 'loans.summary',
+                     'the student page', 'sweep_overdue', 'archive_takings'):
+            self.assertFalse([line for line in scans if name in line], name)
+    
+    def test_scanned_tables(self):
+        self.assertEqual(
+            audit_indexes.scanned_tables(
+                'SCAN t USING INDEX t_name\nSEARCH u USING INDEX u_id (id=?)'),
+            ['t'] if connection.vendor == 'sqlite' else [])
+
+
+class LoansSummaryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        book = make_book(1)
+        for n in range(1, 5):
+            BookInstance.objects.create(id=n, book=book)
+        self.student = make_student(1)
+    
+    def test_summary_is_cached_and_reset(self):
+        services.issue_books([1, 2, 3], [1])
+        services.return_books([3])
+        models.BookTaking.objects.filter(book_instance_id=2) \
+            .update(when_returned=timezone.now() - timedelta(days=1))
+        
+        loans.forget([1])
+        self.assertEqual(loans.summary(1),
+                         {'active': 2, 'overdue': 1, 'total': 3})
+        with self.assertNumQueries(0):
+            loans.summary(1)
+        
+        services.issue_books([4], [1])
+        self.assertEqual(loans.summary(1)['active'], 3)
+        
+        services.return_books([4])
+        self.assertEqual(loans.summary(1)['active'], 2)
+        
+        models.BookTaking.objects.get(book_instance_id=1).delete()
+        self.assertEqual(loans.summary(1)['total'], 3)
+        
+        taking = models.BookTaking.objects.get(book_instance_id=2)
+        taking.is_returned = True
+        taking.save()
+        self.assertEqual(loans.summary(1),
+                         {'active': 0, 'overdue': 0, 'total': 3})
+    
+    def test_student_page_shows_active_loans_only(self):
+        services.issue_books([1, 2], [1])
+        services.return_books([2])
+        
+        self.client.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+        response = self.client.get(
+            reverse('admin:readersRecord_student_change', args=(1,)))
+        
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual(
+            [form.instance.book_instance_id for form in formset.forms], [1])
+        self.assertContains(response, 'всего взято: 2')
+
+
+class GradeSummaryTest(TestCase):
+    def setUp(self):
+        self.algebra = make_book(1)
+        self.physics = make_book(2)
+        for n in range(1, 4):
+            BookInstance.objects.create(id=n, book=self.algebra)
+        BookInstance.objects.create(id=4, book=self.physics)
+        make_student(1, grade=58)
+        make_student(2, grade=58)
+        make_student(3, grade=1)
+    
+    def summary(self):
+        return {
+            (row.grade, row.book_id): (row.outstanding, row.overdue, row.returned)
+            for row in models.GradeSummary.objects.all()
+            if row.outstanding or row.overdue or row.returned
+        }
+    
+    def assertSummaryIsRebuildable(self):
+        summary = self.summary()
+        call_command('rebuild_grade_summary', stdout=StringIO())
+        self.assertEqual(self.summary(), summary)
+    
+    def test_follows_operations(self):
+        algebra, physics = self.algebra.isbn, self.physics.isbn
+        
+        services.issue_books([1, 2, 3, 4], [1, 2, 3, 1])
+        self.assertEqual(self.summary(), {
+            (58, algebra): (2, 0, 0),
+            (58, physics): (1, 0, 0),
+            (1, algebra): (1, 0, 0),
+        })
+        
+        models.BookTaking.objects.filter(book_instance_id=1) \
+            .update(when_returned=timezone.now() - timedelta(days=1))
+        sweep_overdue()
+        self.assertEqual(self.summary()[(58, algebra)], (2, 1, 0))
+        self.assertSummaryIsRebuildable()
+        
+        services.return_books([1, 4])
+        self.assertEqual(self.summary(), {
+            (58, algebra): (1, 0, 1),
+            (58, physics): (0, 0, 1),
+            (1, algebra): (1, 0, 0),
+        })
+        self.assertSummaryIsRebuildable()
+        
+        taking = models.BookTaking.objects.get(book_instance_id=2)
+        taking.is_returned = True
+        taking.save()
+        self.assertEqual(self.summary()[(58, algebra)], (0, 0, 2))
+        
+        models.BookTaking.objects.get(book_instance_id=3).delete()
+        self.assertNotIn((1, algebra), self.summary())
+        self.assertSummaryIsRebuildable()
+    
+    def test_follows_grade_change(self):
+        services.issue_books([1], [1])
+        student = Student.objects.get(id=1)
+        student.grade = 65
+        student.save()
+        self.assertEqual(self.summary(), {(65, self.algebra.isbn): (1, 0, 0)})
+    
+    def test_drift_does_not_break_loans(self):
+        algebra = self.algebra.isbn
+        services.issue_books([1, 2], [1])
+        models.GradeSummary.objects.update(outstanding=1)
+        
+        services.return_books([1, 2])
+        self.assertEqual(self.summary(), {(58, algebra): (0, 0, 2)})
+        
+        services.issue_books([3], [1])
+        models.GradeSummary.objects.all().delete()
+        with self.assertLogs('booksOperations.models', 'WARNING'):
+            services.return_books([3])
+        self.assertEqual(self.summary(), {(58, algebra): (0, 0, 1)})
+        
+        call_command('rebuild_grade_summary', stdout=StringIO())
+        self.assertEqual(self.summary(), {(58, algebra): (0, 0, 3)})
+    
+    def test_dashboard(self):
+        services.issue_books([1, 4], [1, 3])
+        self.client.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('booksOperations:grade_dashboard'))
+        self.assertContains(response, '9 «Б»')
+        self.assertContains(response, '1 «А»')
+        self.assertEqual(
+            sum('GradeSummary'.lower() in query['sql'].lower()
+                for query in queries), 1)
+        
+        response = self.client.get(
+            reverse('booksOperations:grade_dashboard'), {'grade': 1})
+        self.assertNotContains(response, '9 «Б»')
+
+
+class ArchiveTakingsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.book = make_book(1)
+        for n in range(1, 5):
+            BookInstance.objects.create(id=n, book=self.book)
+        make_student(1)
+        
+        services.issue_books([1, 2, 3, 4], [1])
+        services.return_books([1, 2, 3])
+        # 1 and 2 were returned long ago, 3 recently, 4 is on hands
+        models.BookTaking.objects.filter(book_instance_id__in=[1, 2, 4]) \
+            .update(when_returned=timezone.now() - timedelta(days=400))
+    
+    def test_moves_old_returned_takings(self):
+        summary = list(models.GradeSummary.objects
+                       .values_list('outstanding', 'overdue', 'returned'))
+        self.assertEqual(loans.summary(1)['total'], 4)
+        
+        call_command('archive_takings', '--batch-size=1', stdout=StringIO())
+        
+        self.assertEqual(
+            sorted(models.BookTaking.objects
+                   .values_list('book_instance_id', flat=True)), [3, 4])
+        self.assertEqual(
+            sorted(models.BookTakingArchive.objects
+                   .values_list('book_instance_id', flat=True)), [1, 2])
+        
+        self.assertEqual(
+            list(models.GradeSummary.objects
+                 .values_list('outstanding', 'overdue', 'returned')),
+            summary)
+        call_command('rebuild_grade_summary', stdout=StringIO())
+        self.assertEqual(
+            list(models.GradeSummary.objects
+                 .values_list('outstanding', 'overdue', 'returned')),
+            summary)
+        
+        cache.clear()
+        self.assertEqual(loans.summary(1)['total'], 4)
+    
+    def test_batches_fit_the_database(self):
+        with mock.patch.object(connection.ops, 'bulk_batch_size',
+                               return_value=1), \
+                CaptureQueriesContext(connection) as queries:
+            self.assertEqual(archive_takings(batch_size=1000), 2)
+        deletes = [query['sql'] for query in queries
+                   if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 2)
+    
+    def test_dry_run(self):
+        out = StringIO()
+        call_command('archive_takings', '--dry-run', stdout=out)
+        self.assertIn('2 taking(s)', out.getvalue())
+        self.assertEqual(models.BookTaking.objects.count(), 4)
+
+
+class BookTakingSaveTest(TestCase):
+    def setUp(self):
+        book = make_book(1)
+        self.instance = BookInstance.objects.create(id=1, book=book)
+        self.student = make_student(1)
+    
+    def take(self):
+        return models.BookTaking.objects.create(
+            book_instance=BookInstance.objects.get(id=1), student=self.student)
+    
+    def instance_updates(self, queries):
+        return [query['sql'] for query in queries
+                if query['sql'].startswith('UPDATE "booksRecord_bookinstance"')]
+    
+    def test_status_is_written_only_when_changed(self):
+        taking = self.take()
+        
+        taking = models.BookTaking.objects.get(pk=taking.pk)
+        taking.when_returned += timedelta(days=7)
+        with CaptureQueriesContext(connection) as queries:
+            taking.save()
+        self.assertEqual(self.instance_updates(queries), [])
+        
+        taking.is_returned = True
+        with CaptureQueriesContext(connection) as queries:
+            taking.save()
+        updates = self.instance_updates(queries)
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"status"', updates[0])
+        self.assertNotIn('"book_id"', updates[0])
+        
+        self.instance.refresh_from_db()
+        self.assertEqual(self.instance.status, BookInstance.IN_STORAGE)
+        self.assertEqual(Book.objects.get().in_storage_count, 1)
+    
+    def test_double_checkout_is_refused(self):
+        stale = BookInstance.objects.get(id=1)
+        self.take()
+        
+        with self.assertRaises(ValidationError):
+            models.BookTaking.objects.create(
+                book_instance=stale, student=self.student)
+        self.assertEqual(models.BookTaking.objects.count(), 1)
+        self.assertEqual(Book.objects.get().on_hands_count, 1)
+    
+    def test_return_sets_return_time(self):
+        taking = self.take()
+        self.assertGreater(taking.when_returned, timezone.now())
+        
+        taking.is_returned = True
+        taking.save()
+        self.assertLessEqual(
+            models.BookTaking.objects.get().when_returned, timezone.now())
+        
+        services.issue_books([1], [1])
+        before = timezone.now()
+        services.return_books([1])
+        self.assertGreaterEqual(
+            models.BookTaking.objects.latest('id').when_returned, before)
+
+
+class BookTakingAdminConflictTest(TestCase):
+    '''
+    Issuing an instance which is already on hands from the admin
+    gives a form error or a message, not a server error.
+    '''
+    
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+        BookInstance.objects.create(id=12345670, book=make_book(1))
+        make_student(1)
+        make_student(2)
+        self.url = reverse('admin:booksOperations_booktaking_add')
+        self.data = {'book_instance': 12345670, 'student': 2,
+                     'when_returned_0': '', 'when_returned_1': ''}
+    
+    def test_form_error(self):
+        services.issue_books([12345670], [1])
+        # the status is stale, the active taking is still there
+        BookInstance.objects.update(status=BookInstance.IN_STORAGE)
+        
+        response = self.client.post(self.url, self.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('book_instance', response.context['adminform'].form.errors)
+        self.assertEqual(models.BookTaking.objects.count(), 1)
+    
+    def test_lost_race(self):
+        # someone else takes the instance between the form and the save
+        with mock.patch.object(BookInstance, 'change_status',
+                               return_value=False):
+            response = self.client.post(self.url, self.data, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('уже выдан',
+                      ' '.join(map(str, response.context['messages'])))
+        self.assertEqual(models.BookTaking.objects.count(), 0)
+    
+    def test_inline_doubles(self):
+        url = reverse('admin:booksRecord_bookinstance_change',
+                      args=(12345670,))
+        response = self.client.post(url, {
+            'id': 12345670, 'book': 9780000000001,
+            'booktaking_set-TOTAL_FORMS': 2,
+            'booktaking_set-INITIAL_FORMS': 0,
+            'booktaking_set-0-student': 1,
+            'booktaking_set-0-book_instance': 12345670,
+            'booktaking_set-1-student': 2,
+            'booktaking_set-1-book_instance': 12345670,
+        })
+        self.assertEqual(response.status_code, 200)
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertTrue(formset.non_form_errors())
+        self.assertEqual(models.BookTaking.objects.count(), 0)
+
+
+@override_settings(BOOKSOPERATIONS_SCAN_TOKENS=['station-1'])
+class DoubleCheckoutTest(TestCase):
+    def setUp(self):
+        BookInstance.objects.create(id=12345670, book=make_book(1))
+        make_student(1)
+        make_student(2)
+    
+    def test_constraint(self):
+        models.BookTaking.objects.bulk_create(
+            [models.BookTaking(book_instance_id=12345670, student_id=1)])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            models.BookTaking.objects.bulk_create(
+                [models.BookTaking(book_instance_id=12345670, student_id=2)])
+        
+        # returned takings are not limited
+        models.BookTaking.objects.update(is_returned=True)
+        models.BookTaking.objects.bulk_create(
+            [models.BookTaking(book_instance_id=12345670, student_id=2)])
+    
+    def test_save_with_stale_status(self):
+        services.issue_books([12345670], [1])
+        # the status and the counters drifted, only the constraint can notice
+        BookInstance.objects.update(status=BookInstance.IN_STORAGE)
+        Book.objects.update(in_storage_count=1, on_hands_count=0)
+        
+        with self.assertRaises(models.AlreadyTaken):
+            models.BookTaking.objects.create(
+                book_instance=BookInstance.objects.get(), student_id=2)
+        self.assertEqual(models.BookTaking.objects.count(), 1)
+    
+    def test_other_integrity_errors_pass(self):
+        # e.g. a student deleted meanwhile, not a double checkout
+        with mock.patch.object(models.BookTaking.objects, 'bulk_create',
+                               side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError) as raised:
+                services.issue_books([12345670], [1])
+        self.assertNotIsInstance(raised.exception, models.AlreadyTaken)
+    
+    def test_conflict_response(self):
+        services.issue_books([12345670], [1])
+        # the status is stale, so only the constraint can notice
+        BookInstance.objects.update(status=BookInstance.IN_STORAGE)
+        
+        response = self.client.post(
+            reverse('booksOperations:scan'),
+            json.dumps({'book_instance': 12345670, 'student': 2}),
+            content_type='application/json',
+            HTTP_AUTHORIZATION='Token station-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(
+            list(models.BookTaking.objects.values_list('student_id', flat=True)),
+            [1])
+
+
+class TableVersionTest(TransactionTestCase):
+    def tearDown(self):
+        # the index is not a model table, so it is not flushed
+        search.get_backend().rebuild()
+    
+    def test_bumped_once_after_the_commit(self):
+        make_book(1)
+        version = models.TableVersion.get(Book)[0]
+        
+        with transaction.atomic():
+            make_book(2)
+            make_book(3)
+            # the row is not locked till the end of the transaction
+            self.assertEqual(models.TableVersion.get(Book)[0], version)
+        self.assertEqual(models.TableVersion.get(Book)[0], version + 1)
+        
+        with transaction.atomic():
+            make_book(4)
+            transaction.set_rollback(True)
+        self.assertEqual(models.TableVersion.get(Book)[0], version + 1)
+
+
+class ConcurrentCheckoutTest(TransactionTestCase):
+    '''
+    many scan stations try to issue the same few instances at once
+    '''
+    
+    STATIONS = 8
+    INSTANCES = 5
+    
+    def test_no_double_issues(self):
+        book = make_book(1)
+        for n in range(1, self.INSTANCES + 1):
+            BookInstance.objects.create(id=n, book=book)
+        for n in range(1, self.STATIONS + 1):
+            make_student(n)
+        
+        results = []
+        barrier = threading.Barrier(self.STATIONS)
+        
+        def station(student_id):
+            issued = []
+            try:
+                barrier.wait()
+                for instance_id in range(1, self.INSTANCES + 1):
+                    while True:
+                        try:
+                            services.issue_books([instance_id], [student_id])
+                        except models.AlreadyTaken:
+                            break
+                        except OperationalError:
+                            # the in-memory test database is locked
+                            # by another station, the real one waits
+                            time.sleep(0.001)
+                            continue
+                        issued.append(instance_id)
+                        break
+            finally:
+                connections.close_all()
+            results.append(issued)
+        
+        threads = [threading.Thread(target=station, args=(n,))
+                   for n in range(1, self.STATIONS + 1)]
+        # the bumps after the commits may find the database locked too
+        with mock.patch.object(models.logger, 'exception'):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        
+        issued = sorted(i for station_issued in results for i in station_issued)
+        self.assertEqual(len(results), self.STATIONS)
+        self.assertEqual(issued, list(range(1, self.INSTANCES + 1)))
+        self.assertEqual(
+            models.BookTaking.objects.filter(is_returned=False).count(),
+            self.INSTANCES)
+        book.refresh_from_db()
+        self.assertEqual(
+            (book.in_storage_count, book.on_hands_count),
+            (0, self.INSTANCES))
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        book = make_book(1, name='Алгебра, 7 класс')
+        for n in range(1, 4):
+            BookInstance.objects.create(id=n, book=book)
+        make_student(1, grade=58)
+        services.issue_books([1, 2], [1])
+        services.return_books([2])
+        self.client.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+    
+    def get(self, dataset, **params):
+        response = self.client.get(
+            reverse('booksOperations:export', args=(dataset,)), params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+    
+    def test_csv(self):
+        response, content = self.get('takings')
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="takings.csv"')
+        rows = list(csv.reader(StringIO(content.decode('utf-8-sig'))))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][3], 'Алгебра, 7 класс')
+        self.assertEqual(rows[1][6], '9 «Б»')
+        self.assertEqual([row[-1] for row in rows[1:]], ['нет', 'да'])
+        
+        _, content = self.get('books')
+        rows = list(csv.reader(StringIO(content.decode('utf-8-sig'))))
+        # in storage, on hands
+        self.assertEqual(rows[1][8:10], ['2', '1'])
+    
+    def test_xlsx(self):
+        response, content = self.get('students', format='xlsx')
+        with zipfile.ZipFile(BytesIO(content)) as workbook:
+            self.assertIsNone(workbook.testzip())
+            sheet = workbook.read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('<t>Ученик1</t>', sheet)
+        self.assertIn('<t>9 «Б»</t>', sheet)
+        self.assertEqual(sheet.count('<row '), 2)
+    
+    def test_unknown_dataset(self):
+        response = self.client.get(
+            reverse('booksOperations:export', args=('passwords',)))
+        self.assertEqual(response.status_code, 404)
+    
+    def test_command(self):
+        models.BookTakingArchive.objects.create(
+            id=100, book_instance_id=3, student_id=1,
+            when_taken=timezone.now(), when_returned=timezone.now())
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'archive.csv')
+            call_command('export', 'archive', output=path)
+            with open(path, encoding='utf-8-sig') as file:
+                rows = list(csv.reader(file))
+        self.assertEqual(rows[1][0], '100')
+        self.assertEqual(rows[1][-1], 'да')
+
+
+class BenchmarkTest(TestCase):
+    '''
+    runs the benchmark harness on a tiny school
+    and keeps the query counts of the pages from growing
+    '''
+    
+    def test_small_school(self):
+        sizes = benchmark.generate(scale=0.01, years=1)
+        self.assertEqual(sizes['grades'], len(core.GRADE_LABELS))
+        self.assertEqual(Student.objects.count(), sizes['students'])
+        self.assertEqual(BookInstance.objects.count(), sizes['instances'])
+        self.assertEqual(
+            sum(Book.objects.values_list('on_hands_count', flat=True)),
+            sizes['active_takings'])
+        
+        results = benchmark.run_cases(repeat=1)
+        self.assertEqual(set(results), set(benchmark.CASES))
+        for name in ('admin_books', 'admin_students', 'admin_takings',
+                     'search', 'export_takings'):
+            self.assertLessEqual(results[name]['queries'], 10, name)
+        self.assertEqual(
+            models.BookTaking.objects.filter(is_returned=False).count(),
+            sizes['active_takings'])
+    
+    def test_synthetic_rows_avoid_real_books(self):
+        make_book(1, inventory_number=32767)
+        make_book(2, inventory_number=32766)
+        book = benchmark.create_synthetic_rows(instances=3, students=2)
+        self.assertEqual(book.inventory_number, 32765)
+        book.refresh_from_db()
+        self.assertEqual(book.in_storage_count, 3)
+        self.assertEqual(book.bookinstance_set.count(), 3)
+        self.assertEqual(set(Student.objects.name_startswith('тестов')
+                             .values_list('id', flat=True)),
+                         {benchmark.FIRST_STUDENT_ID,
+                          benchmark.FIRST_STUDENT_ID + 1})
+        
+        with self.assertRaises(CommandError):
+            benchmark.create_synthetic_rows(instances=1, students=1)
+
+
+class _ApiClient:
+    def setUp(self):
+        for n in range(1, 6):
+            make_book(n, grade='7-9' if n % 2 else '5')
+        BookInstance.objects.create(id=12345670, book_id=9780000000001)
+        make_student(1)
+    
+    def get(self, name, etag=None, HTTP_ACCEPT_ENCODING='', **params):
+        headers = {'HTTP_AUTHORIZATION': 'Token portal',
+                   'HTTP_ACCEPT_ENCODING': HTTP_ACCEPT_ENCODING}
+        if etag:
+            headers['HTTP_IF_NONE_MATCH'] = etag
+        return self.client.get(
+            reverse('api:resource_list', args=(name,)), params, **headers)
+
+
+@override_settings(BOOKSOPERATIONS_API_TOKENS=['portal'])
+class ApiTest(_ApiClient, TestCase):
+    def test_keyset_pages(self):
+        isbns = []
+        params = {'limit': 2, 'fields': 'name'}
+        while True:
+            with self.assertNumQueries(2):
+                response = self.get('books', **params)
+            page = response.json()
+            self.assertEqual(set(page['results'][0]), {'isbn', 'name'})
+            isbns += [row['isbn'] for row in page['results']]
+            if page['next'] is None:
+                break
+            params['after'] = page['results'][-1]['isbn']
+            self.assertIn(f'after={params["after"]}', page['next'])
+        
+        self.assertEqual(isbns, sorted(isbns))
+        self.assertEqual(len(isbns), 5)
+    
+    def test_filters_and_errors(self):
+        response = self.get('books', grade=8)
+        self.assertEqual(len(response.json()['results']), 3)
+        
+        response = self.get('takings', student=1)
+        self.assertEqual(response.json()['results'], [])
+        
+        self.assertEqual(self.get('books', fields='password').status_code, 400)
+        self.assertEqual(self.get('books', colour=1).status_code, 400)
+        huge = '9' * 23
+        self.assertEqual(self.get('books', after=huge).status_code, 400)
+        self.assertEqual(self.get('books', grade=huge).status_code, 400)
+        self.assertEqual(self.get('takings', is_returned=5).status_code, 400)
+        self.assertEqual(self.get('takings', is_returned=1).status_code, 200)
+        self.assertEqual(self.get('passwords').status_code, 404)
+        response = self.client.get(reverse('api:resource_list', args=('books',)))
+        self.assertEqual(response.status_code, 403)
+    
+    def test_gzip(self):
+        response = self.get('books', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        rows = json.loads(gzip.decompress(response.content))['results']
+        self.assertEqual(len(rows), 5)
+        
+        response = self.get('books', etag=response['ETag'],
+                            HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(BOOKSOPERATIONS_API_TOKENS=['portal'])
+class ApiCacheTest(_ApiClient, TransactionTestCase):
+    # the transaction which has changed the catalogue bypasses the cache
+    # and the versions are bumped after the commit,
+    # so the changes have to be committed
+    
+    def tearDown(self):
+        # the index is not a model table, so it is not flushed
+        search.get_backend().rebuild()
+    
+    def test_catalogue_pages_are_cached(self):
+        self.get('books')
+        with self.assertNumQueries(1):
+            # the versions of the tables only
+            response = self.get('books')
+        self.assertEqual(len(response.json()['results']), 5)
+        
+        # the students are not the catalogue
+        with self.assertNumQueries(4):
+            self.get('students')
+            self.get('students')
+    
+    def test_etag(self):
+        response = self.get('instances')
+        etag = response['ETag']
+        
+        with self.assertNumQueries(1):
+            response = self.get('instances', etag=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        services.issue_books([12345670], [1])
+        response = self.get('instances', etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['status'],
+                         BookInstance.ON_HANDS)
+        self.assertNotEqual(response['ETag'], etag)
+        
+        # the books show the counters of the instances
+        etag = self.get('books')['ETag']
+        services.return_books([12345670])
+        self.assertEqual(self.get('books', etag=etag).status_code, 200)
+    
+    def test_etag_and_page_change_together(self):
+        etag = self.get('instances')['ETag']
+        services.issue_books([12345670], [1])
+        
+        response = self.get('instances', etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['status'],
+                         BookInstance.ON_HANDS)
@@ -0,0 +1,13 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'booksOperations'
+
+urlpatterns = [
+    path('issue/', views.bulk_issue, name='bulk_issue'),
+    path('return/', views.bulk_return, name='bulk_return'),
+    path('scan/', views.scan, name='scan'),
+    path('dashboard/', views.grade_dashboard, name='grade_dashboard'),
+    path('export/<slug:dataset>/', views.export, name='export'),
+]
@@ -1,3 +1,186 @@
+import hmac
+import json
+from itertools import groupby
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import ValidationError
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+import core
+from booksRecord import validators
+from . import export as exports, models, services
+
+
+def _read_ids(data, key):
+    ids = data.get(key)
+    if not isinstance(ids, list) or not all(
+            isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        raise ValidationError(f'"{key}" должен быть списком целых чисел')
+    return ids
+
+
+def _bulk_operation(operation):
+    '''
+    wraps a function taking the decoded JSON body
+    into a staff-only POST view answering with JSON
+    '''
+    
+    @staff_member_required
+    @require_POST
+    def view(request):
+        try:
+            data = json.loads(request.body)
+            if not isinstance(data, dict):
+                raise ValueError
+        except ValueError:
+            return JsonResponse({'errors': ['неверный JSON']}, status=400)
+        
+        try:
+            result = operation(data)
+        except models.AlreadyTaken as error:
+            return JsonResponse({'errors': error.messages}, status=409)
+        except ValidationError as error:
+            return JsonResponse({'errors': error.messages}, status=400)
+        
+        return JsonResponse(result)
+    
+    view.__name__ = operation.__name__
+    view.__doc__ = operation.__doc__
+    return view
+
+
+@_bulk_operation
+def bulk_issue(data):
+    '''
+    Выдаёт комплект экземпляров ученикам, см. services.issue_books.\n
+    Тело запроса: {"book_instances": [...], "students": [...]}.
+    Если хоть один экземпляр уже выдан, ответ — 409 Conflict.
+    '''
+    
+    takings = services.issue_books(
+        _read_ids(data, 'book_instances'),
+        _read_ids(data, 'students'),
+    )
+    return {'issued': len(takings)}
+
+
+@_bulk_operation
+def bulk_return(data):
+    '''
+    Принимает обратно комплект экземпляров, см. services.return_books.\n
+    Тело запроса: {"book_instances": [...]}
+    '''
+    
+    returned = services.return_books(_read_ids(data, 'book_instances'))
+    return {'returned': returned}
+
+
+def _has_token(request, tokens):
+    '''
+    checks the "Authorization: Token <token>" header
+    against the given tokens
+    '''
+    
+    scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if scheme != 'Token' or not token:
+        return False
+    return any(hmac.compare_digest(token, known) for known in tokens)
+
+
+@csrf_exempt
+@require_POST
+def scan(request):
+    '''
+    Выдача или возврат одного экземпляра по скану штрихкода.\n
+    Тело запроса: {"book_instance": <EAN-8>, "student": <id>};
+    если ученик не указан, экземпляр принимается обратно.\n
+    Если экземпляр уже выдан, ответ — 409 Conflict.\n
+    Станция сканирования авторизуется заголовком
+    "Authorization: Token <токен>" из BOOKSOPERATIONS_SCAN_TOKENS,
+    поэтому ни сессия, ни пользователь здесь не загружаются.
+    '''
+    
+    if not _has_token(request, settings.BOOKSOPERATIONS_SCAN_TOKENS):
+        return JsonResponse({'errors': ['неизвестная станция']}, status=403)
+    
+    try:
+        data = json.loads(request.body)
+        instance_id = data['book_instance']
+        student_id = data.get('student')
+        if not isinstance(instance_id, int) or not isinstance(
+                student_id, (int, type(None))):
+            raise ValueError
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({'errors': ['неверный JSON']}, status=400)
+    
+    try:
+        validators.ean8_validator(instance_id)
+        if student_id is None:
+            services.return_books([instance_id])
+            return JsonResponse({'returned': instance_id})
+        
+        services.issue_books([instance_id], [student_id])
+        return JsonResponse({'issued': instance_id, 'student': student_id})
+    except models.AlreadyTaken as error:
+        return JsonResponse({'errors': error.messages}, status=409)
+    except ValidationError as error:
+        return JsonResponse({'errors': error.messages}, status=400)
+
+
+@staff_member_required
+def grade_dashboard(request):
+    '''
+    Книги, которые ученики каждого класса держат на руках;
+    ?grade=<код класса> показывает один класс,
+    ?year=<номер> — одну параллель.\n
+    Строится по сводке GradeSummary за один проход
+    по её индексу (класс, книга).
+    '''
+    
+    rows = models.GradeSummary.objects \
+        .filter(outstanding__gt=0) \
+        .select_related('book') \
+        .only('grade', 'outstanding', 'overdue', 'returned', 'book__name') \
+        .order_by('grade', 'book')
+    
+    grade = request.GET.get('grade', '')
+    if grade.isdigit():
+        rows = rows.filter(grade=int(grade))
+    year = request.GET.get('year', '')
+    if year.isdigit() and int(year) in core.YEAR_RANGES:
+        rows = rows.filter(grade__range=core.YEAR_RANGES[int(year)])
+    
+    return render(request, 'booksOperations/grade_dashboard.html', {
+        **admin.site.each_context(request),
+        'title': 'Книги на руках по классам',
+        'grades': [
+            (core.GRADE_LABELS.get(grade, grade), list(grade_rows))
+            for grade, grade_rows in groupby(rows, key=lambda row: row.grade)
+        ],
+    })
+
 
-# Create your views here.
+@staff_member_required
+@require_GET
+def export(request, dataset):
+    '''
+    Выгрузка в файл: takings — акты взятия книг, archive — их архив,
+    students — ученики, books — каталог с числом экземпляров;
+    ?format=csv (по умолчанию) или xlsx.\n
+    Файл отправляется по мере чтения из базы, см. export.
+    '''
+    
+    format = request.GET.get('format', 'csv')
+    if dataset not in exports.DATASETS or format not in exports.FORMATS:
+        raise Http404
+    
+    chunks, content_type = exports.FORMATS[format]
+    response = StreamingHttpResponse(chunks(dataset), content_type=content_type)
+    response['Content-Disposition'] = \
+        f'attachment; filename="{dataset}.{format}"'
+    return response
@@ -1,14 +1,64 @@
 from django.contrib import admin
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Q
 from django.utils.safestring import mark_safe
 
-from . import models
+from . import models, search, validators
 import booksOperations.admin
 
+
+def _grade_range(word):
+    # "7-9" → (7, 9), None for the other words; a single number
+    # is searched as an ISBN or an inventory number too
+    if '-' not in word:
+        return None
+    try:
+        return validators.parse_grade(word)
+    except ValidationError:
+        return None
+
+
+def _count_instances(status=None):
+    '''
+    returns a Count over the book's instances, optionally
+    restricted to the given status
+    '''
+    
+    if status is None:
+        return Count('bookinstance')
+    return Count('bookinstance', filter=Q(bookinstance__status=status))
+
+
 @admin.register(models.Book)
 class BookAdmin(admin.ModelAdmin):
+    # The counts below are annotated onto the changelist queryset
+    # (see get_queryset), so the whole page costs one grouped query
+    # instead of a COUNT per row.
+    
     def number_of_instances(self):
-        return self.bookinstance_set.count()
+        return self.instances_total
     number_of_instances.short_description = "Количество экземпляров"
+    number_of_instances.admin_order_field = 'instances_total'
+    
+    def number_in_storage(self):
+        return self.instances_in_storage
+    number_in_storage.short_description = "В хранилище"
+    number_in_storage.admin_order_field = 'instances_in_storage'
+    
+    def number_on_hands(self):
+        return self.instances_on_hands
+    number_on_hands.short_description = "На руках"
+    number_on_hands.admin_order_field = 'instances_on_hands'
+    
+    def number_expired(self):
+        return self.instances_expired
+    number_expired.short_description = "Просрочено"
+    number_expired.admin_order_field = 'instances_expired'
+    
+    def number_written_off(self):
+        return self.instances_written_off
+    number_written_off.short_description = "Списано"
+    number_written_off.admin_order_field = 'instances_written_off'
     
     def isbn_plus_name(self):
         '''
@@ -19,7 +69,9 @@ class BookAdmin(admin.ModelAdmin):
     isbn_plus_name.short_description = 'ISBN — название'
     isbn_plus_name.admin_order_field = 'name'
     
-    search_fields = ['name', 'authors', 'subject__name',
+    # the text fields are looked up in the full-text index,
+    # see get_search_results
+    search_fields = ['name', 'authors', 'subject',
                      'grade', 'isbn', 'inventory_number']
     
     list_display=(
@@ -28,6 +80,10 @@ class BookAdmin(admin.ModelAdmin):
         'authors', 
         'inventory_number',
         number_of_instances,
+        number_in_storage,
+        number_on_hands,
+        number_expired,
+        number_written_off,
     )
     
     fieldsets = (
@@ -48,9 +104,48 @@ class BookAdmin(admin.ModelAdmin):
         ('grade', 'subject')
       }),
     )
+    
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        
+        # the ranges of grades, e.g. "7-9", are not in the full-text index
+        words = []
+        found = Q()
+        for word in search_term.split():
+            grades = _grade_range(word)
+            if grades is None:
+                words.append(word)
+            else:
+                found &= Q(grade_from=grades[0], grade_to=grades[1])
+        if words:
+            found &= search.get_backend().condition(' '.join(words))
+        
+        if search_term.isdigit():
+            number = int(search_term)
+            found |= (Q(isbn=number) | Q(inventory_number=number)
+                      | Q(grade=search_term))
+        return queryset.filter(found), False
+    
+    def get_queryset(self, request):
+        # the changelist counts the books twice, with the filters
+        # and without them; both counts come from the catalogue cache
+        return super().get_queryset(request).cache_counts().annotate(
+            instances_total=_count_instances(),
+            instances_in_storage=_count_instances(
+                models.BookInstance.IN_STORAGE),
+            instances_on_hands=_count_instances(
+                models.BookInstance.ON_HANDS),
+            instances_expired=_count_instances(
+                models.BookInstance.EXPIRED),
+            instances_written_off=_count_instances(
+                models.BookInstance.WRITTEN_OFF),
+        )
 
 @admin.register(models.BookInstance)
-class BookInstanceAdmin(admin.ModelAdmin):
+class BookInstanceAdmin(booksOperations.admin.TakingConflictsMixin,
+                        admin.ModelAdmin):
     list_display = ('id', 'book', 'status',)
     readonly_fields = ('status',)
     fields = ('status', 'id', 'book')
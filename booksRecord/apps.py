@@ -3,4 +3,8 @@ from django.apps import AppConfig
 
 class BooksrecordConfig(AppConfig):
     name = 'booksRecord'
-    verbose_name = "Регистрация книг"
\ No newline at end of file
+    verbose_name = "Регистрация книг"
+    
+    def ready(self):
+        # connects the signals keeping the search index up to date
+        from . import search
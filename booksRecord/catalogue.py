@@ -0,0 +1,120 @@
+'''
+Кэш каталога: страницы и число книг в админке, подсказки поиска
+и страницы каталога в API.\n
+Каталог меняется редко, а читается почти каждым запросом, поэтому
+результаты хранятся в кэше Django с псевдонимом "catalogue"
+(settings.CACHES) под ключами, включающими версии таблиц книг
+и экземпляров (см. :model:`booksOperations.TableVersion`).
+Любое изменение каталога увеличивает версию сразу после фиксации
+своей транзакции, и старые записи больше не читаются, а вытесняются
+кэшем по мере надобности. Версии хранятся в базе, поэтому все процессы
+сервера видят их одинаково, а откаченная транзакция их не меняет.\n
+Пока транзакция, изменившая каталог, не завершена, её соединение
+видит каталог, которого не видят другие, и обходит кэш.\n
+Число попаданий и промахов по видам записей отдаёт metrics,
+его видит персонал на /stats/.
+'''
+
+import hashlib
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+
+# the labels of the models the cached results are computed from
+MODELS = ('booksRecord.Book', 'booksRecord.BookInstance')
+
+# (the kind of the entries, 'hits' or 'misses') → the number
+_metrics = Counter()
+_lock = threading.Lock()
+
+# tells a missing entry from a cached None
+_MISSING = object()
+
+
+def _changed_in_transaction():
+    # the mark left by changed(), Django drops it
+    # on the commit or the rollback of the transaction
+    pass
+
+
+def changed():
+    '''
+    called by TableVersion.bump for the catalogue models:
+    the current transaction bypasses the cache until it ends
+    '''
+    
+    transaction.on_commit(_changed_in_transaction)
+
+
+def _in_changing_transaction():
+    return any(function is _changed_in_transaction
+               for _, function in connection.run_on_commit)
+
+
+def versions():
+    '''
+    the versions of the catalogue tables
+    '''
+    
+    from booksOperations.models import TableVersion
+    from .models import Book, BookInstance
+    return TableVersion.get(Book, BookInstance)
+
+
+def cached(kind, parts, compute, table_versions=None):
+    '''
+    returns compute() cached under the kind (e.g. "count"), the parts
+    of the key (anything with a stable repr, e.g. a tuple of strings
+    and numbers) and the versions of the tables the result depends on,
+    those of the catalogue by default; the result has to be picklable
+    '''
+    
+    if _in_changing_transaction():
+        return compute()
+    
+    if table_versions is None:
+        table_versions = versions()
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    key = 'booksRecord:catalogue:{}:{}:{}'.format(
+        '.'.join(map(str, table_versions)), kind, digest)
+    
+    cache = caches['catalogue']
+    value = cache.get(key, _MISSING)
+    hit = value is not _MISSING
+    if not hit:
+        value = compute()
+        cache.set(key, value, settings.BOOKSRECORD_CATALOGUE_TIMEOUT)
+    
+    with _lock:
+        _metrics[kind, 'hits' if hit else 'misses'] += 1
+    return value
+
+
+def metrics():
+    '''
+    {kind: {'hits': ..., 'misses': ..., 'hit_ratio': ...}}
+    since the start of this server process
+    '''
+    
+    with _lock:
+        numbers = dict(_metrics)
+    
+    result = {}
+    for kind in sorted({kind for kind, _ in numbers}):
+        hits = numbers.get((kind, 'hits'), 0)
+        misses = numbers.get((kind, 'misses'), 0)
+        result[kind] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 3),
+        }
+    return result
+
+
+def reset_metrics():
+    with _lock:
+        _metrics.clear()
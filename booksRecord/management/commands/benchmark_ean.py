@@ -0,0 +1,55 @@
+import random
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from booksRecord import validators
+
+
+class Command(BaseCommand):
+    help = '''Compares the speed of the EAN checksum validation \
+with the barcodenumber library'''
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--codes',
+            type=int,
+            default=50000,
+            help='how many random codes of each kind are checked',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='how many times each check is timed, the best time is taken',
+        )
+    
+    def handle(self, *args, codes=50000, repeat=5, **options):
+        try:
+            import barcodenumber
+        except ImportError:
+            barcodenumber = None
+        
+        for length in (8, 13):
+            values = [random.randrange(10 ** (length - 1), 10 ** length)
+                      for _ in range(codes)]
+            kind = f'ean{length}'
+            
+            candidates = {
+                'is_valid_ean': lambda: [
+                    validators.is_valid_ean(value, length)
+                    for value in values],
+                'invalid_ean_indices': lambda:
+                    validators.invalid_ean_indices(values, length),
+            }
+            if barcodenumber is not None:
+                candidates['barcodenumber'] = lambda: [
+                    barcodenumber.check_code(kind, str(value))
+                    for value in values]
+            
+            self.stdout.write(f'{kind}, {codes} codes:')
+            for name, check in candidates.items():
+                best = min(timeit.repeat(check, number=1, repeat=repeat))
+                self.stdout.write(
+                    f'  {name:20} {best * 1000:8.1f} ms '
+                    f'({best / codes * 1e9:.0f} ns per code)')
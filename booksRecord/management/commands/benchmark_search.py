@@ -0,0 +1,94 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from booksRecord import search
+from booksRecord.models import Book
+
+
+SUBJECTS = ('Алгебра', 'Геометрия', 'Физика', 'Химия', 'Биология',
+            'История России', 'Литература', 'Русский язык', 'География',
+            'Английский язык', 'Информатика', 'Обществознание')
+AUTHORS = ('Макарычев', 'Атанасян', 'Перышкин', 'Габриелян', 'Пасечник',
+           'Арсентьев', 'Коровина', 'Ладыженская', 'Алексеев', 'Босова')
+QUERIES = ('алгебры', 'физика 7', 'перышкин', 'истор', 'русский язык')
+
+
+class Command(BaseCommand):
+    help = '''Measures the latency of the catalogue search against \
+the catalogue size on synthetic books. Runs on an empty database, \
+nothing is saved'''
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[1000, 5000, 20000],
+            help='the catalogue sizes to measure, at most 32767',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='how many times each query is run',
+        )
+    
+    def time(self, function, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        return (time.perf_counter() - start) / repeat * 1000
+    
+    def handle(self, *args, sizes, repeat=20, **options):
+        if Book.objects.exists():
+            raise CommandError(
+                'the database is not empty; run the benchmark against '
+                'an empty one, e.g. a fresh copy made by `manage.py migrate`')
+        
+        backend = search.get_backend()
+        self.stdout.write(
+            f'{"books":>6} {"query":15} {"index, ms":>10} {"icontains, ms":>14}')
+        
+        for size in sizes:
+            with transaction.atomic():
+                books = [
+                    Book(
+                        isbn=9780000000000 + n,
+                        name=f'{random.choice(SUBJECTS)}. {n % 11 + 1} класс',
+                        authors=random.choice(AUTHORS),
+                        year_of_publication=2000 + n % 20,
+                        publisher='Просвещение',
+                        edition=1,
+                        publication_city='Москва',
+                        subject=random.choice(SUBJECTS)[:20],
+                        inventory_number=n,
+                    )
+                    for n in range(1, size + 1)
+                ]
+                Book.objects.bulk_create(books, batch_size=500)
+                backend.rebuild()
+                
+                for query in QUERIES:
+                    index_time = self.time(
+                        lambda: list(backend.filter(
+                            Book.objects.all(), query).values_list('isbn')),
+                        repeat)
+                    
+                    condition = Q()
+                    for word in query.split():
+                        condition &= (Q(name__icontains=word)
+                                      | Q(authors__icontains=word))
+                    like_time = self.time(
+                        lambda: list(Book.objects.filter(condition)
+                                     .values_list('isbn')),
+                        repeat)
+                    
+                    self.stdout.write(
+                        f'{size:6} {query:15} {index_time:10.2f} '
+                        f'{like_time:14.2f}')
+                
+                transaction.set_rollback(True)
@@ -0,0 +1,294 @@
+import csv
+import json
+import os
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.backends.base.operations import BaseDatabaseOperations
+from django.db.models import Q
+
+from booksRecord import search, validators
+from booksRecord.models import Book, BookInstance
+from booksOperations.models import TableVersion
+
+
+class Command(BaseCommand):
+    help = '''Loads books and labels their instances from a CSV \
+or JSON Lines file, keyed by ISBN; loading the same file again \
+changes nothing'''
+    
+    # the fields of Book which can be given in the file
+    FIELDS = ('name', 'authors', 'year_of_publication', 'publisher',
+              'edition', 'publication_city', 'grade', 'subject',
+              'inventory_number')
+    INTEGER_FIELDS = ('year_of_publication', 'edition', 'inventory_number')
+    
+    # the most instances labelled by one row, a guard against typos
+    MAX_INSTANCES = 10000
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'file',
+            help='''a CSV or JSON Lines file with the columns "isbn", \
+the fields of Book and optionally "instances_from" and "instances_to": \
+the first and the last EAN-8 labels of the book's instances''',
+        )
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'jsonl'),
+            help='the format of the file, guessed by its extension by default',
+        )
+        parser.add_argument('--encoding', default='utf-8-sig')
+        parser.add_argument('--delimiter', default=',')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=200,
+            help='how many books are written by one transaction',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="only report what would be done and the conflicts, \
+don't write anything",
+        )
+    
+    def handle(self, *args, file, format=None, encoding='utf-8-sig',
+               delimiter=',', chunk_size=200, dry_run=False, **options):
+        if format is None:
+            format = 'jsonl' if os.path.splitext(file)[1].lower() in (
+                '.jsonl', '.json') else 'csv'
+        
+        self.dry_run = dry_run
+        self.counts = dict.fromkeys(
+            ('inserted', 'updated', 'unchanged', 'skipped',
+             'conflicts', 'instances'), 0)
+        # inventory number → ISBN, to find duplicates within the file
+        self.inventory_numbers = {}
+        # ISBN → the line it was first given on
+        self.isbn_lines = {}
+        
+        try:
+            with open(file, encoding=encoding, newline='') as books_file:
+                if format == 'csv':
+                    reader = csv.DictReader(books_file, delimiter=delimiter)
+                    rows = ((reader.line_num, row) for row in reader)
+                else:
+                    rows = ((line, self.decode(text))
+                            for line, text in enumerate(books_file, 1)
+                            if text.strip())
+                
+                chunk = []
+                for line, row in rows:
+                    book = self.parse_row(line, row)
+                    if book is not None:
+                        chunk.append(book)
+                    if len(chunk) >= chunk_size:
+                        self.save_chunk(chunk)
+                        chunk = []
+                if chunk:
+                    self.save_chunk(chunk)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        
+        self.stdout.write(self.style.SUCCESS(
+            ('would be ' if dry_run else '')
+            + 'books inserted: {inserted}, updated: {updated}, '
+            'unchanged: {unchanged}, skipped: {skipped}, '
+            'conflicts: {conflicts}; '
+            'instances created: {instances}'.format(**self.counts)
+        ))
+    
+    def skip(self, line, reason, counter='skipped'):
+        self.stderr.write(f'line {line}: {reason}')
+        self.counts[counter] += 1
+    
+    @staticmethod
+    def decode(text):
+        # a bad line is reported by parse_row with the others
+        try:
+            return json.loads(text)
+        except ValueError:
+            return None
+    
+    def parse_row(self, line, row):
+        '''
+        returns (line, Book, (instances_from, instances_to) or None)
+        '''
+        
+        if not isinstance(row, dict):
+            self.skip(line, 'bad row, not a JSON object')
+            return None
+        
+        try:
+            values = {field: str(row.get(field) or '').strip()
+                      for field in ('isbn',) + self.FIELDS}
+            for field in ('isbn',) + self.INTEGER_FIELDS:
+                values[field] = int(values[field])
+            for field in self.INTEGER_FIELDS:
+                # SQLite has no ranges of its own, full_clean checks none
+                low, high = BaseDatabaseOperations.integer_field_ranges[
+                    Book._meta.get_field(field).get_internal_type()]
+                if not low <= values[field] <= high:
+                    raise ValueError(f'{field} {values[field]} is not '
+                                     f'between {low} and {high}')
+            values['subject'] = values['subject'] or None
+            
+            instances = None
+            if row.get('instances_from') not in (None, ''):
+                instances = (int(row['instances_from']),
+                             int(row['instances_to']))
+        except (ValueError, KeyError, TypeError) as error:
+            self.skip(line, f'bad row, {error!r}')
+            return None
+        
+        if instances is not None:
+            first, last = instances
+            if not 0 <= first <= last < 10 ** 8:
+                self.skip(line, f'bad instance labels {first}-{last}, '
+                                'expected two EAN-8 codes, the first one '
+                                'not greater than the last one')
+                return None
+            if last - first >= self.MAX_INSTANCES * 10:
+                self.skip(line, f'the labels {first}-{last} make more than '
+                                f'{self.MAX_INSTANCES} instances')
+                return None
+        
+        book = Book(**values)
+        try:
+            # the checksums of the ISBNs are checked by save_chunk at once,
+            # the uniqueness by check_inventory_numbers and save_books
+            book.full_clean(exclude=['isbn'], validate_unique=False)
+        except ValidationError as error:
+            self.skip(line, 'bad row, ' + '; '.join(
+                f'{field}: {" ".join(messages)}'
+                for field, messages in error.message_dict.items()))
+            return None
+        
+        isbn = values['isbn']
+        if isbn in self.isbn_lines:
+            self.skip(line, f'ISBN {isbn} is already given '
+                            f'on line {self.isbn_lines[isbn]}')
+            return None
+        self.isbn_lines[isbn] = line
+        
+        return line, book, instances
+    
+    def save_chunk(self, chunk):
+        bad = set(validators.invalid_ean_indices(
+            [book.isbn for _, book, _ in chunk], 13))
+        for index in sorted(bad):
+            line, book, _ = chunk[index]
+            self.skip(line, f'the checksum of ISBN {book.isbn} is wrong')
+        chunk = [row for index, row in enumerate(chunk) if index not in bad]
+        
+        with transaction.atomic():
+            chunk = self.check_inventory_numbers(chunk)
+            self.save_books(chunk)
+            self.save_instances(chunk)
+    
+    def check_inventory_numbers(self, chunk):
+        taken = dict(
+            Book.objects
+            .filter(inventory_number__in=[
+                book.inventory_number for _, book, _ in chunk])
+            .values_list('inventory_number', 'isbn')
+        )
+        
+        accepted = []
+        for line, book, instances in chunk:
+            number = book.inventory_number
+            owners = {self.inventory_numbers.get(number), taken.get(number)}
+            owners -= {None, book.isbn}
+            if owners:
+                self.skip(
+                    line,
+                    f'inventory number {number} of ISBN {book.isbn} '
+                    f'is already taken by ISBN {owners.pop()}',
+                    counter='conflicts')
+                continue
+            
+            self.inventory_numbers[number] = book.isbn
+            accepted.append((line, book, instances))
+        
+        return accepted
+    
+    def save_books(self, chunk):
+        known = Book.objects.in_bulk([book.isbn for _, book, _ in chunk])
+        
+        to_create = []
+        to_update = []
+        for _, book, _ in chunk:
+            book.fill_grade_range()
+            old = known.get(book.isbn)
+            if old is None:
+                to_create.append(book)
+            elif any(getattr(old, field) != getattr(book, field)
+                     for field in self.FIELDS):
+                for field in self.FIELDS + ('grade_from', 'grade_to'):
+                    setattr(old, field, getattr(book, field))
+                to_update.append(old)
+            else:
+                self.counts['unchanged'] += 1
+        
+        if not self.dry_run:
+            Book.objects.bulk_create(to_create)
+            Book.objects.bulk_update(
+                to_update, self.FIELDS + ('grade_from', 'grade_to'))
+            # the bulk operations send no signals
+            search.get_backend().index(to_create + to_update)
+            if to_create or to_update:
+                TableVersion.bump(Book)
+        
+        self.counts['inserted'] += len(to_create)
+        self.counts['updated'] += len(to_update)
+    
+    def save_instances(self, chunk):
+        ranges = [(line, book.isbn, instances)
+                  for line, book, instances in chunk if instances]
+        if not ranges:
+            return
+        
+        # the owners of all the ids in the ranges, by one query
+        owners = dict(
+            BookInstance.objects
+            .filter(reduce(or_, (Q(id__range=instances)
+                                 for _, _, instances in ranges)))
+            .values_list('id', 'book_id')
+        )
+        
+        to_create = []
+        for line, isbn, (first, last) in ranges:
+            conflicts = []
+            for instance_id in validators.ean8_range(first, last):
+                owner = owners.get(instance_id)
+                if owner is None:
+                    owners[instance_id] = isbn
+                    to_create.append(BookInstance(id=instance_id, book_id=isbn))
+                elif owner != isbn:
+                    conflicts.append(instance_id)
+            
+            if conflicts:
+                self.skip(
+                    line,
+                    f'{len(conflicts)} instance(s) of ISBN {isbn} already '
+                    f'belong to other books, e.g. {conflicts[0]:08d}',
+                    counter='conflicts')
+        
+        if not self.dry_run:
+            BookInstance.objects.bulk_create(to_create)
+            
+            # bulk_create bypasses BookInstance.save
+            new = {}
+            for instance in to_create:
+                new[instance.book_id] = new.get(instance.book_id, 0) + 1
+            for isbn, number in new.items():
+                Book.shift_counters(
+                    isbn, None, BookInstance.IN_STORAGE, number)
+            if to_create:
+                TableVersion.bump(Book, BookInstance)
+        
+        self.counts['instances'] += len(to_create)
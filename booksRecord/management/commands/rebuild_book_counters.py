@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from booksRecord.models import Book, BookInstance
+from booksOperations.models import TableVersion
+
+
+class Command(BaseCommand):
+    help = '''Recomputes the denormalized per-status counters \
+of every book from its instances'''
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help="only report the books whose counters are wrong, don't fix them",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='how many books are updated by one query',
+        )
+    
+    def handle(self, *args, check=False, batch_size=500, **options):
+        fields = list(BookInstance.COUNTER_FIELDS.values())
+        
+        actual = {}
+        groups = (
+            BookInstance.objects.order_by()
+            .values_list('book_id', 'status')
+            .annotate(number=Count('id'))
+        )
+        for book_id, status, number in groups.iterator():
+            actual.setdefault(book_id, {})[
+                BookInstance.COUNTER_FIELDS[status]] = number
+        
+        with transaction.atomic():
+            books = Book.objects.only('isbn', *fields)
+            if not check:
+                books = books.select_for_update()
+            
+            wrong = []
+            for book in books.iterator():
+                counters = actual.get(book.isbn, {})
+                if any(getattr(book, field) != counters.get(field, 0)
+                       for field in fields):
+                    for field in fields:
+                        setattr(book, field, counters.get(field, 0))
+                    wrong.append(book)
+            
+            if not check:
+                Book.objects.bulk_update(wrong, fields, batch_size=batch_size)
+                if wrong:
+                    TableVersion.bump(Book)
+        
+        if check:
+            for book in wrong:
+                self.stdout.write(f'{book.isbn}: counters are out of date')
+            if wrong:
+                raise CommandError(
+                    f'{len(wrong)} book(s) have wrong counters')
+            self.stdout.write(self.style.SUCCESS('All counters are correct'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Fixed the counters of {len(wrong)} book(s)'))
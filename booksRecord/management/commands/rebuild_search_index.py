@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from booksOperations.models import TableVersion
+from booksRecord import search
+from booksRecord.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Indexes the whole catalogue for the full-text search again'
+    
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            search.get_backend().rebuild()
+            # the cached search results may come from the old index
+            TableVersion.bump(Book)
+        self.stdout.write(self.style.SUCCESS('The search index is rebuilt'))
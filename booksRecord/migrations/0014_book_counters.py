@@ -0,0 +1,57 @@
+# Generated by Django 2.2.1 on 2026-10-18 12:29
+
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+COUNTER_FIELDS = {
+    0: 'in_storage_count',
+    1: 'on_hands_count',
+    2: 'expired_count',
+    3: 'written_off_count',
+}
+
+
+def fill_counters(apps, schema_editor):
+    BookInstance = apps.get_model('booksRecord', 'BookInstance')
+    Book = apps.get_model('booksRecord', 'Book')
+    
+    groups = (
+        BookInstance.objects.order_by()
+        .values_list('book_id', 'status')
+        .annotate(number=Count('id'))
+    )
+    for book_id, status, number in groups:
+        field = COUNTER_FIELDS[status]
+        Book.objects.filter(pk=book_id).update(**{field: F(field) + number})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booksRecord', '0013_delete_takenbook'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='expired_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='просрочено'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='in_storage_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='в хранилище'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='on_hands_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='на руках'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='written_off_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='снято с учёта'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 2.2.1 on 2026-10-18 12:32
+
+import re
+
+from django.db import migrations, models
+
+
+# A frozen copy of booksRecord.validators.parse_grade
+# as of this migration; None instead of a ValidationError.
+
+_GRADE = re.compile(r'(1[01]|[1-9])(?:-(1[01]|[1-9]))?')
+
+
+def parse_grade(value):
+    match = _GRADE.fullmatch(value)
+    if match:
+        lowest = int(match.group(1))
+        highest = int(match.group(2) or lowest)
+        if lowest <= highest:
+            return lowest, highest
+    return None
+
+
+def fill_grade_range(apps, schema_editor):
+    Book = apps.get_model('booksRecord', 'Book')
+    
+    for grade in Book.objects.exclude(grade='').exclude(grade=None) \
+            .values_list('grade', flat=True).distinct():
+        grades = parse_grade(grade)
+        if grades is None:
+            continue
+        Book.objects.filter(grade=grade).update(
+            grade_from=grades[0], grade_to=grades[1])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booksRecord', '0014_book_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='grade_from',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, verbose_name='с класса'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='grade_to',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, verbose_name='по класс'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['grade_from', 'grade_to'], name='booksRecord_grade_f_ab3ee1_idx'),
+        ),
+        migrations.RunPython(fill_grade_range, migrations.RunPython.noop),
+    ]
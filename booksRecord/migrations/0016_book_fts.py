@@ -0,0 +1,120 @@
+import re
+
+from django.db import migrations
+
+
+TABLE = 'booksRecord_book_fts'
+
+
+# A frozen copy of booksRecord.search as of this migration,
+# so that later changes there don't change what it does.
+
+# The Snowball stemmer for Russian,
+# see https://snowballstem.org/algorithms/russian/stemmer.html
+
+_RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+_PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE = re.compile(r'(с[яь])$')
+_ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому'
+    r'|их|ых|ую|юю|ая|яя|ою|ею)$')
+_PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло'
+    r'|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$')
+_NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием'
+    r'|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$')
+_I = re.compile(r'и$')
+_SOFT_SIGN = re.compile(r'ь$')
+_NN = re.compile(r'нн$')
+_DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+_DER = re.compile(r'ость?$')
+_SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+
+_WORD = re.compile(r'\w+')
+
+
+def stem(word):
+    '''
+    returns the stem of a word, lowercased and with "ё" replaced by "е"
+    '''
+    
+    word = word.lower().replace('ё', 'е')
+    match = _RV.match(word)
+    if match is None:
+        return word
+    start, rv = match.groups()
+    
+    stemmed = _PERFECTIVE_GERUND.sub('', rv, 1)
+    if stemmed == rv:
+        rv = _REFLEXIVE.sub('', rv, 1)
+        stemmed = _ADJECTIVE.sub('', rv, 1)
+        if stemmed != rv:
+            rv = _PARTICIPLE.sub('', stemmed, 1)
+        else:
+            stemmed = _VERB.sub('', rv, 1)
+            rv = _NOUN.sub('', rv, 1) if stemmed == rv else stemmed
+    else:
+        rv = stemmed
+    
+    rv = _I.sub('', rv, 1)
+    if _DERIVATIONAL.match(rv):
+        rv = _DER.sub('', rv, 1)
+    
+    stemmed = _SOFT_SIGN.sub('', rv, 1)
+    if stemmed == rv:
+        rv = _NN.sub('н', _SUPERLATIVE.sub('', rv, 1), 1)
+    else:
+        rv = stemmed
+    
+    return start + rv
+
+
+def document(book):
+    '''
+    returns the searchable text of a book: its words
+    with their stems, since the stem of an inflected word may be longer
+    than the stem of the word itself (Макарычева → макарычев,
+    but Макарычев → макарыч)
+    '''
+    
+    text = ' '.join(filter(None, (book.name, book.authors, book.subject)))
+    words = []
+    for word in _WORD.findall(text):
+        folded = word.lower().replace('ё', 'е')
+        words.append(folded)
+        if stem(word) != folded:
+            words.append(stem(word))
+    return ' '.join(words)
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    
+    Book = apps.get_model('booksRecord', 'Book')
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE {TABLE} USING fts5(document)')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, document) VALUES (%s, %s)',
+            [(book.isbn, document(book)) for book in Book.objects.iterator()])
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booksRecord', '0015_book_grade_range'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
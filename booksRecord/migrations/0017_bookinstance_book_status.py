@@ -0,0 +1,17 @@
+# Generated by Django 2.2.1 on 2026-10-18 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booksRecord', '0016_book_fts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['book', 'status'], name='booksRecord_book_id_c4f02d_idx'),
+        ),
+    ]
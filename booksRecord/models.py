@@ -1,8 +1,48 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 
 import core.models
 import readersRecord
-from . import validators
+from . import catalogue, validators
+
+
+class BookQuerySet(models.QuerySet):
+    # see cache_counts
+    _cache_counts = False
+    
+    def cache_counts(self):
+        '''
+        makes count() of this queryset and of the querysets made from it
+        come from the catalogue cache (see booksRecord.catalogue);
+        only for the queries reading the books and their instances
+        '''
+        
+        clone = self._chain()
+        clone._cache_counts = True
+        return clone
+    
+    def _clone(self):
+        clone = super()._clone()
+        clone._cache_counts = self._cache_counts
+        return clone
+    
+    def count(self):
+        if not self._cache_counts or self._result_cache is not None:
+            return super().count()
+        return catalogue.cached(
+            'count', self.query.sql_with_params(), super().count)
+    
+    def for_grade(self, grade):
+        '''
+        returns the books meant for the given grade number,
+        e.g. for_grade(8) finds both "8" and "7-9" books
+        '''
+        
+        return self.filter(grade_from__lte=grade, grade_to__gte=grade)
 
 
 class Book(models.Model):
@@ -68,6 +108,22 @@ class Book(models.Model):
         validators=[validators.grade_validator]
     )
     
+    # The grade parsed into the range of grade numbers,
+    # e.g. "7-9" → 7 and 9, "5" → 5 and 5; empty for non-educational books.
+    # Filled in by save, see BookQuerySet.for_grade.
+    
+    grade_from = models.PositiveSmallIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='с класса',
+    )
+    
+    grade_to = models.PositiveSmallIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='по класс',
+    )
+    
     subject = models.CharField(
         verbose_name="предмет",
         max_length=20, 
@@ -81,6 +137,76 @@ class Book(models.Model):
         help_text='инвентарный номер из Книги Учёта' #should be specified
     )
     
+    # The counters below duplicate the aggregation of
+    # BookInstance.status over the book's instances,
+    # so the availability of a title is a single-row read.
+    # They are maintained by BookInstance.save, BookInstanceQuerySet.set_status
+    # and the post_delete handler; `manage.py rebuild_book_counters`
+    # rebuilds them from scratch.
+    
+    in_storage_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='в хранилище',
+    )
+    
+    on_hands_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='на руках',
+    )
+    
+    expired_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='просрочено',
+    )
+    
+    written_off_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='снято с учёта',
+    )
+    
+    @staticmethod
+    def shift_counters(book_id, old_status=None, new_status=None, number=1):
+        '''
+        moves `number` instances of the book from the old_status counter
+        to the new_status one; None means "no status", that is
+        the instance is being created or deleted; the counters don't go
+        below zero, drifted ones are fixed by `manage.py rebuild_book_counters`
+        '''
+        
+        if old_status == new_status or not number:
+            return
+        
+        changes = {}
+        if old_status is not None:
+            field = BookInstance.COUNTER_FIELDS[old_status]
+            changes[field] = Greatest(F(field) - number, 0)
+        if new_status is not None:
+            field = BookInstance.COUNTER_FIELDS[new_status]
+            changes[field] = F(field) + number
+        
+        Book.objects.filter(pk=book_id).update(**changes)
+    
+    objects = BookQuerySet.as_manager()
+    
+    def fill_grade_range(self):
+        '''
+        sets grade_from and grade_to from grade;
+        called by save, call it yourself before bulk_create
+        '''
+        
+        try:
+            self.grade_from, self.grade_to = validators.parse_grade(self.grade)
+        except ValidationError:
+            self.grade_from = self.grade_to = None
+    
+    def save(self, *args, **kwargs):
+        self.fill_grade_range()
+        super().save(*args, **kwargs)
+    
     def __str__(self):
         return self.name
         
@@ -88,13 +214,39 @@ class Book(models.Model):
         indexes = [
             models.Index(fields=["name"]),
             models.Index(fields=['inventory_number']),
-            models.Index(fields=["grade", "subject"])
+            models.Index(fields=["grade", "subject"]),
+            models.Index(fields=["grade_from", "grade_to"]),
         ]
         
         ordering = ['name']
         verbose_name = 'книга'
         verbose_name_plural = 'книги'
 
+class BookInstanceQuerySet(models.QuerySet):
+    def set_status(self, status):
+        '''
+        sets the status of all the instances in the queryset
+        with one UPDATE and shifts the books' counters accordingly;
+        returns the number of changed instances
+        '''
+        
+        with transaction.atomic():
+            changed = self.exclude(status=status)
+            groups = list(
+                changed.order_by()
+                .values_list('book_id', 'status')
+                .annotate(number=Count('id'))
+            )
+            if not groups:
+                return 0
+            
+            updated = changed.update(status=status)
+            for book_id, old_status, number in groups:
+                Book.shift_counters(book_id, old_status, status, number)
+        
+        return updated
+
+
 class BookInstance(models.Model):
     '''
     Описывает каждую книгу в библиотеке,
@@ -113,6 +265,16 @@ class BookInstance(models.Model):
         (WRITTEN_OFF, "снята с учёта")
     )
     
+    # status → the name of the Book's field counting such instances
+    COUNTER_FIELDS = {
+        IN_STORAGE: 'in_storage_count',
+        ON_HANDS: 'on_hands_count',
+        EXPIRED: 'expired_count',
+        WRITTEN_OFF: 'written_off_count',
+    }
+    
+    objects = BookInstanceQuerySet.as_manager()
+    
     status = models.PositiveSmallIntegerField(
         choices=STATUSES,
         editable=False,
@@ -129,6 +291,7 @@ class BookInstance(models.Model):
 каждого экземпляра; совпадает с номером штрихкода на наклейке'''
     )
     
+    # indexed together with status, see Meta
     book = models.ForeignKey(
         "Book",
         on_delete=models.CASCADE,
@@ -138,11 +301,86 @@ class BookInstance(models.Model):
 :Model:`booksRecord.Book`'''
     )
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember what the counters currently account for
+        instance._counted_as = (instance.book_id, instance.status)
+        return instance
+    
+    def save(self, *args, **kwargs):
+        counted_as = getattr(self, '_counted_as', (None, None))
+        
+        with transaction.atomic():
+            if not self._state.adding and not args \
+                    and kwargs.get('update_fields') is None:
+                stored = BookInstance.objects.select_for_update() \
+                    .filter(pk=self.pk).values_list('book_id', 'status') \
+                    .first()
+                if stored is not None:
+                    # the status is changed by change_status and set_status
+                    # only; the loaded one may be stale by now, and writing
+                    # it back would undo a concurrent checkout or return
+                    counted_as = stored
+                    self.status = stored[1]
+                    kwargs['update_fields'] = [
+                        field.name for field in self._meta.concrete_fields
+                        if not field.primary_key and field.name != 'status']
+            
+            super().save(*args, **kwargs)
+            
+            old_book_id, old_status = counted_as
+            if old_book_id == self.book_id:
+                Book.shift_counters(self.book_id, old_status, self.status)
+            else:
+                if old_book_id is not None:
+                    Book.shift_counters(old_book_id, old_status, None)
+                Book.shift_counters(self.book_id, None, self.status)
+        
+        self._counted_as = (self.book_id, self.status)
+    
+    def change_status(self, status, expected=None):
+        '''
+        changes only the status, with one UPDATE and no signals,
+        if the row still has the expected status
+        (the loaded one by default); returns False otherwise,
+        e.g. when someone else has just taken the same instance
+        '''
+        
+        if expected is None:
+            expected = getattr(self, '_counted_as', (None, self.status))[1]
+        if expected == status:
+            return True
+        
+        with transaction.atomic():
+            updated = BookInstance.objects \
+                .filter(pk=self.pk, status=expected) \
+                .update(status=status)
+            if not updated:
+                return False
+            Book.shift_counters(self.book_id, expected, status)
+        
+        self.status = status
+        self._counted_as = (self.book_id, status)
+        return True
+    
     def __str__(self):
         return str(self.book)
     
     class Meta:
         ordering = ["id"]
-        indexes = (models.Index(fields=('status',)),)
+        indexes = (
+            models.Index(fields=('status',)),
+            # the instances of a book (bookinstance_set)
+            # and of a book in some status
+            models.Index(fields=('book', 'status')),
+        )
         verbose_name = "экземпляр книги"
-        verbose_name_plural = "экземпляры книг"
\ No newline at end of file
+        verbose_name_plural = "экземпляры книг"
+
+
+@receiver(post_delete, sender=BookInstance)
+def _discount_deleted_instance(sender, instance, **kwargs):
+    book_id, status = getattr(
+        instance, '_counted_as', (instance.book_id, instance.status))
+    Book.shift_counters(book_id, status, None)
@@ -0,0 +1,254 @@
+'''
+Полнотекстовый поиск по каталогу книг.\n
+Текст книги (название, авторы, предмет) приводится к нижнему регистру,
+«ё» заменяется на «е», а к русским словам добавляются их основы,
+найденные стеммером Портера (Snowball), так что «алгебры» находит «Алгебра».\n
+Поиск выполняет бэкенд, выбираемый по СУБД: в SQLite это таблица FTS5,
+для прочих СУБД — медленный запасной вариант через icontains.
+Бэкенд для PostgreSQL (tsvector) должен реализовать тот же интерфейс
+SearchBackend. Индекс обновляется сигналами post_save и post_delete
+модели Book; после массовой загрузки вызовите index() или
+`manage.py rebuild_search_index`.
+'''
+
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Book
+
+
+# The Snowball stemmer for Russian,
+# see https://snowballstem.org/algorithms/russian/stemmer.html
+
+_RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+_PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE = re.compile(r'(с[яь])$')
+_ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому'
+    r'|их|ых|ую|юю|ая|яя|ою|ею)$')
+_PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло'
+    r'|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$')
+_NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием'
+    r'|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$')
+_I = re.compile(r'и$')
+_SOFT_SIGN = re.compile(r'ь$')
+_NN = re.compile(r'нн$')
+_DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+_DER = re.compile(r'ость?$')
+_SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+
+_WORD = re.compile(r'\w+')
+
+
+@lru_cache(maxsize=10000)
+def stem(word):
+    '''
+    returns the stem of a word, lowercased and with "ё" replaced by "е"
+    '''
+    
+    word = word.lower().replace('ё', 'е')
+    match = _RV.match(word)
+    if match is None:
+        return word
+    start, rv = match.groups()
+    
+    stemmed = _PERFECTIVE_GERUND.sub('', rv, 1)
+    if stemmed == rv:
+        rv = _REFLEXIVE.sub('', rv, 1)
+        stemmed = _ADJECTIVE.sub('', rv, 1)
+        if stemmed != rv:
+            rv = _PARTICIPLE.sub('', stemmed, 1)
+        else:
+            stemmed = _VERB.sub('', rv, 1)
+            rv = _NOUN.sub('', rv, 1) if stemmed == rv else stemmed
+    else:
+        rv = stemmed
+    
+    rv = _I.sub('', rv, 1)
+    if _DERIVATIONAL.match(rv):
+        rv = _DER.sub('', rv, 1)
+    
+    stemmed = _SOFT_SIGN.sub('', rv, 1)
+    if stemmed == rv:
+        rv = _NN.sub('н', _SUPERLATIVE.sub('', rv, 1), 1)
+    else:
+        rv = stemmed
+    
+    return start + rv
+
+
+def stems(text):
+    return [stem(word) for word in _WORD.findall(text or '')]
+
+
+def document(book):
+    '''
+    returns the searchable text of a book: its words
+    with their stems, since the stem of an inflected word may be longer
+    than the stem of the word itself (Макарычева → макарычев,
+    but Макарычев → макарыч)
+    '''
+    
+    text = ' '.join(filter(None, (book.name, book.authors, book.subject)))
+    words = []
+    for word in _WORD.findall(text):
+        folded = word.lower().replace('ё', 'е')
+        words.append(folded)
+        if stem(word) != folded:
+            words.append(stem(word))
+    return ' '.join(words)
+
+
+class SearchBackend(ABC):
+    '''
+    The interface of a search backend.
+    index, remove and rebuild do nothing by default,
+    for the backends which keep no index of their own.
+    '''
+    
+    def index(self, books):
+        '''
+        adds the books to the index or updates them
+        '''
+    
+    def remove(self, isbns):
+        '''
+        removes the books from the index
+        '''
+    
+    def rebuild(self):
+        '''
+        indexes the whole catalogue from scratch
+        '''
+    
+    @abstractmethod
+    def condition(self, query):
+        '''
+        returns a Q object selecting the books matching the query
+        '''
+    
+    def filter(self, queryset, query):
+        return queryset.filter(self.condition(query))
+    
+    @abstractmethod
+    def search(self, query, limit=10):
+        '''
+        returns the ISBNs of the books best matching the query
+        '''
+
+
+class LikeBackend(SearchBackend):
+    '''
+    The fallback backend scanning the table with icontains,
+    for databases without a full-text index.
+    '''
+    
+    def condition(self, query):
+        words = _WORD.findall(query)
+        if not words:
+            return Q(pk__in=[])
+        
+        condition = Q()
+        for word in words:
+            condition &= (Q(name__icontains=word) | Q(authors__icontains=word)
+                          | Q(subject__icontains=word))
+        return condition
+    
+    def search(self, query, limit=10):
+        return list(self.filter(Book.objects.all(), query)
+                    .values_list('isbn', flat=True)[:limit])
+
+
+class SqliteFtsBackend(SearchBackend):
+    '''
+    The backend using the FTS5 table created by the migrations;
+    its rowid is the ISBN of the book.
+    '''
+    
+    TABLE = 'booksRecord_book_fts'
+    
+    def index(self, books):
+        rows = [(book.isbn, document(book)) for book in books]
+        if not rows:
+            return
+        self.remove([isbn for isbn, _ in rows])
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.TABLE} (rowid, document) VALUES (%s, %s)',
+                rows)
+    
+    def remove(self, isbns):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.TABLE} WHERE rowid = %s',
+                [(isbn,) for isbn in isbns])
+    
+    def rebuild(self, chunk_size=1000):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.TABLE}')
+        
+        books = Book.objects.only('isbn', 'name', 'authors', 'subject')
+        chunk = []
+        for book in books.iterator(chunk_size=chunk_size):
+            chunk.append(book)
+            if len(chunk) >= chunk_size:
+                self.index(chunk)
+                chunk = []
+        self.index(chunk)
+    
+    @staticmethod
+    def match_expression(query):
+        # every word must match as a prefix, since a librarian
+        # types as few letters as possible
+        words = stems(query)
+        if not words:
+            return None
+        return ' '.join(f'"{word}"*' for word in words)
+    
+    def condition(self, query):
+        expression = self.match_expression(query)
+        if expression is None:
+            return Q(pk__in=[])
+        return Q(isbn__in=RawSQL(
+            f'SELECT rowid FROM {self.TABLE} WHERE {self.TABLE} MATCH %s',
+            (expression,)))
+    
+    def search(self, query, limit=10):
+        expression = self.match_expression(query)
+        if expression is None:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.TABLE} WHERE {self.TABLE} MATCH %s '
+                'ORDER BY rank LIMIT %s',
+                (expression, limit))
+            return [isbn for isbn, in cursor.fetchall()]
+
+
+def get_backend():
+    if connection.vendor == 'sqlite':
+        return SqliteFtsBackend()
+    return LikeBackend()
+
+
+@receiver(post_save, sender=Book)
+def _index_book(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_backend().index([instance])
+
+
+@receiver(post_delete, sender=Book)
+def _remove_book(sender, instance, **kwargs):
+    get_backend().remove([instance.isbn])
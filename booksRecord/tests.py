@@ -1,3 +1,461 @@
-from django.test import TestCase
+import os
+import tempfile
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import admin, catalogue, models, search, validators
+
+
+def make_book(n, **kwargs):
+    fields = dict(
+        isbn=9780000000000 + n,
+        name=f'Книга {n:04d}',
+        authors='Автор',
+        year_of_publication=2019,
+        publisher='Просвещение',
+        edition=1,
+        publication_city='Москва',
+        inventory_number=n,
+    )
+    fields.update(kwargs)
+    return models.Book.objects.create(**fields)
+
+
+class BookAdminChangelistTest(TestCase):
+    '''
+    The Book changelist must not issue a query per row.
+    '''
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        
+        statuses = [status for status, _ in models.BookInstance.STATUSES]
+        instance_id = 1
+        for n in range(1, 41):
+            book = make_book(n)
+            for status in statuses[:n % len(statuses) + 1]:
+                models.BookInstance.objects.create(
+                    id=instance_id, book=book, status=status)
+                instance_id += 1
+    
+    def setUp(self):
+        self.client.force_login(self.user)
+    
+    def changelist_queries(self, per_page):
+        url = reverse('admin:booksRecord_book_changelist')
+        old_per_page = admin.BookAdmin.list_per_page
+        admin.BookAdmin.list_per_page = per_page
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+        finally:
+            admin.BookAdmin.list_per_page = old_per_page
+        
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+    
+    def test_query_count_is_constant(self):
+        # the first request fills the caches
+        self.changelist_queries(5)
+        self.assertEqual(
+            self.changelist_queries(5),
+            self.changelist_queries(40),
+        )
+    
+    def test_counts_per_status(self):
+        book = admin.BookAdmin(models.Book, admin.admin.site) \
+            .get_queryset(None).get(inventory_number=3)
+        
+        self.assertEqual(book.instances_total, 4)
+        self.assertEqual(book.instances_in_storage, 1)
+        self.assertEqual(book.instances_on_hands, 1)
+        self.assertEqual(book.instances_expired, 1)
+        self.assertEqual(book.instances_written_off, 1)
+    
+    def test_sort_by_count(self):
+        url = reverse('admin:booksRecord_book_changelist')
+        response = self.client.get(url, {'o': '-4'})
+        self.assertEqual(response.status_code, 200)
+
+
+class BookCountersTest(TestCase):
+    '''
+    The denormalized counters of Book follow its instances' statuses.
+    '''
+    
+    def setUp(self):
+        self.book = make_book(1)
+        self.other_book = make_book(2)
+    
+    def assertCounters(self, book, in_storage=0, on_hands=0,
+                       expired=0, written_off=0):
+        book.refresh_from_db()
+        self.assertEqual(
+            (book.in_storage_count, book.on_hands_count,
+             book.expired_count, book.written_off_count),
+            (in_storage, on_hands, expired, written_off),
+        )
+    
+    def test_create_and_change_status(self):
+        instance = models.BookInstance.objects.create(id=1, book=self.book)
+        models.BookInstance.objects.create(id=2, book=self.book)
+        self.assertCounters(self.book, in_storage=2)
+        
+        stale = models.BookInstance.objects.get(id=1)
+        instance.change_status(models.BookInstance.ON_HANDS)
+        self.assertCounters(self.book, in_storage=1, on_hands=1)
+        
+        # save leaves the status to change_status and set_status
+        stale.save()
+        self.assertEqual(stale.status, models.BookInstance.ON_HANDS)
+        self.assertEqual(models.BookInstance.objects.get(id=1).status,
+                         models.BookInstance.ON_HANDS)
+        self.assertCounters(self.book, in_storage=1, on_hands=1)
+    
+    def test_drifted_counters_stay_non_negative(self):
+        instance = models.BookInstance.objects.create(id=1, book=self.book)
+        models.Book.objects.filter(pk=self.book.pk).update(in_storage_count=0)
+        
+        instance.change_status(models.BookInstance.ON_HANDS)
+        self.assertCounters(self.book, on_hands=1)
+    
+    def test_move_to_another_book(self):
+        instance = models.BookInstance.objects.create(id=1, book=self.book)
+        instance.book = self.other_book
+        instance.save()
+        self.assertCounters(self.book)
+        self.assertCounters(self.other_book, in_storage=1)
+    
+    def test_delete(self):
+        models.BookInstance.objects.create(id=1, book=self.book)
+        models.BookInstance.objects.create(
+            id=2, book=self.book, status=models.BookInstance.EXPIRED)
+        models.BookInstance.objects.filter(id=2).delete()
+        self.assertCounters(self.book, in_storage=1)
+    
+    def test_set_status(self):
+        for n in range(1, 4):
+            models.BookInstance.objects.create(id=n, book=self.book)
+        models.BookInstance.objects.create(id=4, book=self.other_book)
+        
+        changed = models.BookInstance.objects.filter(id__in=(1, 2, 4)) \
+            .set_status(models.BookInstance.WRITTEN_OFF)
+        self.assertEqual(changed, 3)
+        self.assertCounters(self.book, in_storage=1, written_off=2)
+        self.assertCounters(self.other_book, written_off=1)
+    
+    def test_rebuild_command(self):
+        models.BookInstance.objects.create(id=1, book=self.book)
+        models.Book.objects.filter(pk=self.book.pk).update(
+            in_storage_count=5, expired_count=2)
+        
+        with self.assertRaises(CommandError):
+            call_command('rebuild_book_counters', check=True, stdout=StringIO())
+        
+        call_command('rebuild_book_counters', stdout=StringIO())
+        self.assertCounters(self.book, in_storage=1)
+        call_command('rebuild_book_counters', check=True, stdout=StringIO())
+
+
+class EanValidatorsTest(TestCase):
+    def test_ean13(self):
+        validators.ean13_validator(9785090798457)
+        validators.ean13_validator(4600000000008)
+        with self.assertRaises(ValidationError):
+            validators.ean13_validator(9785090798451)
+        with self.assertRaises(ValidationError):
+            validators.ean13_validator(10 ** 13)
+        # an ISBN has all 13 digits
+        for value in (0, 1234565):
+            with self.assertRaises(ValidationError):
+                validators.ean13_validator(value)
+    
+    def test_ean8(self):
+        validators.ean8_validator(96385074)
+        # leading zeros are not kept by integers
+        validators.ean8_validator(00000000)
+        validators.ean8_validator(1234565)
+        with self.assertRaises(ValidationError):
+            validators.ean8_validator(96385075)
+        with self.assertRaises(ValidationError):
+            validators.ean8_validator(-96385074)
+    
+    def test_batch(self):
+        self.assertEqual(
+            validators.invalid_ean_indices(
+                [96385074, 96385075, 12345670, 10 ** 8, 1234565], 8),
+            [1, 3],
+        )
+        self.assertEqual(validators.invalid_ean_indices([], 13), [])
+        self.assertEqual(
+            validators.invalid_ean_indices([9785090798457, 0], 13), [1])
+
+
+class GradeTest(TestCase):
+    def test_parse_grade(self):
+        self.assertEqual(validators.parse_grade('5'), (5, 5))
+        self.assertEqual(validators.parse_grade('7-9'), (7, 9))
+        self.assertEqual(validators.parse_grade('10-11'), (10, 11))
+        for value in ('0', '12', '9-7', '5-', 'пять', '1-2-3', '7-9\n'):
+            with self.assertRaises(ValidationError):
+                validators.parse_grade(value)
+    
+    def test_full_clean_validates_grade(self):
+        book = models.Book(
+            isbn=9785090798457, name='Алгебра', authors='Макарычев',
+            year_of_publication=2019, publisher='Просвещение', edition=1,
+            publication_city='Москва', inventory_number=1, grade='13')
+        with self.assertRaises(ValidationError):
+            book.full_clean()
+        book.grade = '7'
+        book.full_clean()
+    
+    def test_for_grade(self):
+        make_book(1, grade='8')
+        make_book(2, grade='7-9')
+        make_book(3, grade='9')
+        make_book(4, grade='')
+        
+        self.assertEqual(
+            set(models.Book.objects.for_grade(8)
+                .values_list('inventory_number', flat=True)),
+            {1, 2},
+        )
+
+
+class ImportBooksTest(TestCase):
+    HEADER = ('isbn,name,authors,year_of_publication,publisher,edition,'
+              'publication_city,grade,subject,inventory_number,'
+              'instances_from,instances_to\n')
+    
+    def import_file(self, text, suffix='.csv', **options):
+        with tempfile.NamedTemporaryFile(
+                'w', suffix=suffix, encoding='utf-8', delete=False) as file:
+            file.write(text)
+        self.addCleanup(os.remove, file.name)
+        
+        out = StringIO()
+        errors = StringIO()
+        call_command('import_books', file.name, stdout=out,
+                     stderr=errors, **options)
+        self.errors = errors.getvalue()
+        return out.getvalue()
+    
+    def test_import_is_idempotent(self):
+        text = self.HEADER + (
+            '9785090798457,Алгебра,Макарычев,2019,Просвещение,1,Москва,'
+            '7,Математика,10,12345600,12345700\n'
+            '4600000000008,Физика,Перышкин,2018,Дрофа,2,Москва,'
+            '7-9,Физика,11,,\n'
+            '9785090798451,Ошибка,Автор,2018,Дрофа,1,Москва,,,12,,\n'
+        )
+        out = self.import_file(text)
+        self.assertIn('books inserted: 2, updated: 0, unchanged: 0, '
+                      'skipped: 1, conflicts: 0; instances created: 11', out)
+        
+        book = models.Book.objects.get(isbn=9785090798457)
+        self.assertEqual((book.grade_from, book.grade_to), (7, 7))
+        self.assertEqual(book.in_storage_count, 11)
+        self.assertEqual(book.bookinstance_set.count(), 11)
+        
+        out = self.import_file(text)
+        self.assertIn('books inserted: 0, updated: 0, unchanged: 2, '
+                      'skipped: 1, conflicts: 0; instances created: 0', out)
+    
+    def test_jsonl_and_dry_run(self):
+        make_book(10, isbn=9785090798457)
+        text = (
+            '{"isbn": 4600000000008, "name": "Физика", "authors": "Перышкин",'
+            ' "year_of_publication": 2018, "publisher": "Дрофа",'
+            ' "edition": 2, "publication_city": "Москва",'
+            ' "inventory_number": 10}\n'
+        )
+        out = self.import_file(text, suffix='.jsonl', dry_run=True)
+        self.assertIn('would be books inserted: 0', out)
+        self.assertIn('conflicts: 1', out)
+        self.assertFalse(models.Book.objects.filter(isbn=4600000000008).exists())
+        
+        out = self.import_file(text.replace('10}', '11}'), suffix='.jsonl',
+                               dry_run=True)
+        self.assertIn('would be books inserted: 1', out)
+        self.assertFalse(models.Book.objects.filter(isbn=4600000000008).exists())
+    
+    def test_bad_rows_are_reported_by_line(self):
+        text = self.HEADER + (
+            '4600000000008,Физика,Перышкин,2018,Дрофа,2,Москва,,,11,,\n'
+            '4600000000008,Физика,Перышкин,2018,Дрофа,2,Москва,,,12,,\n'
+            '9785090798457,Алгебра,Макарычев,2019,Просвещение,1,Москва,'
+            ',,10,12345700,12345600\n'
+            '9785090798457,Алгебра,Макарычев,2019,Просвещение,1,Москва,'
+            ',,10,10000000,99999999\n'
+        )
+        out = self.import_file(text)
+        self.assertIn('books inserted: 1, updated: 0, unchanged: 0, '
+                      'skipped: 3', out)
+        self.assertIn('line 3: ISBN 4600000000008 is already given on line 2',
+                      self.errors)
+        self.assertIn('line 4: bad instance labels', self.errors)
+        self.assertIn('line 5: the labels', self.errors)
+        self.assertFalse(models.BookInstance.objects.exists())
+        
+        out = self.import_file('[1, 2]\n{"isbn": \n', suffix='.jsonl')
+        self.assertIn('skipped: 2', out)
+        self.assertIn('line 1: bad row, not a JSON object', self.errors)
+        self.assertIn('line 2: bad row, not a JSON object', self.errors)
+    
+    def test_invalid_fields_are_reported_by_line(self):
+        text = self.HEADER + (
+            '4600000000008,Физика,Перышкин,2018,Дрофа,2,Москва,,,-1,,\n'
+            '9785090798457,,Макарычев,2019,Просвещение,1,Москва,,,10,,\n'
+            '9785090798457,Алгебра,Макарычев,2019,Просвещение,1,Москва,'
+            '13,,10,,\n'
+            '9785090798457,Алгебра,Макарычев,2019,Просвещение,1,Москва,'
+            '7,,10,,\n'
+        )
+        out = self.import_file(text)
+        self.assertIn('books inserted: 1, updated: 0, unchanged: 0, '
+                      'skipped: 3', out)
+        self.assertIn('line 2: bad row, ValueError(\'inventory_number -1 is not '
+                      'between 0 and 32767\')', self.errors)
+        self.assertIn('line 3: bad row, name:', self.errors)
+        self.assertIn('line 4: bad row, grade:', self.errors)
+        self.assertEqual(models.Book.objects.get().grade, '7')
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.algebra = make_book(
+            1, isbn=9785090798457, name='Алгебра. 7 класс',
+            authors='Макарычев Ю. Н.', subject='Математика', grade='7')
+        self.physics = make_book(
+            2, isbn=4600000000008, name='Физика. Задачник',
+            authors='Лукашик В. И.', subject='Физика', grade='7-9')
+        self.backend = search.get_backend()
+    
+    def test_stem(self):
+        self.assertEqual(search.stem('Алгебры'), search.stem('алгебра'))
+        self.assertEqual(search.stem('Ёлки'), search.stem('елка'))
+    
+    def test_search(self):
+        self.assertEqual(self.backend.search('алгебры'), [self.algebra.isbn])
+        self.assertEqual(self.backend.search('МАКАРЫЧЕВА'), [self.algebra.isbn])
+        self.assertEqual(self.backend.search('задач физ'), [self.physics.isbn])
+        self.assertEqual(self.backend.search('химия'), [])
+    
+    def test_index_follows_changes(self):
+        self.physics.name = 'Химия. Задачник'
+        self.physics.save()
+        self.assertEqual(self.backend.search('химия'), [self.physics.isbn])
+        
+        self.physics.delete()
+        self.assertEqual(self.backend.search('химия'), [])
+    
+    def test_admin_search(self):
+        self.client.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+        url = reverse('admin:booksRecord_book_changelist')
+        
+        response = self.client.get(url, {'q': 'физики'})
+        self.assertEqual(
+            [book.isbn for book in response.context['cl'].result_list],
+            [self.physics.isbn])
+        
+        response = self.client.get(url, {'q': '1'})
+        self.assertEqual(
+            [book.isbn for book in response.context['cl'].result_list],
+            [self.algebra.isbn])
+        
+        for query in ('7-9', 'задачник 7-9'):
+            response = self.client.get(url, {'q': query})
+            self.assertEqual(
+                [book.isbn for book in response.context['cl'].result_list],
+                [self.physics.isbn])
+        response = self.client.get(url, {'q': 'алгебра 7-9'})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+    
+    def test_benchmark_refuses_a_catalogue(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_search', sizes=[10], stdout=StringIO())
+        self.assertEqual(models.Book.objects.count(), 2)
+    
+    def test_backend_interface(self):
+        with self.assertRaises(TypeError):
+            search.SearchBackend()
+    
+    def test_autocomplete(self):
+        self.client.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+        response = self.client.get(
+            reverse('booksRecord:autocomplete'), {'q': 'алг'})
+        self.assertEqual(
+            [book['isbn'] for book in response.json()['results']],
+            [self.algebra.isbn])
+
+
+class CatalogueCacheTest(TransactionTestCase):
+    # the transactions are real: the cache is bypassed
+    # by the transaction which has changed the catalogue
+    
+    def setUp(self):
+        caches['catalogue'].clear()
+        catalogue.reset_metrics()
+        self.book = make_book(1, name='Алгебра. 7 класс')
+        models.BookInstance.objects.create(id=10000007, book=self.book)
+    
+    def tearDown(self):
+        # the index is not a model table, so it is not flushed
+        search.get_backend().rebuild()
+    
+    def test_count_is_cached_until_change(self):
+        books = models.Book.objects.cache_counts().filter(authors='Автор')
+        self.assertEqual(books.count(), 1)
+        with self.assertNumQueries(1):
+            # the versions of the tables only
+            self.assertEqual(books.order_by('name').count(), 1)
+        
+        make_book(2)
+        self.assertEqual(books.count(), 2)
+        self.assertEqual(catalogue.metrics(), {
+            'count': {'hits': 1, 'misses': 2, 'hit_ratio': 0.333}})
+    
+    def test_rolled_back_changes_are_not_cached(self):
+        books = models.Book.objects.cache_counts()
+        self.assertEqual(books.count(), 1)
+        
+        with self.assertRaises(ZeroDivisionError), transaction.atomic():
+            make_book(2)
+            self.assertEqual(books.count(), 2)
+            1 / 0
+        
+        self.assertEqual(books.count(), 1)
+        make_book(3)
+        self.assertEqual(books.count(), 2)
+        self.assertEqual(catalogue.metrics()['count']['hits'], 1)
+    
+    def test_autocomplete_follows_bulk_changes(self):
+        self.client.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+        in_storage = lambda: self.client.get(
+            reverse('booksRecord:autocomplete'), {'q': 'алг'}
+        ).json()['results'][0]['in_storage']
+        
+        self.assertEqual(in_storage(), 1)
+        with self.assertNumQueries(3):
+            # the session, the user and the versions of the tables
+            self.assertEqual(in_storage(), 1)
+        
+        # the update bypasses the signals, the command fixes the counters
+        models.BookInstance.objects.update(status=models.BookInstance.ON_HANDS)
+        call_command('rebuild_book_counters', stdout=StringIO())
+        self.assertEqual(in_storage(), 0)
@@ -1,45 +1,121 @@
+from functools import lru_cache
 from re import compile
 
 from django.core.exceptions import ValidationError
-import barcodenumber
 
-import django.core.validators as dv
+
+# The EAN checksum weighs the digits, counting from the right
+# (the check digit included), as 1, 3, 1, 3, ...
+# and the code is valid if the weighted sum is divisible by 10.
+# So each group of four digits "abcd" from the right adds
+# 3*a + b + 3*c + d to the sum, and the sum of a code can be computed
+# by 10000-based divmod with the table below,
+# without converting the code to a string.
+
+_GROUP_WEIGHTS = tuple(
+    3 * (group // 1000) + group // 100 % 10
+    + 3 * (group // 10 % 10) + group % 10
+    for group in range(10000)
+)
+
+
+# The smallest valid code of each length. The EAN-13 codes here are
+# ISBNs, which always have all 13 digits (978..., 979...), as
+# barcodenumber required before. The EAN-8 labels of the instances may
+# start with zeros, which integers don't keep, so any shorter number
+# is a zero-padded label.
+_SMALLEST = {13: 10 ** 12, 8: 0}
+
+
+def _weighted_sum(value):
+    total = 0
+    while value:
+        value, group = divmod(value, 10000)
+        total += _GROUP_WEIGHTS[group]
+    return total
+
+
+def is_valid_ean(value, length):
+    '''
+    checks the checksum of an EAN code of the given length (8 or 13)
+    given as an integer, see _SMALLEST for the shorter numbers
+    '''
+    
+    return (_SMALLEST[length] <= value < 10 ** length
+            and _weighted_sum(value) % 10 == 0)
+
+
+def invalid_ean_indices(values, length):
+    '''
+    checks a whole sequence of EAN codes at once;
+    returns the indices of the invalid ones
+    '''
+    
+    smallest = _SMALLEST[length]
+    limit = 10 ** length
+    return [
+        index for index, value in enumerate(values)
+        if not smallest <= value < limit or _weighted_sum(value) % 10
+    ]
+
+
+def ean8_range(first, last):
+    '''
+    yields the valid EAN-8 codes from first to last inclusive,
+    that is the consecutive labels of a sticker roll
+    '''
+    
+    for payload in range(max(first, 0) // 10, min(last, 10 ** 8 - 1) // 10 + 1):
+        # the check digit makes the weighted sum divisible by 10
+        code = payload * 10
+        code += -_weighted_sum(code) % 10
+        if first <= code <= last:
+            yield code
+
 
 def ean13_validator(value):
-    if not barcodenumber.check_code(
-        'ean13',
-        str(value)
-    ):
+    if not is_valid_ean(value, 13):
         raise ValidationError(
             'контрольная сумма штрихкода "%(value)s" неверна, проверьте введённые данные',
             params={'value':value}
         )
 
 def ean8_validator(value):
-    if not barcodenumber.check_code(
-        'ean8',
-        str(value)
-    ):
+    if not is_valid_ean(value, 8):
         raise ValidationError(
             'контрольная сумма штрихкода "%(value)s" неверна, проверьте введённые данные',
             params={'value':value}
         )
 
         
-_grade_regex = compile(r"(?:^1[01]|^\d)(?:(?:-)1[01]$|\d$)?")
+# matched with fullmatch: "$" would accept a trailing newline
+_grade_regex = compile(r"(1[01]|[1-9])(?:-(1[01]|[1-9]))?")
+
 
-# the regular expression above may be too difficult,
-# in the case of much overhead replace it with the following string
-# (just copy-paste it into quotation marks):
-# ^[01]?\d(?:-[01]?\d)?$
+@lru_cache(maxsize=None)
+def parse_grade(value):
+    '''
+    turns a number of grade ("5") or a range of grades ("7-9")
+    into a (lowest, highest) pair of grade numbers
+    '''
+    
+    match = _grade_regex.fullmatch(value)
+    if match:
+        lowest = int(match.group(1))
+        highest = int(match.group(2) or lowest)
+        if lowest <= highest:
+            return lowest, highest
+    
+    raise ValidationError(
+        '''Введите номер класса или диапазон номеров, \
+например: "5", "4-5", и т. п.''',
+        params={'value': value}
+    )
 
 
 def grade_validator(value):
     # check if the given value matches
     # a number of grade (1, 2, 3, etc.) or an range
     # of grades (1-11, 4-5, etc.)
-    return dv.RegexValidator(
-        regex=_grade_regex,
-        message='''Введите номер класса или диапазон номеров, \
-например: "5", "4-5", и т. п.'''
-    )
\ No newline at end of file
+    if value:
+        parse_grade(value)
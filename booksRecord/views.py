@@ -1,3 +1,46 @@
-from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
 
-# Create your views here.
+from . import catalogue, search
+from .models import Book
+
+
+@staff_member_required
+@require_GET
+def autocomplete(request):
+    '''
+    Подсказки при поиске книги: ?q=<начало запроса>&limit=<число>.\n
+    Отвечает списком лучших совпадений из полнотекстового индекса;
+    ответы на одинаковые запросы берутся из кэша каталога.
+    '''
+    
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    
+    if not query:
+        return JsonResponse({'results': []})
+    
+    return JsonResponse({'results': catalogue.cached(
+        'autocomplete', (query, limit), lambda: _suggestions(query, limit))})
+
+
+def _suggestions(query, limit):
+    isbns = search.get_backend().search(query, limit)
+    books = Book.objects.only(
+        'isbn', 'name', 'authors', 'grade', 'in_storage_count'
+    ).in_bulk(isbns)
+    
+    return [
+        {
+            'isbn': book.isbn,
+            'name': book.name,
+            'authors': book.authors,
+            'grade': book.grade,
+            'in_storage': book.in_storage_count,
+        }
+        for book in (books[isbn] for isbn in isbns if isbn in books)
+    ]
@@ -1,3 +1,5 @@
+from types import MappingProxyType
+
 from . import models
 
 GRADES = (('1 классы',
@@ -99,4 +101,46 @@ LANGUAGES = (
     ('fr', 'Французкий'),
     ('zh', 'Китайский'),
     ('it', 'Итальянский'),
-)
\ No newline at end of file
+)
+
+# Lookup tables computed once from GRADES and LANGUAGES,
+# so that rendering and parsing a grade or a language
+# doesn't walk the nested choices for every row.
+# The codes of one year go in a row: 1 «А» … 1 «Ж» are 1 … 7,
+# so a whole year is a range of codes, see YEAR_RANGES.
+
+# 58 → "9 «Б»"
+GRADE_LABELS = MappingProxyType({
+    code: label for _, grades in GRADES for code, label in grades
+})
+
+# "9 «Б»" → 58
+GRADE_CODES = MappingProxyType({
+    label: code for code, label in GRADE_LABELS.items()
+})
+
+# 58 → (9, "Б")
+GRADE_PARTS = MappingProxyType({
+    code: (int(label.split()[0]), label.split()[1].strip('«»'))
+    for code, label in GRADE_LABELS.items()
+})
+
+# 9 → (57, 58, …, 63)
+YEAR_GRADES = MappingProxyType({
+    year: tuple(code for code, (grade_year, _) in GRADE_PARTS.items()
+                if grade_year == year)
+    for year in sorted({year for year, _ in GRADE_PARTS.values()})
+})
+
+# 9 → (57, 63), the lowest and the highest code of a year
+YEAR_RANGES = MappingProxyType({
+    year: (codes[0], codes[-1]) for year, codes in YEAR_GRADES.items()
+})
+
+# "en" → "Английский"
+LANGUAGE_LABELS = MappingProxyType(dict(LANGUAGES))
+
+# "Английский" → "en"
+LANGUAGE_CODES = MappingProxyType({
+    label: code for code, label in LANGUAGES
+})
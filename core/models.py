@@ -1,4 +1,43 @@
 from django.db import models
+from django.db.models import Q
+
+
+def fold_name(value):
+    '''
+    приводит имя к виду для поиска: нижний регистр, «ё» → «е»
+    '''
+    
+    return value.strip().lower().replace('ё', 'е')
+
+
+def _prefix_range(lookup, prefix):
+    # "field >= 'пуш' AND field < 'пуш' with the last letter incremented"
+    # is served by a B-tree index, unlike LIKE 'пуш%' on SQLite
+    # which is also case-insensitive for ASCII only
+    return Q(**{
+        f'{lookup}__gte': prefix,
+        f'{lookup}__lt': prefix[:-1] + chr(ord(prefix[-1]) + 1),
+    })
+
+
+class HumanQuerySet(models.QuerySet):
+    def name_startswith(self, query):
+        '''
+        ищет людей по началу фамилии и имени:
+        «пуш» найдёт Пушкина, «пушкин ал» — Пушкина Александра,
+        а одно слово ищется и среди имён
+        '''
+        
+        words = fold_name(query).split()
+        if not words:
+            return self.none()
+        if len(words) == 1:
+            return self.filter(
+                _prefix_range('second_name_search', words[0])
+                | _prefix_range('first_name_search', words[0]))
+        return self.filter(
+            _prefix_range('second_name_search', words[0])
+            & _prefix_range('first_name_search', words[1]))
 
 
 class Human (models.Model):
@@ -28,6 +67,37 @@ class Human (models.Model):
         help_text='Отчество кириллицей, необязательно'
     )
     
+    # The names folded by fold_name for the indexed prefix search,
+    # see HumanQuerySet.name_startswith; filled in by save.
+    
+    second_name_search = models.CharField(
+        max_length=25,
+        editable=False,
+        blank=True,
+    )
+    
+    first_name_search = models.CharField(
+        max_length=25,
+        editable=False,
+        blank=True,
+    )
+    
+    objects = HumanQuerySet.as_manager()
+    
+    def fill_search_fields(self):
+        '''
+        Заполняет поля для поиска по имени;
+        вызывается в save, перед bulk_create и bulk_update
+        вызовите его сами.
+        '''
+        
+        self.second_name_search = fold_name(self.second_name)
+        self.first_name_search = fold_name(self.first_name)
+    
+    def save(self, *args, **kwargs):
+        self.fill_search_fields()
+        super().save(*args, **kwargs)
+    
     @property
     def full_name(self):
         '''
@@ -76,7 +146,12 @@ class Human (models.Model):
                 "second_name",
                 "first_name",
                 "middle_name",
-            ])
+            ]),
+            models.Index(fields=[
+                "second_name_search",
+                "first_name_search",
+            ]),
+            models.Index(fields=["first_name_search"]),
         ]
         abstract = True
         ordering = [
@@ -1,10 +1,70 @@
 from django.contrib import admin
+from django.urls import reverse
+from django.utils.html import format_html
 
+import core
 from .models import Student
 import booksOperations.admin
+from booksOperations import loans
+
+
+class GradeYearFilter(admin.SimpleListFilter):
+    '''
+    filters the students by the year of their grade,
+    see StudentQuerySet.in_years
+    '''
+    
+    title = 'параллель'
+    parameter_name = 'year'
+    
+    def lookups(self, request, model_admin):
+        return [(year, f'{year} классы') for year in core.YEAR_GRADES]
+    
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value and value.isdigit() and int(value) in core.YEAR_RANGES:
+            return queryset.in_years(int(value))
+        return queryset
+
 
 @admin.register(Student)
-class StudentAdmin(admin.ModelAdmin):
-    list_display = ("__str__", "grade")
+class StudentAdmin(booksOperations.admin.TakingConflictsMixin,
+                   admin.ModelAdmin):
+    
+    def grade_label(self):
+        return self.grade_label
+    grade_label.short_description = 'класс'
+    grade_label.admin_order_field = 'grade'
+    
+    def loans_summary(self):
+        '''
+        returns the cached numbers of the student's takings
+        and a link to all of them
+        '''
+        
+        if self.pk is None:
+            return '—'
+        numbers = loans.summary(self.pk)
+        url = reverse('admin:booksOperations_booktaking_changelist')
+        return format_html(
+            'на руках: {}, из них просрочено: {}; '
+            '<a href="{}?student__id__exact={}">всего взято: {}</a>',
+            numbers['active'], numbers['overdue'],
+            url, self.pk, numbers['total'],
+        )
+    loans_summary.short_description = 'Книги'
+    
+    list_display = ("__str__", grade_label)
+    list_filter = (GradeYearFilter,)
+    # looked up by the indexed prefix search, see get_search_results
     search_fields = ("second_name", 'first_name')
-    inlines = (booksOperations.admin.BookTakingInline,)
+    readonly_fields = (loans_summary,)
+    inlines = (booksOperations.admin.ActiveBookTakingInline,)
+    
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if search_term.isdigit():
+            return queryset.filter(id=int(search_term)), False
+        if search_term:
+            queryset = queryset.name_startswith(search_term)
+        return queryset, False
@@ -0,0 +1,149 @@
+import csv
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+import core
+from booksOperations.models import GradeSummary, TableVersion
+from readersRecord.models import Student
+
+
+def _normalize_class_name(name):
+    # "9 «Б»", "9Б", "9-б", '9 "Б"' → "9б"
+    return re.sub(r'[\s«»"\'\-]', '', name).lower()
+
+
+# the normalized class name → the code, see core.GRADE_CODES
+_CODES_BY_NAME = {
+    _normalize_class_name(label): code
+    for label, code in core.GRADE_CODES.items()
+}
+
+
+class Command(BaseCommand):
+    help = '''Loads students from the CSV file made by \
+the "Экспорт в Moodle" button, adding new and updating known ones'''
+    
+    # the Student field → the default CSV column
+    COLUMNS = {
+        'id': 'idnumber',
+        'second_name': 'lastname',
+        'first_name': 'firstname',
+        'middle_name': 'middlename',
+        'grade': 'department',
+    }
+    
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='the CSV file to load')
+        parser.add_argument('--encoding', default='utf-8-sig')
+        parser.add_argument('--delimiter', default=',')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='how many rows are written by one transaction',
+        )
+        for field, column in self.COLUMNS.items():
+            parser.add_argument(
+                f'--{field.replace("_", "-")}-column',
+                dest=f'{field}_column',
+                default=column,
+                help=f'the column holding Student.{field} (default: {column})',
+            )
+    
+    def handle(self, *args, file, encoding, delimiter, chunk_size, **options):
+        self.columns = {field: options[f'{field}_column']
+                        for field in self.COLUMNS}
+        self.counts = {'inserted': 0, 'updated': 0,
+                       'unchanged': 0, 'skipped': 0}
+        
+        try:
+            with open(file, encoding=encoding, newline='') as csv_file:
+                reader = csv.DictReader(csv_file, delimiter=delimiter)
+                missing = [column for field, column in self.columns.items()
+                           if field != 'middle_name'
+                           and column not in (reader.fieldnames or ())]
+                if missing:
+                    raise CommandError(
+                        f'the file has no column(s): {", ".join(missing)}')
+                
+                chunk = {}
+                for row in reader:
+                    student = self.parse_row(reader.line_num, row)
+                    if student is not None:
+                        # a later row for the same student wins
+                        chunk[student.id] = student
+                    if len(chunk) >= chunk_size:
+                        self.save_chunk(chunk)
+                        chunk = {}
+                if chunk:
+                    self.save_chunk(chunk)
+        except OSError as error:
+            raise CommandError(error)
+        
+        self.stdout.write(self.style.SUCCESS(
+            'inserted: {inserted}, updated: {updated}, '
+            'unchanged: {unchanged}, skipped: {skipped}'.format(**self.counts)
+        ))
+    
+    def parse_row(self, line, row):
+        value = lambda field: (row.get(self.columns[field]) or '').strip()
+        
+        grade = _CODES_BY_NAME.get(_normalize_class_name(value('grade')))
+        try:
+            student_id = int(value('id'))
+        except ValueError:
+            student_id = None
+        
+        if grade is None or student_id is None or student_id < 0 \
+                or not value('second_name') or not value('first_name'):
+            self.stderr.write(f'line {line}: skipped, bad row {dict(row)}')
+            self.counts['skipped'] += 1
+            return None
+        
+        return Student(
+            id=student_id,
+            second_name=value('second_name'),
+            first_name=value('first_name'),
+            middle_name=value('middle_name'),
+            grade=grade,
+        )
+    
+    def save_chunk(self, chunk):
+        fields = ['second_name', 'first_name', 'middle_name', 'grade']
+        search_fields = ['second_name_search', 'first_name_search']
+        
+        with transaction.atomic():
+            known = Student.objects.only(*fields, *search_fields) \
+                .in_bulk(list(chunk))
+            
+            to_create = []
+            to_update = []
+            moved = {}
+            for student_id, student in chunk.items():
+                # the bulk operations bypass Student.save
+                student.fill_search_fields()
+                old = known.get(student_id)
+                if old is None:
+                    to_create.append(student)
+                elif any(getattr(old, field) != getattr(student, field)
+                         for field in fields):
+                    if old.grade != student.grade:
+                        moved[student_id] = student.grade
+                    for field in fields + search_fields:
+                        setattr(old, field, getattr(student, field))
+                    to_update.append(old)
+                else:
+                    self.counts['unchanged'] += 1
+            
+            # bulk_update bypasses the signal moving
+            # the student's books between the grades
+            GradeSummary.move_students(moved)
+            Student.objects.bulk_create(to_create)
+            Student.objects.bulk_update(to_update, fields + search_fields)
+            if to_create or to_update:
+                TableVersion.bump(Student)
+        
+        self.counts['inserted'] += len(to_create)
+        self.counts['updated'] += len(to_update)
@@ -0,0 +1,49 @@
+# Generated by Django 2.2.1 on 2026-10-18 12:38
+
+from django.db import migrations, models
+
+
+# A frozen copy of core.models.fold_name as of this migration.
+
+def fold_name(value):
+    return value.strip().lower().replace('ё', 'е')
+
+
+def fill_search_fields(apps, schema_editor):
+    Student = apps.get_model('readersRecord', 'Student')
+    
+    students = list(Student.objects.only('second_name', 'first_name'))
+    for student in students:
+        student.second_name_search = fold_name(student.second_name)
+        student.first_name_search = fold_name(student.first_name)
+    Student.objects.bulk_update(
+        students, ['second_name_search', 'first_name_search'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readersRecord', '0004_auto_20190710_1523'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='first_name_search',
+            field=models.CharField(blank=True, editable=False, max_length=25),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='second_name_search',
+            field=models.CharField(blank=True, editable=False, max_length=25),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['second_name_search', 'first_name_search'], name='readersReco_second__d107ba_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['first_name_search'], name='readersReco_first_n_7fd603_idx'),
+        ),
+        migrations.RunPython(fill_search_fields, migrations.RunPython.noop),
+    ]
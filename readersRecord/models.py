@@ -2,6 +2,21 @@ from django.db import models
 
 import core
 
+
+class StudentQuerySet(core.models.HumanQuerySet):
+    def in_years(self, *years):
+        '''
+        ученики заданных параллелей, например in_years(9) — все 9 классы;
+        параллель — это диапазон кодов классов (см. core.YEAR_RANGES),
+        поэтому поиск идёт по индексу grade
+        '''
+        
+        condition = models.Q()
+        for year in years:
+            condition |= models.Q(grade__range=core.YEAR_RANGES[year])
+        return self.filter(condition) if years else self.none()
+
+
 class Student(core.models.Human):
     '''
     Модель описывает ученика.
@@ -24,6 +39,7 @@ class Student(core.models.Human):
     
     grade = models.PositiveSmallIntegerField(
         choices=core.GRADES,
+        db_index=True,
         verbose_name="класс",
         help_text="номер и литера класса"
     )
@@ -42,6 +58,13 @@ class Student(core.models.Human):
         blank=True,
     )
     
+    objects = StudentQuerySet.as_manager()
+    
+    @property
+    def grade_label(self):
+        # the same as get_grade_display, but without walking core.GRADES
+        return core.GRADE_LABELS.get(self.grade, self.grade)
+    
     class Meta(core.models.Human.Meta):
         ordering = ['id']
         
@@ -1,3 +1,131 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+
+import core
+from .models import Student
+
+
+class _StudentsCsv:
+    def import_csv(self, text, **options):
+        with tempfile.NamedTemporaryFile(
+                'w', suffix='.csv', encoding='utf-8', delete=False) as file:
+            file.write(text)
+        self.addCleanup(os.remove, file.name)
+        
+        out = StringIO()
+        call_command('import_students', file.name, stdout=out,
+                     stderr=StringIO(), **options)
+        return out.getvalue()
+
+
+class ImportStudentsTest(_StudentsCsv, TestCase):
+    def test_insert_update_unchanged(self):
+        out = self.import_csv(
+            'idnumber,lastname,firstname,middlename,department\n'
+            '1,Пушкин,Александр,Сергеевич,9 «Б»\n'
+            '2,Лермонтов,Михаил,Юрьевич,9Б\n'
+            '3,Гоголь,Николай,,11-ж\n'
+            '4,Никто,Никто,,12 «Я»\n'
+        )
+        self.assertIn('inserted: 3, updated: 0, unchanged: 0, skipped: 1', out)
+        self.assertEqual(Student.objects.get(id=3).grade, 77)
+        
+        out = self.import_csv(
+            'idnumber,lastname,firstname,middlename,department\n'
+            '1,Пушкин,Александр,Сергеевич,10 «Б»\n'
+            '2,Лермонтов,Михаил,Юрьевич,9 «Б»\n',
+            chunk_size=1,
+        )
+        self.assertIn('inserted: 0, updated: 1, unchanged: 1, skipped: 0', out)
+        self.assertEqual(Student.objects.get(id=1).grade, 65)
+    
+    def test_custom_columns(self):
+        out = self.import_csv(
+            'id;surname;name;class\n'
+            '5;Толстой;Лев;1А\n',
+            delimiter=';', id_column='id', second_name_column='surname',
+            first_name_column='name', grade_column='class',
+        )
+        self.assertIn('inserted: 1', out)
+        self.assertEqual(Student.objects.get(id=5).grade, 1)
+
+
+class NameSearchTest(_StudentsCsv, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.pushkin = Student.objects.create(
+            id=1, second_name='Пушкин', first_name='Александр', grade=57)
+        cls.pushkina = Student.objects.create(
+            id=2, second_name='Пушкина', first_name='Наталья', grade=58)
+        cls.fyodorov = Student.objects.create(
+            id=3, second_name='Фёдоров', first_name='Пётр', grade=1)
+    
+    def found(self, query):
+        return set(Student.objects.name_startswith(query)
+                   .values_list('id', flat=True))
+    
+    def test_name_startswith(self):
+        self.assertEqual(self.found('пуш'), {1, 2})
+        self.assertEqual(self.found('ПУШКИН ал'), {1})
+        self.assertEqual(self.found('федор'), {3})
+        self.assertEqual(self.found('петр'), {3})
+        self.assertEqual(self.found('  '), set())
+    
+    def test_autocomplete(self):
+        self.client.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+        response = self.client.get(
+            reverse('readersRecord:autocomplete'), {'q': 'пуш'})
+        self.assertEqual(
+            [student['name'] for student in response.json()['results']],
+            ['Пушкин Александр', 'Пушкина Наталья'])
+    
+    def test_import_fills_search_fields(self):
+        self.import_csv(
+            'idnumber,lastname,firstname,department\n'
+            '4,Ёжиков,Иван,1А\n'
+        )
+        self.assertEqual(self.found('еж'), {4})
+
 
-# Create your tests here.
+class GradeLookupTest(TestCase):
+    def test_tables(self):
+        flat = [choice for _, grades in core.GRADES for choice in grades]
+        self.assertEqual(list(core.GRADE_LABELS.items()), flat)
+        self.assertEqual(core.GRADE_CODES['9 «Б»'], 58)
+        self.assertEqual(core.GRADE_PARTS[58], (9, 'Б'))
+        self.assertEqual(core.YEAR_GRADES[1], (1, 2, 3, 4, 5, 6, 7))
+        self.assertEqual(core.YEAR_RANGES[11], (71, 77))
+        self.assertEqual(core.LANGUAGE_CODES['Немецкий'], 'de')
+        with self.assertRaises(TypeError):
+            core.GRADE_LABELS[78] = '12 «А»'
+        
+        for code, label in flat:
+            year, letter = core.GRADE_PARTS[code]
+            self.assertEqual(label, f'{year} «{letter}»')
+            low, high = core.YEAR_RANGES[year]
+            self.assertTrue(low <= code <= high)
+    
+    def test_in_years(self):
+        for n, grade in enumerate((56, 57, 63, 64), 1):
+            Student.objects.create(
+                id=n, second_name='Ученик', first_name='Иван', grade=grade)
+        
+        self.assertEqual(
+            set(Student.objects.in_years(9).values_list('grade', flat=True)),
+            {57, 63})
+        self.assertEqual(Student.objects.in_years(8, 10).count(), 2)
+        self.assertEqual(Student.objects.get(id=2).grade_label, '9 «А»')
+        
+        self.client.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+        response = self.client.get(
+            reverse('admin:readersRecord_student_changelist'), {'year': 9})
+        self.assertEqual(response.context['cl'].result_count, 2)
+        self.assertContains(response, '9 «Ж»')
@@ -1,3 +1,35 @@
-from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
 
-# Create your views here.
+from .models import Student
+
+
+@staff_member_required
+@require_GET
+def autocomplete(request):
+    '''
+    Подсказки при поиске ученика: ?q=<начало фамилии [и имени]>.\n
+    Ищет по индексу нормализованных имён, см. HumanQuerySet.name_startswith.
+    '''
+    
+    query = request.GET.get('q', '')
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    
+    students = Student.objects \
+        .name_startswith(query) \
+        .order_by('second_name_search', 'first_name_search') \
+        .only('id', 'second_name', 'first_name', 'middle_name', 'grade') \
+        [:limit]
+    
+    return JsonResponse({'results': [
+        {
+            'id': student.id,
+            'name': student.full_name.strip(),
+            'grade': student.grade_label,
+        }
+        for student in students
+    ]})